@@ -19,8 +19,12 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import hashlib
 import itertools
+import json
+import numpy
 import os
+import tempfile
 from collections import Counter
 
 from cortipy.cortical_client import CorticalClient
@@ -70,6 +74,9 @@ class CioEncoder(LanguageEncoder):
     self.verbosity = verbosity
     self.fingerprintType = fingerprintType
     self.description = ("Cio Encoder", 0)
+    # Results of getContext() and extractKeywords() are cached on disk here,
+    # next to the client's cache, so they're shared by encoders and runs.
+    self.cacheDir = cacheDir
 
 
   def encode(self, text):
@@ -232,6 +239,71 @@ class CioEncoder(LanguageEncoder):
     return self.client.compare(bitmap1, bitmap2)
 
 
+  def getContext(self, bitmap, maxResults=5):
+    """
+    Get the contexts of a bitmap, with their fingerprints, via the Cio
+    context endpoint. Results are cached in cacheDir by a hash of the bitmap's
+    positions, so each distinct bitmap is only sent once.
+
+    @param bitmap     (numpy.array)   Indices of the ON bits.
+    @param maxResults (int)           Maximum number of contexts.
+    @return           (list)          Context dicts; the bitmap of each is at
+                                      context["fingerprint"]["positions"].
+    """
+    positions = numpy.unique(bitmap).astype(numpy.int64)
+    key = "{0}-{1}".format(hashlib.sha1(positions.tostring()).hexdigest(),
+                           maxResults)
+    return self._cachedQuery("context", key,
+      lambda: self.client.getContextFromText(
+        [positions.tolist()], maxResults=maxResults, getFingerprint=True))
+
+
+  def extractKeywords(self, text):
+    """
+    Get the keywords of the text via the Cio keywords endpoint. Results are
+    cached in cacheDir by a hash of the text, so each distinct text is only
+    sent once.
+
+    @param text       (str)           A non-tokenized sample of text.
+    @return           (list)          Keyword strings.
+    """
+    key = hashlib.sha1(text.encode("utf-8") if isinstance(text, unicode)
+                       else text).hexdigest()
+    return self._cachedQuery("keywords", key,
+                             lambda: self.client.extractKeywords(text))
+
+
+  def _cachedQuery(self, endpoint, key, query):
+    """
+    Return the cached JSON result of a query, or run the query and cache its
+    result. The file is written to a temporary name and then renamed, so
+    concurrent queries never read a partial result.
+
+    @param endpoint   (str)           Name of the endpoint, a file name prefix.
+    @param key        (str)           Hash of the query's input.
+    @param query      (callable)      Queries the API, returning JSON data.
+    @return                           Result of the query.
+    """
+    path = os.path.join(self.cacheDir, "{0}-{1}.json".format(endpoint, key))
+    if os.path.exists(path):
+      with open(path) as f:
+        return json.load(f)
+
+    result = query()
+    if not os.path.isdir(self.cacheDir):
+      try:
+        os.makedirs(self.cacheDir)
+      except OSError:
+        # Another thread made it.
+        pass
+    fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir)
+    with os.fdopen(fd, "w") as f:
+      json.dump(result, f)
+    os.rename(tmpPath, path)
+
+    return result
+
+
   def createCategory(self, label, positives, negatives=None):
     """
     Create a classification category (bitmap) via the Cio claassify endpoint.
@@ -172,6 +172,39 @@ class LanguageEncoder(object):
     return distances
 
 
+  def compareOverlaps(self, overlaps, sizeLeft, sizeRight, metric):
+    """
+    Compute one of the measures of compare() from the overlaps and sizes of
+    bitmaps with unique ON bits, elementwise, e.g. for all pairs of two sets of
+    bitmaps at once.
+
+    @param overlaps   (numpy.array)   Number of shared ON bits.
+    @param sizeLeft   (numpy.array)   Number of ON bits of the left bitmaps.
+    @param sizeRight  (numpy.array)   Number of ON bits of the right bitmaps.
+    @param metric     (str)           Key of the measure in compare()'s dict.
+    @return           (numpy.array)   Values of the measure.
+    """
+    overlaps = numpy.asarray(overlaps, dtype=float)
+    sizeLeft = numpy.asarray(sizeLeft, dtype=float)
+    sizeRight = numpy.asarray(sizeRight, dtype=float)
+    if not (sizeLeft.all() and sizeRight.all()):
+      raise ValueError("Bitmaps must have ON bits to compare.")
+
+    if metric == "overlappingAll":
+      return overlaps
+    elif metric == "overlappingLeftRight":
+      return overlaps / sizeLeft
+    elif metric == "overlappingRightLeft":
+      return overlaps / sizeRight
+    elif metric == "cosineSimilarity":
+      return overlaps / numpy.sqrt(sizeLeft * sizeRight)
+    elif metric == "euclideanDistance":
+      return numpy.sqrt(sizeLeft + sizeRight - 2 * overlaps)
+    elif metric == "jaccardDistance":
+      return 1 - overlaps / (sizeLeft + sizeRight - overlaps)
+    raise ValueError("Invalid metric: {}".format(metric))
+
+
   def sparseUnion(self, counts):
     """
     Bits from the input patterns are unionized and then sparsified.
@@ -0,0 +1,148 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import numpy
+
+from fluent.encoders.language_encoder import LanguageEncoder
+from fluent.utils.bitmap_store import BitmapStore
+from fluent.utils.concurrent_requests import mapConcurrently
+
+
+
+class TokenTableEncoder(LanguageEncoder):
+  """
+  Encodes tokens by lookup in a table of precomputed token bitmaps, so each
+  token of a vocabulary is encoded by the wrapped encoder (e.g. a CioEncoder)
+  only once, however many times the data streams through a network. Tokens
+  missing from the table are encoded and added on first use.
+
+  Tokens have IDs, their rows in the table, and can be encoded by ID.
+  """
+
+  def __init__(self, encoder, tokens=()):
+    """
+    @param encoder    (LanguageEncoder)   Encoder of the tokens; its
+                                          encodeIntoArray() returns a
+                                          fingerprint dict, as CioEncoder's
+                                          does, or fills the output array.
+    @param tokens     (iterable)          Vocabulary to encode up front.
+    """
+    super(TokenTableEncoder, self).__init__(
+      n=encoder.getWidth(), unionSparsity=encoder.unionSparsity)
+    self.encoder = encoder
+    self.description = ("Token Table Encoder", 0)
+
+    # token -> token ID, the row of the token's bitmap in the store
+    self.vocabulary = {}
+    self.tokens = []
+    self.bitmaps = BitmapStore(self.n)
+
+    self.addTokens(tokens)
+
+
+  def __getstate__(self):
+    # Don't pickle the wrapped encoder; e.g. the CioEncoder holds an API client.
+    state = self.__dict__.copy()
+    state["encoder"] = None
+    return state
+
+
+  def addTokens(self, tokens):
+    """
+    Encode the tokens not yet in the table, concurrently, and add them.
+
+    @param tokens     (iterable)    Token strings.
+    @return           (list)        IDs of the tokens.
+    """
+    tokens = list(tokens)
+    newTokens = sorted(set(t for t in tokens if t not in self.vocabulary))
+    for token, bitmap in zip(newTokens,
+                             mapConcurrently(self._encodeToken, newTokens)):
+      self.vocabulary[token] = self.bitmaps.append(bitmap)
+      self.tokens.append(token)
+
+    return [self.vocabulary[t] for t in tokens]
+
+
+  def _encodeToken(self, token):
+    """Return the bitmap of the token from the wrapped encoder."""
+    output = numpy.zeros(self.n, dtype=numpy.uint8)
+    encoding = self.encoder.encodeIntoArray(token, output)
+    if isinstance(encoding, dict):
+      return encoding["fingerprint"]["positions"]
+
+    # No encoding (e.g. the API has no substitute) or it's in the output.
+    return numpy.flatnonzero(output)
+
+
+  def getTokenId(self, token):
+    """Return the ID of the token, encoding it if it isn't in the table."""
+    if token not in self.vocabulary:
+      self.addTokens([token])
+    return self.vocabulary[token]
+
+
+  def encode(self, token):
+    """
+    Return the token's encoding, in the format of CioEncoder.encode().
+
+    @param token      (str or int)  Token, or token ID.
+    @return           (dict)        The bitmap encoding is at
+                                    encoding["fingerprint"]["positions"], a
+                                    read-only view of the table.
+    """
+    if isinstance(token, (int, long, numpy.integer)):
+      tokenId = int(token)
+    else:
+      tokenId = self.getTokenId(token)
+    positions = self.bitmaps[tokenId]
+
+    return {"text": self.tokens[tokenId],
+            "sparsity": len(positions) * 100 / float(self.n),
+            "fingerprint": {"positions": positions}}
+
+
+  def encodeIntoArray(self, token, output):
+    """
+    Put the token's SDR into the output array, and return its encoding as
+    encode() does.
+
+    @param token      (str or int)  Token, or token ID.
+    @param output     (numpy)       1-D array of length getWidth().
+    """
+    encoding = self.encode(token)
+    if output is not None:
+      output[:] = 0
+      output[encoding["fingerprint"]["positions"]] = 1
+
+    return encoding
+
+
+  def decode(self, encoding, numTerms=10):
+    return self.encoder.decode(encoding, numTerms)
+
+
+  def getWidth(self):
+    return self.n
+
+
+  def getDescription(self):
+    return self.description
@@ -88,6 +88,8 @@ def run(args):
                        generateData=args.generateData,
                        votingMethod=args.votingMethod,
                        classificationFile=args.classificationFile,
+                       inMemory=args.inMemory,
+                       stagedLearning=args.stagedLearning,
                        classifierType=args.classifierType)
   else:
     runner = Runner(dataPath=args.dataPath,
@@ -222,6 +224,17 @@ if __name__ == "__main__":
                       action="store_true",
                       help="Whether or not to generate network data files. "
                            "This only applies to HTM models.")
+  parser.add_argument("--inMemory",
+                      default=False,
+                      action="store_true",
+                      help="Keep generated network data in memory instead of "
+                           "writing files. This only applies to HTM models.")
+  parser.add_argument("--stagedLearning",
+                      default=False,
+                      action="store_true",
+                      help="Train the network's regions in stages, in the "
+                           "order of the network config. This only applies to "
+                           "HTM models.")
   parser.add_argument("--votingMethod",
                       default="last",
                       choices=["last", "most"],
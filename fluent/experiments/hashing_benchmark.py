@@ -0,0 +1,123 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+Benchmarks the hashing-trick mode of the traditional (TFIDF) model against its
+vocabulary, measuring k-fold classification accuracy, the size of the pickled
+model, and test time for each number of hash buckets.
+
+EXAMPLE: from the nupic.fluent directory run...
+  python fluent/experiments/hashing_benchmark.py \
+    data/sample_reviews/sample_reviews.csv --hashBits 6 8 10 12 16
+
+A test sample is classified correctly if its most similar label is one of its
+labels.
+"""
+
+import argparse
+import cPickle as pickle
+import numpy
+import time
+
+from fluent.models.classify_traditional import ClassificationModelTraditional
+from fluent.utils.csv_helper import readCSV
+from fluent.utils.data_split import KFolds
+from fluent.utils.text_preprocess import TextPreprocess
+
+
+
+def evaluate(samples, labels, partitions, hashBits):
+  """
+  Return the mean accuracy over the train/test partitions, the mean size of
+  the pickled models, and the mean test time per sample.
+  """
+  accuracies = []
+  sizes = []
+  testTimes = []
+  for trainIndices, testIndices in partitions:
+    model = ClassificationModelTraditional(verbosity=0, numLabels=1,
+                                           hashBits=hashBits)
+    model.trainModel([samples[i] for i in trainIndices],
+                     [labels[i] for i in trainIndices])
+    model.finalizeTraining()
+    sizes.append(len(pickle.dumps(model, pickle.HIGHEST_PROTOCOL)))
+
+    start = time.time()
+    results = model.testSamples([samples[i] for i in testIndices])
+    testTimes.append((time.time() - start) / len(testIndices))
+
+    accuracies.append(numpy.mean([bool(result) and result[0] in labels[i]
+                                  for result, i in zip(results, testIndices)]))
+
+  return numpy.mean(accuracies), numpy.mean(sizes), numpy.mean(testTimes)
+
+
+
+def run(args):
+  dataDict = readCSV(args.dataPath, numLabels=args.numClasses)
+  texter = TextPreprocess()
+  samples = [{"text": texter.tokenize(text)} for text, _ in dataDict.values()]
+  labels = [sampleLabels for _, sampleLabels in dataDict.values()]
+
+  numpy.random.seed(args.seed)
+  partitions = KFolds(args.kFolds).split(
+    list(numpy.random.permutation(len(samples))))
+  print "{} samples, {} distinct tokens, {} folds".format(
+    len(samples), len(set(t for s in samples for t in s["text"])),
+    args.kFolds)
+
+  print "{:>12}{:>12}{:>14}{:>12}".format(
+    "buckets", "accuracy", "model bytes", "ms/sample")
+  for hashBits in [None] + args.hashBits:
+    accuracy, size, testTime = evaluate(samples, labels, partitions, hashBits)
+    print "{:>12}{:>12.3f}{:>14.0f}{:>12.3f}".format(
+      "vocabulary" if hashBits is None else 2**hashBits, accuracy, size,
+      1000 * testTime)
+
+
+
+if __name__ == "__main__":
+
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument("dataPath",
+                      help="Path to data CSV.",
+                      type=str)
+  parser.add_argument("--numClasses",
+                      default=3,
+                      type=int,
+                      help="Specifies the number of classes per sample.")
+  parser.add_argument("-k", "--kFolds",
+                      default=5,
+                      type=int,
+                      help="Number of folds for cross validation.")
+  parser.add_argument("--hashBits",
+                      default=[4, 6, 8, 10, 12, 16],
+                      type=int,
+                      nargs="+",
+                      help="Numbers of hash bits (log2 of the number of "
+                           "buckets) to benchmark.")
+  parser.add_argument("--seed",
+                      default=42,
+                      type=int,
+                      help="Random seed for the folds.")
+
+  args = parser.parse_args()
+  run(args)
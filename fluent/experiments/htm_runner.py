@@ -19,14 +19,14 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
-import cPickle as pkl
+import numpy
 import os
 
-from collections import Counter, namedtuple
+from collections import namedtuple
 from fluent.experiments.runner import Runner
 from fluent.models.classify_htm import ClassificationModelHTM
+from fluent.utils.memory_record_stream import MemoryRecordStream
 from fluent.utils.network_data_generator import NetworkDataGenerator
-from nupic.engine import Network
 
 try:
   import simplejson as json
@@ -35,6 +35,10 @@ except ImportError:
 
 
 
+Partition = namedtuple("Partition", "partName index")
+
+
+
 class HTMRunner(Runner):
   """
   Class to run the HTM NLP experiments with the specified data and evaluation
@@ -55,10 +59,19 @@ class HTMRunner(Runner):
                verbosity=0,
                generateData=True,
                votingMethod="last",
-               classificationFile=""):
+               classificationFile="",
+               inMemory=False,
+               stagedLearning=False):
     """
     @param networkConfigPath  (str)    Path to JSON specifying network params.
     @param generateData       (bool)   Whether or not we need to generate data.
+    @param inMemory           (bool)   Keep generated data in memory (as
+                                       MemoryRecordStreams) rather than writing
+                                       network data and classification files.
+    @param stagedLearning     (bool)   Train the regions in stages, in the order
+                                       of the networkConfig (see
+                                       partitionLearning()), rather than all at
+                                       once.
     @param votingMethod       (str)    Classify with "last" token's score or
                                        "most" frequent of the sequence.
     @param classificationFile (str)    Path to JSON that maps labels to ids.
@@ -74,6 +87,8 @@ class HTMRunner(Runner):
     self.votingMethod = votingMethod
     self.dataFiles = []
     self.actualLabels = None
+    self.inMemory = inMemory
+    self.stagedLearning = stagedLearning
 
     if classificationFile == "" and not generateData:
       raise ValueError("Must give classificationFile if not generating data")
@@ -98,15 +113,12 @@ class HTMRunner(Runner):
   def initModel(self, trial=0):
     """
     Load or instantiate the classification model. Assumes network data is
-    already setup.
+    already setup. A loadPath is the directory of a model saved by
+    ClassificationModelHTM.saveModel().
     """
     if self.loadPath:
-      with open(self.loadPath, "rb") as f:
-        self.model = pkl.load(f)
-      # TODO: uncomment once we can save TPRegion; do we need this?
-      # networkFile = self.model.network
-      # self.model.network = Network(networkFile)
-      print "Model loaded from \'{0}\'.".format(self.loadPath)
+      self.model = ClassificationModelHTM.load(self.loadPath,
+                                               verbosity=self.verbosity)
     else:
       self.model = ClassificationModelHTM(self.networkConfig,
                                           self.dataFiles[trial],
@@ -124,12 +136,24 @@ class HTMRunner(Runner):
   def setupNetData(self, preprocess=False, generateData=False, **kwargs):
     """
     Generate the data in network API format if necessary. self.dataFiles is
-    populated with the paths of network data files, one for each trial
+    populated with the paths of network data files, one for each trial, or
+    with MemoryRecordStreams of the data if self.inMemory.
 
     Look at runner.py (setupData) and network_data_generator.py (split) for the
     parameters.
     """
-    if generateData:
+    labelToId = None
+    if generateData and self.inMemory:
+      ndg = NetworkDataGenerator()
+      ndg.split(self.dataPath, self.numClasses, preprocess, **kwargs)
+
+      for i in xrange(len(self.trainSizes)):
+        if not self.orderedSplit:
+          ndg.randomizeData()
+        self.dataFiles.append(ndg.getRecordStream())
+      labelToId = dict(ndg.categoryToId)
+
+    elif generateData:
       # TODO: use model.prepData()?
       ndg = NetworkDataGenerator()
       ndg.split(self.dataPath, self.numClasses, preprocess, **kwargs)
@@ -156,7 +180,7 @@ class HTMRunner(Runner):
       # Setup labels data objects
       self.actualLabels = [self._getClassifications(size, i)
         for i, size in enumerate(self.trainSizes)]
-      self._mapLabelRefs()
+      self._mapLabelRefs(labelToId)
 
 
   def _getClassifications(self, split, trial):
@@ -169,31 +193,40 @@ class HTMRunner(Runner):
     """
     # import pdb; pdb.set_trace()
     dataFile = self.dataFiles[trial]
-    classifications = NetworkDataGenerator.getClassifications(dataFile)
+    if isinstance(dataFile, MemoryRecordStream):
+      classifications = dataFile.getClassifications()
+    else:
+      classifications = NetworkDataGenerator.getClassifications(dataFile)
     return [[int(c) for c in classes.strip().split(" ")]
              for classes in classifications][split:]
 
 
-  def _mapLabelRefs(self):
-    """Get the mapping from label strings to the corresponding ints."""
-    try:
-      with open(self.classificationFile, "r") as f:
-        labelToId = json.load(f)
-      # Convert the dict of strings -> ids to a list of strings ordered by id
-      self.labelRefs = zip(*sorted(labelToId.iteritems(), key=lambda x:x[1]))[0]
-    except IOError as e:
-      print "Must have a valid classification JSON file"
-      raise e
+  def _mapLabelRefs(self, labelToId=None):
+    """
+    Get the mapping from label strings to the corresponding ints, from the
+    classification file unless labelToId is given.
+    """
+    if labelToId is None:
+      try:
+        with open(self.classificationFile, "r") as f:
+          labelToId = json.load(f)
+      except IOError as e:
+        print "Must have a valid classification JSON file"
+        raise e
+
+    # Convert the dict of strings -> ids to a list of strings ordered by id
+    self.labelRefs = zip(*sorted(labelToId.iteritems(), key=lambda x:x[1]))[0]
 
 
   def resetModel(self, trial=0):
     """
-    Load or instantiate the classification model; network API doesn't support
-    resetting."""
-    self.initModel(trial=trial)
-    # TODO: change to same as Runner:
-    #   self.model.resetModel()
-    #   otherwise you're creating a new model instance twice each experiment
+    Reset the classification model to its untrained state, reading the data
+    of this trial; the network is only built (or loaded) for the first trial.
+    """
+    if self.model is None or self.loadPath:
+      self.initModel(trial=trial)
+    else:
+      self.model.resetModel(self.dataFiles[trial])
 
 
   def encodeSamples(self):
@@ -216,25 +249,39 @@ class HTMRunner(Runner):
       print ("\tRunner selects to train on sequences starting at indices {}.".
             format(indices))
 
-    for numTokens in self.partitions[trial][0]:
-      self.model.trainModel(iterations=numTokens)
+    if self.stagedLearning:
+      learningPartitions = self.partitionLearning(trial)
+    else:
+      learningPartitions = [Partition("train", 0)]
+
+    # Run each phase's sequences in one call; the data has the resets.
+    numTokens = self.partitions[trial][0]
+    ends = [p.index for p in learningPartitions[1:]] + [len(numTokens)]
+    for partition, end in zip(learningPartitions, ends):
+      self.model.setPhase(partition.partName)
+      self.model.trainModel(iterations=sum(numTokens[partition.index:end]))
 
 
-  def _selectWinners(self, predictions):
+  def _selectWinners(self, outputs):
     """
-    Selects the final classifications for the predictions.  Voting
-    method=="last" means the predictions of the last sample are used. Voting
-    method=="most" means the most frequent sample is used.
-    @param predictions    (list)    List of list of possible classifications
-    @return               (list)    List of winning classifications
+    Selects the final classifications from the classifier outputs of a
+    sequence's tokens.  Voting method=="last" means the predictions of the
+    last token are used. Voting method=="most" means the labels predicted for
+    the most tokens are used.
+    @param outputs        (numpy array)   Classifier outputs; rows are tokens,
+                                          as from model.testSequence().
+    @return               (numpy array)   Winning classifications
     """
     if self.votingMethod == "last":
-      return predictions[-1]
+      return self.model.getWinningLabels(outputs[-1],
+                                         numLabels=self.model.numLabels)
     elif self.votingMethod == "most":
-      counter = Counter()
-      for p in predictions:
-        counter.update(p)
-      return zip(*counter.most_common(self.numClasses))[0]
+      predictions = self.model.getWinningLabelsBatch(
+        outputs, numLabels=self.model.numLabels)
+      votes = numpy.bincount(
+        numpy.concatenate(predictions + [[]]).astype(numpy.int64),
+        minlength=outputs.shape[1])
+      return self.model.getWinningLabels(votes, numLabels=self.numClasses)
     else:
       raise ValueError("voting method must be either \'last\' or \'most\'")
 
@@ -256,11 +303,11 @@ class HTMRunner(Runner):
 
     results = ([], [])
     for i, numTokens in enumerate(self.partitions[trial][1]):
-      predictions = []
-      for _ in xrange(numTokens):
-        predicted = self.model.testModel()
-        predictions.append(predicted)
-      winningPredictions = self._selectWinners(predictions)
+      # Only "most" voting needs the outputs of every token, and so runs the
+      # network one token at a time.
+      outputs = self.model.testSequence(
+        numTokens, collectAll=(self.votingMethod != "last"))
+      winningPredictions = self._selectWinners(outputs)
 
       # TODO: switch to standard (expected, actual) format
       results[0].append(winningPredictions)
@@ -271,7 +318,11 @@ class HTMRunner(Runner):
     testIdx = range(len(self.partitions[trial][0]),
       len(self.partitions[trial][0]) + len(self.partitions[trial][1]))
     self.partitions[trial] = (trainIdx, testIdx)
-    self.samples = NetworkDataGenerator.getSamples(self.dataFiles[trial])
+    dataFile = self.dataFiles[trial]
+    if isinstance(dataFile, MemoryRecordStream):
+      self.samples = dataFile.getSamples()
+    else:
+      self.samples = NetworkDataGenerator.getSamples(dataFile)
 
     self.results.append(results)
 
@@ -283,29 +334,33 @@ class HTMRunner(Runner):
     """
     for trial, split in enumerate(self.trainSizes):
       dataFile = self.dataFiles[trial]
-      numTokens = NetworkDataGenerator.getNumberOfTokens(dataFile)
+      if isinstance(dataFile, MemoryRecordStream):
+        numTokens = dataFile.getNumberOfTokens()
+      else:
+        numTokens = NetworkDataGenerator.getNumberOfTokens(dataFile)
       self.partitions.append((numTokens[:split], numTokens[split:]))
 
 
-  # TODO
   # This method is to partition data for which regions are learning, as in the
   # sequence classification experiments.
-  def partitionLearning(self):
+  def partitionLearning(self, trial):
     """
-    Find the number of partitions for the input data based on a specific
-    networkConfig.
+    Partition the training sequences of a trial among the model's training
+    phases, in the order of the regions in the networkConfig, evenly. If the
+    model has no training phases, all of its learning regions train on every
+    sequence, in one "train" partition.
 
-    @return partitions: (list of namedtuples) Region names and index at which the
-      region is to begin learning. The final partition is reserved as a test set.
+    @param trial      (int)       trial count
+    @return partitions: (list of namedtuples) Training phase names and index of
+      the training sequence at which the phase's region is to begin learning.
     """
-    Partition = namedtuple("Partition", "partName index")
-
-    # Add regions to partition list in order of learning.
-    regionConfigs = ("spRegionConfig", "tmRegionConfig", "upRegionConfig",
-      "classifierRegionConfig")
-    partitions = []
+    phases = self.model.getTrainingPhases()
+    if not phases:
+      return [Partition("train", 0)]
+    numSequences = len(self.partitions[trial][0])
 
-    return
+    return [Partition(phase, i * numSequences / len(phases))
+            for i, phase in enumerate(phases)]
 
 
   def writeOutClassifications(self):
@@ -0,0 +1,158 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+Benchmarks the approximate (MinHash LSH) overlap search against the exact
+inverted index, measuring query latency and recall of the exact top k.
+
+EXAMPLE: from the nupic.fluent directory run...
+  python fluent/experiments/overlap_search_benchmark.py --numPrototypes 50000
+
+The prototypes are synthetic SDRs with the dimensions of Cortical.io
+fingerprints, drawn in clusters so each query has a set of true near neighbors,
+like the fingerprints of samples on the same topic.
+"""
+
+import argparse
+import numpy
+import time
+
+from fluent.utils.minhash_index import MinHashLSHIndex
+from fluent.utils.overlap_index import OverlapIndex
+
+
+
+def generateSDRs(numPrototypes, numQueries, n, w, clusterSize, noise, seed):
+  """
+  Return prototype and query SDRs. Each cluster has a random center SDR, and
+  its members replace a fraction (noise) of the center's ON bits with random
+  bits. Queries are new members of the clusters.
+  """
+  rng = numpy.random.RandomState(seed)
+  numClusters = max(numPrototypes / clusterSize, 1)
+  centers = [rng.choice(n, w, replace=False) for _ in xrange(numClusters)]
+
+  def member(center):
+    keep = rng.choice(center, int(w * (1 - noise)), replace=False)
+    return numpy.union1d(keep, rng.choice(n, w - keep.size, replace=False))
+
+  prototypes = [member(centers[i % numClusters]) for i in xrange(numPrototypes)]
+  queries = [member(centers[rng.randint(numClusters)])
+             for _ in xrange(numQueries)]
+
+  return prototypes, queries
+
+
+
+def timeQueries(search, queries):
+  """Return the results of search() for each query and the mean latency."""
+  start = time.time()
+  results = [search(query) for query in queries]
+
+  return results, (time.time() - start) / len(queries)
+
+
+
+def run(args):
+  print "Generating {} prototypes and {} queries...".format(
+    args.numPrototypes, args.numQueries)
+  prototypes, queries = generateSDRs(args.numPrototypes, args.numQueries,
+                                     args.n, args.w, args.clusterSize,
+                                     args.noise, args.seed)
+
+  index = OverlapIndex(args.n)
+  for prototype in prototypes:
+    index.add(prototype)
+  # Build the posting lists before timing the queries.
+  index.overlaps(queries[0])
+
+  exact, exactTime = timeQueries(lambda q: index.topK(q, args.k)[0], queries)
+  print "Exact search: {0:.3f} ms/query".format(1000 * exactTime)
+
+  print "{:>6}{:>6}{:>12}{:>12}{:>12}{:>10}".format(
+    "bands", "rows", "ms/query", "speedup", "candidates", "recall")
+  for bands in args.bands:
+    for rows in args.rows:
+      lsh = MinHashLSHIndex(args.n, bands, rows, seed=args.seed)
+      for prototype in prototypes:
+        lsh.add(prototype)
+      lsh.candidates(queries[0])
+
+      approximate, lshTime = timeQueries(lambda q: lsh.topK(q, args.k)[0],
+                                         queries)
+      numCandidates = numpy.mean([lsh.candidates(q).size for q in queries])
+      recall = numpy.mean([numpy.intersect1d(a, e).size / float(e.size)
+                           for a, e in zip(approximate, exact)])
+
+      print "{:>6}{:>6}{:>12.3f}{:>12.2f}{:>12.0f}{:>10.3f}".format(
+        bands, rows, 1000 * lshTime, exactTime / lshTime, numCandidates, recall)
+
+
+
+if __name__ == "__main__":
+
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument("--numPrototypes",
+                      default=20000,
+                      type=int,
+                      help="Number of prototype SDRs in the index.")
+  parser.add_argument("--numQueries",
+                      default=200,
+                      type=int,
+                      help="Number of query SDRs.")
+  parser.add_argument("-k",
+                      default=10,
+                      type=int,
+                      help="Number of nearest neighbors to retrieve.")
+  parser.add_argument("-n",
+                      default=16384,
+                      type=int,
+                      help="Number of bits in the SDRs.")
+  parser.add_argument("-w",
+                      default=328,
+                      type=int,
+                      help="Number of ON bits in the SDRs.")
+  parser.add_argument("--clusterSize",
+                      default=20,
+                      type=int,
+                      help="Number of prototypes per cluster.")
+  parser.add_argument("--noise",
+                      default=0.3,
+                      type=float,
+                      help="Fraction of a cluster center's bits that are "
+                           "replaced in each member.")
+  parser.add_argument("--bands",
+                      default=[16, 32],
+                      type=int,
+                      nargs="+",
+                      help="Numbers of LSH bands to benchmark.")
+  parser.add_argument("--rows",
+                      default=[2, 4],
+                      type=int,
+                      nargs="+",
+                      help="Numbers of MinHash rows per band to benchmark.")
+  parser.add_argument("--seed",
+                      default=42,
+                      type=int,
+                      help="Random seed.")
+
+  args = parser.parse_args()
+  run(args)
@@ -240,16 +240,14 @@ class Runner(object):
 
   def _training(self, trial):
     """
-    Train the model one-by-one on each pattern specified in this trials
-    partition of indices. Models' training methods require the sample and label
-    to be in a list.
+    Train the model on all the patterns specified in this trial's partition of
+    indices at once; the models' training methods accept a list of indices.
     """
     if self.verbosity > 0:
       print ("\tRunner selects to train on sample(s) {}".format(
         self.partitions[trial][0]))
 
-    for i in self.partitions[trial][0]:
-      self.model.trainModel(i)
+    self.model.trainModel(self.partitions[trial][0])
 
 
   def _testing(self, trial):
@@ -257,11 +255,13 @@ class Runner(object):
       print ("\tRunner selects to test on sample(s) {}".format(
         self.partitions[trial][1]))
 
-    results = ([], [])
-    for i in self.partitions[trial][1]:
-      predicted = self.model.testModel(i)
-      results[0].append(predicted)
-      results[1].append(self.patterns[i]["labels"])
+    indices = self.partitions[trial][1]
+    if hasattr(self.model, "testModelBatch"):
+      predicted = self.model.testModelBatch(indices)
+    else:
+      predicted = [self.model.testModel(i) for i in indices]
+
+    results = (list(predicted), [self.patterns[i]["labels"] for i in indices])
 
     self.results.append(results)
 
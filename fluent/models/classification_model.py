@@ -22,13 +22,14 @@
 import copy
 import cPickle as pkl
 import numpy
-import operator
 import os
 import pandas
 import random
 
 from collections import defaultdict, OrderedDict
 
+from fluent.utils.bitmap_store import compactBitmap
+from fluent.utils.overlap_index import OverlapIndex
 from fluent.utils.text_preprocess import TextPreprocess
 
 try:
@@ -67,6 +68,10 @@ class ClassificationModel(object):
 
     # each time a sample is trained on, its unique ID is appended
     self.sampleReference = []
+    # prototypes grouped by sample ID, built lazily from sampleReference
+    self._sampleGrouping = None
+    # category bitmaps as a sparse matrix, built lazily from categoryBitmaps
+    self._categoryMatrix = None
 
     self.patterns = []
 
@@ -122,9 +127,21 @@ class ClassificationModel(object):
       raise e
 
 
+  def condensePrototypes(self):
+    """
+    Condense the prototypes of the classifier, if it has a prototype budget,
+    keeping sampleReference aligned with the remaining prototypes. A merged
+    prototype keeps the sample ID of its representative.
+    """
+    kept = self.classifier.condense()
+    if kept is not None:
+      self.sampleReference = [self.sampleReference[i] for i in kept]
+
+
   def resetModel(self):
     """Reset the model by clearing the classifier."""
     self.classifier.clear()
+    self._sampleGrouping = None
 
 
   def prepData(self, dataDict, preprocess):
@@ -181,7 +198,10 @@ class ClassificationModel(object):
       raise ValueError("Invalid path to write file.")
 
     with open(os.path.join(dirName, "category_distances.json"), "w") as f:
-      catDict = {"categoryBitmaps":self.categoryBitmaps,
+      # Category bitmaps are compact numpy arrays, so cast them to lists.
+      categoryBitmaps = {cat: numpy.asarray(bitmap).tolist()
+                         for cat, bitmap in self.categoryBitmaps.iteritems()}
+      catDict = {"categoryBitmaps":categoryBitmaps,
                  "labelRefs":dict(enumerate(labelRefs)) if labelRefs else None,
                  "comparisons":comparisons if comparisons else None}
       json.dump(catDict,
@@ -191,6 +211,28 @@ class ClassificationModel(object):
                 separators=(",", ": "))
 
 
+  def _getCategoryMatrix(self):
+    """
+    Return the category labels, in sorted order, an OverlapIndex of their
+    bitmaps (a sparse category x bit matrix), and the number of ON bits of
+    each, for models which define categories with bitmaps. Rebuilt after the
+    model sets _categoryMatrix to None, when categoryBitmaps changes.
+    Categories without ON bits can't be compared, so they're left out.
+    """
+    if getattr(self, "_categoryMatrix", None) is None:
+      categories = numpy.array(
+        sorted(cat for cat, bitmap in self.categoryBitmaps.iteritems()
+               if len(bitmap)),
+        dtype=numpy.int64)
+      bitmaps = [self.categoryBitmaps[cat] for cat in categories.tolist()]
+      categoryIndex = OverlapIndex(self.n)
+      categoryIndex.addBatch(bitmaps)
+      sizes = numpy.array([numpy.unique(bitmap).size for bitmap in bitmaps])
+      self._categoryMatrix = (categories, categoryIndex, sizes)
+
+    return self._categoryMatrix
+
+
   @staticmethod
   def classifyRandomly(labels):
     """Return accuracy of random classifications for the labels."""
@@ -208,7 +250,7 @@ class ClassificationModel(object):
       array([1, 3])
     Note:
       - indices of nonzero values are not included in the returned array
-      - ties are handled randomly
+      - ties go to the lower label, so the winners are deterministic
 
     @param labelFreq    (numpy.array)   Ints that (in this context) represent
                                         the frequency of inferred labels.
@@ -218,23 +260,46 @@ class ClassificationModel(object):
                                         sorted greatest to least. Length is up
                                         to numLabels.
     """
-    # The use of numpy.lexsort() here is to first sort by labelFreq, then sort
-    # by random values; this breaks ties in a random manner.
     if labelFreq is None:
       return numpy.array([])
 
-    randomValues = numpy.random.random(labelFreq.size)
-    winners = numpy.lexsort((randomValues, labelFreq))[::-1][:numLabels]
+    # A stable sort of the negated frequencies keeps tied labels in order.
+    labelFreq = numpy.asarray(labelFreq)
+    winners = numpy.argsort(-labelFreq, kind="mergesort")[:numLabels]
 
     return numpy.array([i for i in winners if labelFreq[i] > 0])
 
 
-  def queryModel(self, query, preprocess):
+  @staticmethod
+  def getWinningLabelsBatch(labelFreqs, numLabels=3):
+    """
+    Returns the winning labels for each row of labelFreqs, as in
+    getWinningLabels(), with one sort over all of the rows.
+
+    @param labelFreqs   (numpy.array)   Label frequencies; rows are samples,
+                                        columns are labels.
+    @param numLabels    (int)           Return this number of most frequent
+                                        labels within top k
+    @return             (list)          Numpy arrays of the largest elements'
+                                        indices in each row, sorted greatest to
+                                        least. Lengths are up to numLabels.
+    """
+    winners = numpy.argsort(-labelFreqs, axis=1,
+                            kind="mergesort")[:, :numLabels]
+    isNonzero = labelFreqs[numpy.arange(len(labelFreqs))[:, None], winners] > 0
+
+    return [row[nonzero] for row, nonzero in zip(winners, isNonzero)]
+
+
+  def queryModel(self, query, preprocess, topK=None):
     """
     Preprocesses the query, encodes it into a pattern, then queries the
     classifier to infer distances to trained-on samples.
+
+    @param topK   (int)           Only return the topK closest samples.
     @return       (list)          Two-tuples of sample ID and distance, sorted
-                                  closest to farthest from the query.
+                                  closest to farthest from the query; ties are
+                                  sorted by sample ID.
     """
     if preprocess:
       sample = TextPreprocess().tokenize(query,
@@ -246,34 +311,68 @@ class ClassificationModel(object):
 
     allDistances = self.infer(self.encodeSample(sample))
 
-    # Model trains multiple times for multi-label samples, so remove repeats.
-    # note: numpy.unique() auto sorts least to greatest
-
     if len(allDistances) != len(self.sampleReference):
       raise IndexError("Number of protoype distances must match number of "
                        "samples trained on.")
 
-    sampleDistances = defaultdict()
-    for i, uniqueID in enumerate(self.sampleReference):
-      sampleDistances[uniqueID] = min(
-        [allDistances[i] for i, x in enumerate(self.sampleReference)
-         if x == uniqueID])
+    # Model trains multiple times for multi-label samples, so take the minimum
+    # distance over each sample's prototypes.
+    sampleIds, prototypeOrder, groupStarts = self._getSampleGrouping()
+    if not sampleIds.size:
+      return []
+    sampleDistances = numpy.minimum.reduceat(
+      numpy.asarray(allDistances)[prototypeOrder], groupStarts)
+
+    if topK is not None and topK < sampleIds.size:
+      if topK <= 0:
+        return []
+      # Keep every sample tied with the topK-th distance so the ID tie-break is
+      # deterministic.
+      kthDistance = numpy.partition(sampleDistances, topK-1)[topK-1]
+      top = numpy.flatnonzero(sampleDistances <= kthDistance)
+      sampleIds = sampleIds[top]
+      sampleDistances = sampleDistances[top]
+
+    order = numpy.lexsort((sampleIds, sampleDistances))[:topK]
+
+    return zip(sampleIds[order].tolist(), sampleDistances[order].tolist())
+
+
+  def _getSampleGrouping(self):
+    """
+    Return the prototypes grouped by sample ID, rebuilt only when training has
+    appended to sampleReference.
+
+    @return sampleIds       (numpy.array)   Unique sample IDs, in sorted order.
+    @return prototypeOrder  (numpy.array)   Prototype indices, sorted by
+                                            sample ID.
+    @return groupStarts     (numpy.array)   Start of each sample's prototypes
+                                            in prototypeOrder.
+    """
+    grouping = getattr(self, "_sampleGrouping", None)
+    if grouping is None or grouping[0] != len(self.sampleReference):
+      reference = numpy.array(self.sampleReference)
+      prototypeOrder = numpy.argsort(reference, kind="mergesort")
+      sortedReference = reference[prototypeOrder]
+      groupStarts = numpy.flatnonzero(numpy.concatenate(
+        ([True], sortedReference[1:] != sortedReference[:-1])))[:reference.size]
+      grouping = (reference.size, sortedReference[groupStarts],
+                  prototypeOrder, groupStarts)
+      self._sampleGrouping = grouping
 
-    return sorted(sampleDistances.items(), key=operator.itemgetter(1))
+    return grouping[1:]
 
 
   def infer(self, pattern):
     """
     Get the classifier output for a single input pattern; assumes classifier
-    has an infer() method (as specified in NuPIC kNN implementation).
+    has a getDistances() method (as specified in OverlapKNNClassifier).
 
     @return dist    (numpy.array)       Each entry is the distance from the
         input pattern to that prototype (pattern in the classifier). All
         distances are between 0.0 and 1.0
     """
-    (_, _, dist, _) = self.classifier.infer(
-      self.sparsifyPattern(pattern["bitmap"], self.n))
-    return dist
+    return self.classifier.getDistances(pattern["bitmap"])
 
 
   @staticmethod
@@ -310,7 +409,8 @@ class ClassificationModel(object):
   def encodeRandomly(self, sample):
     """Return a random bitmap representation of the sample."""
     random.seed(sample)
-    return numpy.sort(random.sample(xrange(self.n), self.w))
+    return compactBitmap(numpy.sort(random.sample(xrange(self.n), self.w)),
+                         self.n)
 
 
   def writeOutEncodings(self):
@@ -24,8 +24,7 @@ import random
 
 from fluent.models.classification_model import ClassificationModel
 from fluent.encoders.cio_encoder import CioEncoder
-
-from cortipy.cortical_client import CorticalClient
+from fluent.utils.bitmap_store import compactBitmap
 from cortipy.exceptions import UnsuccessfulEncodingError
 
 
@@ -40,12 +39,11 @@ class ClassificationModelContext(ClassificationModel):
 
   def __init__(self, verbosity=1, numLabels=1):
     """
-    Initialize the CorticalClient and CioEncoder. Requires a valid API key
+    Initialize the CioEncoder. Requires a valid API key
     """
     super(ClassificationModelContext, self).__init__(verbosity)
 
     self.encoder = CioEncoder(cacheDir="./experiments/cache")
-    self.client = CorticalClient(self.encoder.apiKey)
 
     self.n = self.encoder.n
     self.w = int((self.encoder.targetSparsity / 100) * self.n)
@@ -79,23 +77,24 @@ class ClassificationModelContext(ClassificationModel):
       print "Fingerprint sparsity = {0}%.".format(fpInfo["sparsity"])
 
     if fpInfo:
-      bitmap = numpy.array(fpInfo["fingerprint"]["positions"])
+      bitmap = compactBitmap(fpInfo["fingerprint"]["positions"], self.n)
     else:
       bitmap = self.encodeRandomly(text)
 
-    return bitmap.astype(int)
+    return bitmap
 
 
   def resetModel(self):
     """Reset the model"""
     self.categoryBitmaps.clear()
+    self._categoryMatrix = None
 
 
   def trainModel(self, samples, labels):
     """
     Train the classifier on the input sample and label. Use Cortical.io's
-    keyword extraction to get the most relevant terms then get the intersection
-    of those bitmaps
+    context endpoint (cached by the encoder) to get the most relevant contexts,
+    then get the intersection of the union of their bitmaps with the category.
 
     @param samples     (dictionary)      Dictionary, containing text, sparsity,
                                          and bitmap
@@ -103,75 +102,62 @@ class ClassificationModelContext(ClassificationModel):
                                          of this sample.
     """
     for sample, sample_labels in zip(samples, labels):
-      bitmaps = [sample["bitmap"].tolist()]
-      context = self.client.getContextFromText(bitmaps, maxResults=5,
-                                               getFingerprint=True)
+      context = self.encoder.getContext(sample["bitmap"], maxResults=5)
 
       if len(context) != 0:
-        union = numpy.zeros(0)
-        for c in context:
-          bitmap = c["fingerprint"]["positions"]
-          union = numpy.union1d(bitmap, union).astype(int)
+        # One sort of all the contexts' bits, rather than a union per context.
+        union = numpy.unique(numpy.concatenate(
+          [c["fingerprint"]["positions"] for c in context]).astype(int))
 
         for label in sample_labels:
           # Haven't seen the label before
           if label not in self.categoryBitmaps:
-            self.categoryBitmaps[label] = union
+            self.categoryBitmaps[label] = compactBitmap(union, self.n)
 
-          intersection = numpy.intersect1d(union, self.categoryBitmaps[label])
+          # Both bitmaps are sorted and unique.
+          category = self.categoryBitmaps[label].astype(int)
+          intersection = numpy.intersect1d(union, category, assume_unique=True)
           if intersection.size == 0:
             # Don't want to lose all the old information
-            union = numpy.union1d(union, self.categoryBitmaps[label]).astype(int)
+            union = numpy.union1d(union, category)
             # Need to sample to stay sparse
             count = len(union)
             sampleIndices = random.sample(xrange(count), min(count, self.w))
             intersection = numpy.sort(union[sampleIndices])
 
-          self.categoryBitmaps[label] = intersection
+          self.categoryBitmaps[label] = compactBitmap(intersection, self.n)
+          self._categoryMatrix = None
 
 
   def testModel(self, sample):
     """
-    Test the intersection bitmap on the input sample. Returns a dictionary
-    containing various distance metrics between the sample and the classes.
+    Test the intersection bitmaps on the input sample, comparing the sample to
+    all of the classes locally, in one overlap pass.
 
     @param sample     (dictionary)      Dictionary, containing text, sparsity,
                                         and bitmap
-    @return           (dictionary)      The distances between the sample and
-                                        the classes
-    Example return dict:
-      {
-        0: {
-          "cosineSimilarity": 0.6666666666666666,
-          "euclideanDistance": 0.3333333333333333,
-          "jaccardDistance": 0.5,
-          "overlappingAll": 6,
-          "overlappingLeftRight": 0.6666666666666666,
-          "overlappingRightLeft": 0.6666666666666666,
-          "sizeLeft": 9,
-          "sizeRight": 9,
-          "weightedScoring": 0.4436476984102028
-        }
-      }
+    @return           (list)            Winning classes, by the overlap of
+                                        their bitmaps with the sample's.
     """
+    categories, categoryIndex, categorySizes = self._getCategoryMatrix()
+    if not categories.size:
+      return []
 
-    sampleBitmap = sample["bitmap"].tolist()
-
-    distances = {}
-    for cat, catBitmap in self.categoryBitmaps.iteritems():
-      distances[cat] = self.client.compare(sampleBitmap, catBitmap.tolist())
+    sampleBitmap = numpy.unique(sample["bitmap"])
+    metricValues = self.encoder.compareOverlaps(
+      categoryIndex.overlaps(sampleBitmap), sampleBitmap.size, categorySizes,
+      "overlappingAll")
 
-    return self.winningLabels(distances, numberCats=self.numLabels,
-      metric="overlappingAll") 
+    return self.winningLabels(metricValues, categories,
+      numberCats=self.numLabels, metric="overlappingAll")
 
 
   @staticmethod
-  def winningLabels(distances, numberCats, metric):
+  def winningLabels(metricValues, categories, numberCats, metric):
     """
-    Return indices of winning categories, based off of the input metric.
-    Overrides the base class implementation.
+    Return the winning categories, based off of the values of the input metric
+    for each category. Overrides the base class implementation.
     """
-    metricValues = numpy.array([v[metric] for v in distances.values()])
     sortedIdx = numpy.argsort(metricValues)
 
     # euclideanDistance and jaccardDistance are ascending
@@ -180,4 +166,4 @@ class ClassificationModelContext(ClassificationModel):
     if metric in descendingOrder:
       sortedIdx = sortedIdx[::-1]
 
-    return [distances.keys()[catIdx] for catIdx in sortedIdx[:numberCats]]
+    return categories[sortedIdx[:numberCats]].tolist()
@@ -25,6 +25,21 @@ from collections import defaultdict, OrderedDict
 from fluent.encoders.cio_encoder import CioEncoder
 from fluent.encoders.cio_encoder import LanguageEncoder
 from fluent.models.classification_model import ClassificationModel
+from fluent.utils.bitmap_store import compactBitmap
+from fluent.utils.category_builder import CategoryBuilder
+from fluent.utils.concurrent_requests import mapConcurrently
+
+
+
+# Metrics where greater values are more similar; euclideanDistance and
+# jaccardDistance are ascending.
+_DESCENDING_METRICS = ("overlappingAll", "overlappingLeftRight",
+                       "overlappingRightLeft", "cosineSimilarity",
+                       "weightedScoring")
+# Measures of LanguageEncoder.compare() that are computed from overlaps.
+_OVERLAP_METRICS = ("overlappingAll", "overlappingLeftRight",
+                    "overlappingRightLeft", "cosineSimilarity",
+                    "euclideanDistance", "jaccardDistance")
 
 
 
@@ -40,10 +55,20 @@ class ClassificationModelEndpoint(ClassificationModel):
                verbosity=1,
                numLabels=3,
                modelDir="ClassificationModelEndpoint",
-               unionSparsity=20.0):
+               unionSparsity=20.0,
+               categoryBackend="api"):
     """
     Initializes the encoder as CioEncoder; requires a valid API key.
+
+    @param categoryBackend  (str)   How category bitmaps are made: "api" uses
+                                    Cortical.io's createClassification(),
+                                    "local" builds them from the bit
+                                    frequencies of the encoded samples (see
+                                    CategoryBuilder), with no API calls.
     """
+    if categoryBackend not in ("api", "local"):
+      raise ValueError("Invalid category backend: {}".format(categoryBackend))
+
     super(ClassificationModelEndpoint, self).__init__(
       verbosity=verbosity, numLabels=numLabels, modelDir=modelDir)
 
@@ -57,6 +82,12 @@ class ClassificationModelEndpoint(ClassificationModel):
     self.categoryBitmaps = {}
     self.negatives = defaultdict(list)
     self.positives = defaultdict(list)
+    self.categoryBackend = categoryBackend
+    # Local categories have at most the encoder's w ON bits.
+    self.categoryBuilder = (CategoryBuilder(self.n, self.encoder.w)
+                            if categoryBackend == "local" else None)
+    # Labels trained on since their category bitmaps were last created.
+    self._dirtyLabels = set()
 
 
   def encodeSample(self, sample):
@@ -78,7 +109,7 @@ class ClassificationModelEndpoint(ClassificationModel):
     if fpInfo:
       fp = {"text":fpInfo["text"] if "text" in fpInfo else fpInfo["term"],
             "sparsity":fpInfo["sparsity"],
-            "bitmap":numpy.array(fpInfo["fingerprint"]["positions"])}
+            "bitmap":compactBitmap(fpInfo["fingerprint"]["positions"], self.n)}
     else:
       fp = {"text":sample,
             "sparsity":float(self.w)/self.n,
@@ -92,55 +123,104 @@ class ClassificationModelEndpoint(ClassificationModel):
     self.positives.clear()
     self.negatives.clear()
     self.categoryBitmaps.clear()
+    self._categoryMatrix = None
+    if self.categoryBuilder is not None:
+      self.categoryBuilder.clear()
+    self._dirtyLabels.clear()
 
 
   def trainModel(self, i, negatives=None):
-    # TODO: add batch training, where i is a list; note we should only add
-    # negatives when training on one sample so we know which labels to use.
     """
-    Train the classifier on the sample and labels for record i. Use
-    Cortical.io's createClassification() to make a bitmap that represents the
-    class. The list sampleReference is populated to correlate classifier
-    prototypes to sample IDs.
+    Train the classifier on the sample and labels for record i, or for each of
+    the records if i is a list of indices. The labels trained on are only
+    marked for update; their category bitmaps are created by
+    finalizeTraining(), which runs before the next test or category
+    comparison; with the "local" backend the categories' bit counts are
+    updated here, touching only the record's ON bits. The list sampleReference
+    is populated to correlate classifier prototypes to sample IDs.
 
     @param negative   (list)            Each item is the dictionary containing
                                         text, sparsity and bitmap for the
-                                        negative samples.
+                                        negative samples. Negatives can only be
+                                        given when training on one record, so
+                                        we know which labels to use.
+    """
+    indices = numpy.atleast_1d(i)
+    if negatives and indices.size > 1:
+      raise ValueError("Negatives can only be used to train on one record.")
+
+    for index in indices:
+      record = self.patterns[index]
+      recordLabels = set()
+      for label in record["labels"]:
+        if record["pattern"]["text"] and record["pattern"]["bitmap"].any():
+          if self.categoryBuilder is None:
+            self.positives[label].append(record["pattern"]["text"])
+          else:
+            self.categoryBuilder.addPositive(label, record["pattern"]["bitmap"])
+          if negatives:
+            for neg in negatives:
+              if not neg["text"]:
+                continue
+              if self.categoryBuilder is None:
+                self.negatives[label].append(neg["text"])
+              else:
+                self.categoryBuilder.addNegative(label, neg["bitmap"])
+          recordLabels.add(label)
+      self.sampleReference.extend([index] * len(recordLabels))
+      self._dirtyLabels.update(recordLabels)
+
+
+  def finalizeTraining(self):
+    """
+    Make a bitmap that represents each class trained on since its last update,
+    from all of its positives and negatives. With the "api" backend, the
+    classes are created by Cortical.io's createClassification() with
+    concurrent requests, once per class no matter how many records were
+    trained on; with the "local" backend, from the category builder's counts.
     """
-    record = self.patterns[i]
-    labelsToUpdateBitmaps = set()
-    for label in record["labels"]:
-      if record["pattern"]["text"] and record["pattern"]["bitmap"].any():
-        self.positives[label].append(record["pattern"]["text"])
-        if negatives:
-          for neg in negatives:
-            if neg["text"]:
-              self.negatives[label].append(neg["text"])
-        labelsToUpdateBitmaps.add(label)
+    if not getattr(self, "_dirtyLabels", None):
+      return
+
+    labels = sorted(self._dirtyLabels)
+    if self.categoryBuilder is not None:
+      bitmaps = [self.categoryBuilder.getCategory(label) for label in labels]
+    else:
+      bitmaps = mapConcurrently(self._createCategoryBitmap, labels)
+
+    self.categoryBitmaps.update(zip(labels, bitmaps))
+    self._categoryMatrix = None
+    self._dirtyLabels.clear()
 
-    for label in labelsToUpdateBitmaps:
-      self.categoryBitmaps[label] = self.encoder.createCategory(
-        str(label), self.positives[label], self.negatives[label])["positions"]
-      self.sampleReference.append(i)
+
+  def _createCategoryBitmap(self, label):
+    """Return the category bitmap of the label, from the Cio API."""
+    return compactBitmap(self.encoder.createCategory(
+      str(label), self.positives[label], self.negatives[label])["positions"],
+      self.n)
 
 
   def testModel(self, i, numLabels=3, metric="overlappingAll"):
     """
-    Test on record i. The Cortical.io classifier returns a dictionary
-    containing various distance metrics between the sample and the classes.
+    Test on record i. The sample is scored against all of the class bitmaps
+    at once, computing only the given distance metric.
 
     @param numLabels  (int)           Number of classification predictions.
     @param metric     (str)           Distance metric use by classifier.
     @return           (numpy array)   numLabels most-frequent classifications
                                       for the data samples; int or empty.
     """
-    sampleBitmap = self.patterns[i]["pattern"]["bitmap"].tolist()
+    self.finalizeTraining()
+    categories, categoryIndex, categorySizes = self._getCategoryMatrix()
+    if not categories.size:
+      return numpy.array([])
 
-    distances = defaultdict(list)
-    for cat, catBitmap in self.categoryBitmaps.iteritems():
-      distances[cat] = self.compareEncoder.compare(sampleBitmap, catBitmap)
+    sampleBitmap = numpy.unique(self.patterns[i]["pattern"]["bitmap"])
+    metricValues = self.compareEncoder.compareOverlaps(
+      categoryIndex.overlaps(sampleBitmap), sampleBitmap.size, categorySizes,
+      metric)
 
-    return self.getWinningLabels(distances, numLabels=numLabels, metric=metric)
+    return self.winningLabels(metricValues, categories, numLabels, metric)
 
 
   @staticmethod
@@ -150,17 +230,13 @@ class ClassificationModelEndpoint(ClassificationModel):
     values are OrderedDicts sorted such that the most similar categories
     (according to the input metric) are listed first.
     """
-    descendingOrder = ("overlappingAll", "overlappingLeftRight",
-                       "overlappingRightLeft", "cosineSimilarity",
-                       "weightedScoring")
-
     categoryComparisons = defaultdict(list)
     for k, v in catDistances.iteritems():
       # Create a dict for this category
       metricDict = {compareCat: distances[metric]
                     for compareCat, distances in v.iteritems()}
       # Sort the dict by the metric
-      reverse = True if metric in descendingOrder else False
+      reverse = True if metric in _DESCENDING_METRICS else False
       categoryComparisons[k] = OrderedDict(
         sorted(metricDict.items(), key=lambda k: k[1], reverse=reverse))
 
@@ -170,6 +246,8 @@ class ClassificationModelEndpoint(ClassificationModel):
   def getCategoryDistances(self, sort=True, save=None, labelRefs=None):
     """
     Return a dict where keys are categories and values are dicts of distances.
+    All of the measures are computed from one pass over the overlaps of the
+    category bitmaps; see getCategoryDistanceMatrix() for a single metric.
 
     @param sort      (bool)        Sort the inner dicts with compareCategories()
     @param save      (str)         Dump catDistances to a JSON in this dir.
@@ -187,13 +265,23 @@ class ClassificationModelEndpoint(ClassificationModel):
               }
     Note the inner-dicts of catDistances are OrderedDict objects.
     """
+    categories, overlaps, categorySizes = self._getCategoryOverlaps()
+    sizeLeft = categorySizes[:, None]
+    sizeRight = categorySizes[None, :]
+    measures = {metric: self.compareEncoder.compareOverlaps(
+                  overlaps, sizeLeft, sizeRight, metric)
+                for metric in _OVERLAP_METRICS}
+
+    categoryList = categories.tolist()
     catDistances = defaultdict(list)
-    for cat, catBitmap in self.categoryBitmaps.iteritems():
+    for row, cat in enumerate(categoryList):
       catDistances[cat] = OrderedDict()
-      for compareCat, compareBitmap in self.categoryBitmaps.iteritems():
-        # List is in order of self.categoryBitmaps.keys()
-        catDistances[cat][compareCat] = self.compareEncoder.compare(
-          catBitmap, compareBitmap)
+      for col, compareCat in enumerate(categoryList):
+        distances = {metric: values[row, col].item()
+                     for metric, values in measures.iteritems()}
+        distances["sizeLeft"] = float(categorySizes[row])
+        distances["sizeRight"] = float(categorySizes[col])
+        catDistances[cat][compareCat] = distances
 
     if sort:
       # Order each inner dict of catDistances such that the ranking is most to
@@ -207,24 +295,100 @@ class ClassificationModelEndpoint(ClassificationModel):
     return catDistances
 
 
+  def getCategoryDistanceMatrix(self, metric="overlappingAll", save=None,
+                                labelRefs=None):
+    """
+    Return the distances between all pairs of categories, for one metric, as a
+    matrix rather than the nested dicts of getCategoryDistances().
+
+    @param metric       (str)           Distance metric to compute.
+    @param save         (str)           Dump the distances to a JSON in this
+                                        dir, with the inner dicts sorted from
+                                        most to least similar, as from
+                                        compareCategories().
+    @return categories  (numpy.array)   Labels of the rows and columns.
+    @return distances   (numpy.array)   Metric between each pair of categories
+                                        (C x C); the rows are the left bitmaps.
+    """
+    categories, overlaps, categorySizes = self._getCategoryOverlaps()
+    distances = self.compareEncoder.compareOverlaps(
+      overlaps, categorySizes[:, None], categorySizes[None, :], metric)
+
+    if save is not None:
+      self.writeOutCategories(
+        save, comparisons=self.rankCategories(categories, distances, metric),
+        labelRefs=labelRefs)
+
+    return categories, distances
+
+
+  def _getCategoryOverlaps(self):
+    """
+    Return the category labels, the overlaps of each pair of their bitmaps
+    (C x C), and the number of ON bits of each.
+    """
+    self.finalizeTraining()
+    categories, categoryIndex, categorySizes = self._getCategoryMatrix()
+    overlaps = categoryIndex.overlapsBatch(
+      [self.categoryBitmaps[cat] for cat in categories.tolist()])
+
+    return categories, overlaps, categorySizes
+
+
   @staticmethod
-  def getWinningLabels(distances, numLabels, metric):
+  def rankCategories(categories, distances, metric="overlappingAll"):
+    """
+    Return a dict where keys are categories and values are OrderedDicts of the
+    distances to each category, sorted from most to least similar; e.g. w/
+    categories 0 and 1 and metric "cosineSimilarity":
+      {
+        0: OrderedDict([(0, 1.0), (1, 0.33)]),
+        1: OrderedDict([(1, 1.0), (0, 0.33)])
+      }
+
+    @param categories   (numpy.array)   Labels of the rows and columns.
+    @param distances    (numpy.array)   C x C distances of the metric, as from
+                                        getCategoryDistanceMatrix().
+    """
+    keys = -distances if metric in _DESCENDING_METRICS else distances
+    order = numpy.argsort(keys, axis=1, kind="mergesort")
+
+    categoryList = categories.tolist()
+    return {cat: OrderedDict((categoryList[j], distances[row, j].item())
+                             for j in order[row])
+            for row, cat in enumerate(categoryList)}
+
+
+  @classmethod
+  def getWinningLabels(cls, distances, numLabels, metric):
     """
     Return indices of winning categories, based off of the input metric.
     Overrides the base class implementation.
+
+    @param distances  (dict)          Keys are categories, values are the dicts
+                                      of measures from compare().
+    """
+    return cls.winningLabels(
+      numpy.array([v[metric] for v in distances.values()]),
+      numpy.array(distances.keys()), numLabels, metric)
+
+
+  @staticmethod
+  def winningLabels(metricValues, categories, numLabels, metric):
+    """
+    Return the winning categories, based off of the values of the input metric
+    for each category.
+
+    @param metricValues (numpy.array)   Value of the metric for each category.
+    @param categories   (numpy.array)   Labels of the categories.
     """
-    metricValues = numpy.array([v[metric] for v in distances.values()])
     sortedIdx = numpy.argsort(metricValues)
 
     # euclideanDistance and jaccardDistance are ascending
-    descendingOrder = ("overlappingAll", "overlappingLeftRight",
-                       "overlappingRightLeft", "cosineSimilarity",
-                       "weightedScoring")
-    if metric in descendingOrder:
+    if metric in _DESCENDING_METRICS:
       sortedIdx = sortedIdx[::-1]
 
-    return numpy.array(
-      [distances.keys()[catIdx] for catIdx in sortedIdx[:numLabels]])
+    return categories[sortedIdx[:numLabels]]
 
 
   @staticmethod
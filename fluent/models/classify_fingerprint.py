@@ -24,7 +24,8 @@ import numpy
 from fluent.encoders.cio_encoder import CioEncoder
 from fluent.encoders import EncoderTypes
 from fluent.models.classification_model import ClassificationModel
-from nupic.algorithms.KNNClassifier import KNNClassifier
+from fluent.models.overlap_knn import OverlapKNNClassifier
+from fluent.utils.bitmap_store import compactBitmap
 
 
 
@@ -41,18 +42,27 @@ class ClassificationModelFingerprint(ClassificationModel):
                numLabels=3,
                modelDir="ClassificationModelFingerprint",
                fingerprintType=EncoderTypes.word,
-               unionSparsity=20.0):
+               unionSparsity=20.0,
+               approximate=False,
+               lshBands=32,
+               lshRows=2,
+               maxPrototypesPerLabel=None,
+               condenseMethod="union"):
+    """
+    @param approximate  (bool)    Search the prototypes with MinHash LSH,
+                                  trading recall for query latency on very
+                                  large prototype sets; see
+                                  OverlapKNNClassifier for the LSH parameters.
+    @param maxPrototypesPerLabel (int)  Condense the prototypes of each label
+                                  to this budget after training; see
+                                  OverlapKNNClassifier.condense().
+    """
 
     super(ClassificationModelFingerprint, self).__init__(
       verbosity=verbosity, numLabels=numLabels, modelDir=modelDir)
 
-    # Init kNN classifier and Cortical.io encoder; need valid API key (see
+    # Init Cortical.io encoder and kNN classifier; need valid API key (see
     # CioEncoder init for details).
-    self.classifier = KNNClassifier(k=numLabels,
-                                    distanceMethod='rawOverlap',
-                                    exact=False,
-                                    verbosity=verbosity-1)
-
     if fingerprintType is (not EncoderTypes.document or not EncoderTypes.word):
       raise ValueError("Invaid type of fingerprint encoding; see the "
                        "EncoderTypes class for eligble types.")
@@ -62,6 +72,17 @@ class ClassificationModelFingerprint(ClassificationModel):
     self.n = self.encoder.n
     self.w = int((self.encoder.targetSparsity/100)*self.n)
 
+    self.classifier = OverlapKNNClassifier(k=numLabels,
+                                           n=self.n,
+                                           exact=False,
+                                           approximate=approximate,
+                                           lshBands=lshBands,
+                                           lshRows=lshRows,
+                                           maxPrototypesPerLabel=
+                                             maxPrototypesPerLabel,
+                                           condenseMethod=condenseMethod,
+                                           verbosity=verbosity-1)
+
 
   def encodeSample(self, sample):
     """
@@ -83,7 +104,7 @@ class ClassificationModelFingerprint(ClassificationModel):
     if fpInfo:
       fp = {"text":fpInfo["text"] if "text" in fpInfo else fpInfo["term"],
             "sparsity":fpInfo["sparsity"],
-            "bitmap":numpy.array(fpInfo["fingerprint"]["positions"])}
+            "bitmap":compactBitmap(fpInfo["fingerprint"]["positions"], self.n)}
     else:
       fp = {"text":sample,
             "sparsity":float(self.w)/self.n,
@@ -93,17 +114,24 @@ class ClassificationModelFingerprint(ClassificationModel):
 
 
   def trainModel(self, i):
-    # TODO: add batch training, where i is a list
     """
-    Train the classifier on the sample and labels for record i. The list
+    Train the classifier on the samples and labels for record i, or for each of
+    the records if i is a list of indices; the prototypes are added in bulk.
+    Each sample is stored as one prototype with all of its labels. The list
     sampleReference is populated to correlate classifier prototypes to sample
     IDs.
     """
-    bitmap = self.patterns[i]["pattern"]["bitmap"]
-    if bitmap.any():
-      for label in self.patterns[i]["labels"]:
-        self.classifier.learn(bitmap, label, isSparse=self.n)
-        self.sampleReference.append(self.patterns[i]["ID"])
+    bitmaps = []
+    labels = []
+    for index in numpy.atleast_1d(i):
+      bitmap = self.patterns[index]["pattern"]["bitmap"]
+      if bitmap.any() and len(self.patterns[index]["labels"]):
+        bitmaps.append(bitmap)
+        labels.append(self.patterns[index]["labels"])
+        self.sampleReference.append(self.patterns[index]["ID"])
+
+    self.classifier.learnBatch(bitmaps, labels)
+    self.condensePrototypes()
 
 
   def testModel(self, i, numLabels=3):
@@ -114,6 +142,22 @@ class ClassificationModelFingerprint(ClassificationModel):
     @return           (numpy array)   numLabels most-frequent classifications
                                       for the data samples; int or empty.
     """
-    (_, inferenceResult, _, _) = self.classifier.infer(
-      self.sparsifyPattern(self.patterns[i]["pattern"]["bitmap"], self.n))
+    (_, inferenceResult) = self.classifier.infer(
+      self.patterns[i]["pattern"]["bitmap"])
     return self.getWinningLabels(inferenceResult, numLabels)
+
+
+  def testModelBatch(self, indices, numLabels=3):
+    """
+    Test the model on each of the records, scoring them all against the
+    prototypes at once.
+
+    @param indices    (list)          Indices of the records to test.
+    @param numLabels  (int)           Number of classification predictions.
+    @return           (list)          Numpy arrays of the numLabels
+                                      most-frequent classifications for each
+                                      record; int or empty.
+    """
+    inferenceResults = self.classifier.inferBatch(
+      [self.patterns[i]["pattern"]["bitmap"] for i in indices])
+    return self.getWinningLabelsBatch(inferenceResults, numLabels)
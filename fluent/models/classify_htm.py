@@ -23,18 +23,39 @@ import cPickle as pkl
 import numpy
 import operator
 import os
+import time
 
 from classification_network import configureNetwork
 from fluent.encoders.cio_encoder import CioEncoder
+from fluent.encoders.token_table_encoder import TokenTableEncoder
 from fluent.models.classification_model import ClassificationModel
+from fluent.utils.memory_record_stream import MemoryRecordStream
 from fluent.utils.network_data_generator import NetworkDataGenerator
 from nupic.data.file_record_stream import FileRecordStream
+from nupic.engine import Network
+
+try:
+  import simplejson as json
+except ImportError:
+  import json
+
+
+
+# Configs of the regions that can learn, in the order they are staged.
+REGION_CONFIGS = ("spRegionConfig", "tmRegionConfig", "upRegionConfig",
+                  "classifierRegionConfig")
 
 
 
 class ClassificationModelHTM(ClassificationModel):
   """
   Class to run the survey response classification task with nupic network.
+
+  A saved model is a directory with the network in its native format
+  ("network.nta"), the pristine region states that resets restore
+  ("snapshot.pkl"), and JSON of the model parameters, encoder config, and data
+  generator state. ClassificationModelHTM.load() reads the JSON, and only
+  deserializes the network and the snapshot when they are first used.
   """
 
   def __init__(self,
@@ -44,15 +65,25 @@ class ClassificationModelHTM(ClassificationModel):
                numLabels=3,
                modelDir="ClassificationModelHTM",
                prepData=True,
-               stripCats=False):
+               stripCats=False,
+               inMemory=False,
+               tokenTable=True):
     """
     @param networkConfig      (str)     Path to JSON of network configuration,
                                         with region parameters.
-    @param inputFilePath      (str)     Path to data file.
+    @param inputFilePath      (str)     Path to data file. Without prepData,
+                                        this can also be a record stream of
+                                        network data, e.g. MemoryRecordStream.
     @param prepData           (bool)    Prepare the input data into network API
                                         format.
     @param stripCats          (bool)    Remove the categories and replace them
                                         with the sequence_Id.
+    @param inMemory           (bool)    Keep the prepared data in memory rather
+                                        than writing a network data file.
+    @param tokenTable         (bool)    Encode the tokens of the data once, up
+                                        front, into a table that the sensor
+                                        region looks their SDRs up in, instead
+                                        of encoding each token as it streams.
     See ClassificationModel for remaining parameters.
     """
 
@@ -63,22 +94,59 @@ class ClassificationModelHTM(ClassificationModel):
 
     if prepData:
       self.networkDataPath, self.networkDataGen = self.prepData(
-        inputFilePath, stripCats=stripCats)
+        inputFilePath, stripCats=stripCats, inMemory=inMemory)
     else:
       self.networkDataPath = inputFilePath
       self.networkDataGen = None
 
-    self.network = self.initModel()
-    self.learningRegions = self._getLearningRegions()
+    # Keyword args of the CioEncoder the sensor region encodes tokens with.
+    self.encoderConfig = {"cacheDir": "./experiments/cache"}
+    self.tokenTable = tokenTable
+    # Seconds spent loading each part of a saved model, from load().
+    self.loadTimes = {}
+
+    self._network = self.initModel()
+    self._learningRegions = None
+    self._snapshotPath = None
+
+    # The regions' algorithms are created when the network is initialized, so
+    # initialize it before capturing the pristine state that resets restore.
+    self.network.initialize()
+    self._snapshot = self._takeSnapshot()
+    # The phase the regions are set for (see setPhase()), if known.
+    self._phase = None
+
+
+  @property
+  def network(self):
+    """The network, deserialized on first use if the model was loaded."""
+    if self._network is None:
+      self._loadNetwork()
+    return self._network
+
+
+  @property
+  def learningRegions(self):
+    if self._learningRegions is None:
+      self._learningRegions = self._getLearningRegions()
+    return self._learningRegions
 
-    # Always a sensor and classifier region.
-    self.sensorRegion = self.network.regions[
+
+  # Always a sensor and classifier region.
+  @property
+  def sensorRegion(self):
+    return self.network.regions[
       self.networkConfig["sensorRegionConfig"].get("regionName")]
-    self.classifierRegion = self.network.regions[
+
+
+  @property
+  def classifierRegion(self):
+    return self.network.regions[
       self.networkConfig["classifierRegionConfig"].get("regionName")]
 
 
-  def prepData(self, dataPath, ordered=False, stripCats=False, **kwargs):
+  def prepData(self, dataPath, ordered=False, stripCats=False, inMemory=False,
+               **kwargs):
     """
     Generate the data in network API format.
 
@@ -87,12 +155,15 @@ class ClassificationModelHTM(ClassificationModel):
     @param ordered           (bool) Keep order of data, or randomize.
     @param stripCats         (bool) Remove the categories and replace them with
                                     the sequence_Id.
-    @return networkDataPath  (str)  Path to data formtted for network API.
+    @param inMemory          (bool) Return a MemoryRecordStream of the data
+                                    instead of writing it to a file.
+    @return networkDataPath  (str)  Path to data formtted for network API, or
+                                    the MemoryRecordStream.
     @return ndg              (NetworkDataGenerator)
     """
     ndg = NetworkDataGenerator()
     networkDataPath = ndg.setupData(
-      dataPath, self.numLabels, ordered, stripCats, **kwargs)
+      dataPath, self.numLabels, ordered, stripCats, inMemory=inMemory, **kwargs)
 
     return networkDataPath, ndg
 
@@ -101,12 +172,40 @@ class ClassificationModelHTM(ClassificationModel):
     """
     Initialize the network; self.networdDataPath must already be set.
     """
-    recordStream = FileRecordStream(streamID=self.networkDataPath)
-    encoder = CioEncoder(cacheDir="./experiments/cache")
+    recordStream = self._openRecordStream(self.networkDataPath)
+    encoder = CioEncoder(**self.encoderConfig)
+    if self.tokenTable:
+      encoder = TokenTableEncoder(encoder,
+                                  self._readTokens(self.networkDataPath))
 
     return configureNetwork(recordStream, self.networkConfig, encoder)
 
 
+  @staticmethod
+  def _readTokens(networkData):
+    """Return the tokens of the network data, given its path or stream."""
+    if networkData is None:
+      return []
+    if isinstance(networkData, basestring):
+      return NetworkDataGenerator.getTokens(networkData)
+    return networkData.tokens
+
+
+  @staticmethod
+  def _openRecordStream(networkData):
+    """
+    Return a record stream at the start of the network data, given its path
+    or an (in-memory) record stream; with no data, the stream is empty.
+    """
+    if networkData is None:
+      return MemoryRecordStream([], [], [], [])
+    if isinstance(networkData, basestring):
+      return FileRecordStream(streamID=networkData)
+
+    networkData.rewind()
+    return networkData
+
+
   def _getLearningRegions(self):
     """Return tuple of the network's region objects that learn."""
     learningRegions = []
@@ -142,44 +241,275 @@ class ClassificationModelHTM(ClassificationModel):
              "bitmap": None} for t in sample]
 
 
-  def resetModel(self):
+  def _takeSnapshot(self):
     """
-    Reset the model by creating a new network since the network API does not
-    support resets.
+    Return the state of each learning region, serialized, keyed by region
+    name. The sensor isn't included; it holds the encoder and data source.
+    A region's state is None if it can't be restored in place, i.e. its
+    implementation doesn't define __getstate__ and __setstate__, or the state
+    doesn't pickle; resetModel() then builds a new network instead.
     """
-    # TODO: test this works as expected
-    self.network = self.initModel()
+    snapshot = {}
+    for region in self.learningRegions:
+      impl = region.getSelf()
+      snapshot[region.name] = None
+      if hasattr(impl, "__getstate__") and hasattr(impl, "__setstate__"):
+        try:
+          snapshot[region.name] = pkl.dumps(impl.__getstate__(),
+                                            pkl.HIGHEST_PROTOCOL)
+        except (pkl.PicklingError, TypeError):
+          if self.verbosity > 0:
+            print ("The state of region {} can't be pickled; the network "
+                   "will be rebuilt on reset.".format(region.name))
+
+    return snapshot
+
+
+  def _getSnapshot(self):
+    """Return the snapshot, reading it from the saved model if necessary."""
+    if self._snapshot is None:
+      start = time.time()
+      with open(self._snapshotPath, "rb") as f:
+        self._snapshot = pkl.load(f)
+      self.loadTimes["snapshot"] = time.time() - start
+
+    return self._snapshot
+
+
+  def _restoreSnapshot(self, snapshot):
+    """Restore the learning regions to the states in the snapshot."""
+    for name, serialized in snapshot.iteritems():
+      self.network.regions[name].getSelf().__setstate__(pkl.loads(serialized))
+
+
+  def _rebuildNetwork(self):
+    """Replace the network with a new one, built from the model's config."""
+    self._network = self.initModel()
+    self._learningRegions = None
+    self.network.initialize()
+
+
+  def resetModel(self, networkDataPath=None):
+    """
+    Reset the model by restoring the learning regions to the snapshot taken
+    when the network was built, and rewinding the sensor's data, instead of
+    building a new network (the network API does not support resets). If a
+    region's state couldn't be snapshot, a new network is built after all.
+
+    @param networkDataPath  (str)   Path to network data, or a record stream
+                                    of it, to read from now on; by default the
+                                    current data is rewound.
+    """
+    snapshot = self._getSnapshot()
+    rebuild = None in snapshot.values()
+    sensor = self.sensorRegion.getSelf()
+    isNewData = (networkDataPath is not None and
+                 networkDataPath != self.networkDataPath)
+    if isNewData:
+      self.networkDataPath = networkDataPath
+    if isNewData or (rebuild and isinstance(self.networkDataPath, basestring)):
+      # Don't leak the file handle of each trial's data.
+      sensor.dataSource.close()
+
+    if rebuild:
+      self._rebuildNetwork()
+    else:
+      self._restoreSnapshot(snapshot)
+      if isNewData:
+        sensor.dataSource = self._openRecordStream(networkDataPath)
+        if isinstance(sensor.encoder, TokenTableEncoder):
+          sensor.encoder.addTokens(self._readTokens(networkDataPath))
+      else:
+        sensor.dataSource.rewind()
+      sensor.queue.clear()
+    self._phase = None
 
 
   def saveModel(self):
-    # TODO: test this works
-    #   use self.network.save()?
+    """
+    Save the model to self.modelDir: the network in its native format, the
+    snapshot of the pristine regions, and JSON of everything else. Network
+    data held in memory isn't saved.
+    """
     try:
       if not os.path.exists(self.modelDir):
         os.makedirs(self.modelDir)
-      networkPath = os.path.join(self.modelDir, "network.nta")
-      # self.network = networkPath
-      with open(networkPath, "wb") as f:
-        pkl.dump(self, f)
+
+      self.network.save(os.path.join(self.modelDir, "network.nta"))
+
+      snapshot = self._getSnapshot()
+      with open(os.path.join(self.modelDir, "snapshot.pkl"), "wb") as f:
+        pkl.dump(snapshot, f, pkl.HIGHEST_PROTOCOL)
+
+      networkDataPath = (self.networkDataPath
+                         if isinstance(self.networkDataPath, basestring)
+                         else None)
+      with open(os.path.join(self.modelDir, "model.json"), "w") as f:
+        json.dump({"networkConfig": self.networkConfig,
+                   "networkDataPath": networkDataPath,
+                   "encoderConfig": self.encoderConfig,
+                   "tokenTable": self.tokenTable,
+                   "numLabels": self.numLabels}, f, indent=2)
+
+      if self.tokenTable:
+        with open(os.path.join(self.modelDir, "token_table.pkl"), "wb") as f:
+          pkl.dump(self.sensorRegion.getSelf().encoder, f,
+                   pkl.HIGHEST_PROTOCOL)
+
+      if self.networkDataGen is not None:
+        with open(os.path.join(self.modelDir, "data_generator.json"), "w") as f:
+          json.dump({"categoryToId": dict(self.networkDataGen.categoryToId),
+                     "sequenceCount": self.networkDataGen.sequenceCount},
+                    f, indent=2)
+
+      self.modelPath = self.modelDir
       if self.verbosity > 0:
-        print "Model saved to \'{}\'.".format(networkPath)
+        print "Model saved to \'{}\'.".format(self.modelDir)
     except IOError as e:
-      print "Could not save model to \'{}\'.".format(networkPath)
+      print "Could not save model to \'{}\'.".format(self.modelDir)
       raise e
 
 
+  @classmethod
+  def load(cls, modelDir, verbosity=1):
+    """
+    Return the model saved in modelDir by saveModel(). Only the JSON files are
+    read now; the network is deserialized when it's first used, and the
+    snapshot when the model is first reset. The seconds spent on each are in
+    model.loadTimes.
+
+    @param modelDir   (str)                     Directory of the saved model.
+    @return           (ClassificationModelHTM)
+    """
+    start = time.time()
+    with open(os.path.join(modelDir, "model.json"), "r") as f:
+      config = json.load(f)
+
+    model = cls.__new__(cls)
+    ClassificationModel.__init__(model, verbosity=verbosity,
+                                 numLabels=config["numLabels"],
+                                 modelDir=modelDir)
+    model.modelPath = modelDir
+    model.networkConfig = config["networkConfig"]
+    model.networkDataPath = config["networkDataPath"]
+    model.encoderConfig = config["encoderConfig"]
+    model.tokenTable = config.get("tokenTable", False)
+
+    model.networkDataGen = None
+    generatorPath = os.path.join(modelDir, "data_generator.json")
+    if os.path.exists(generatorPath):
+      with open(generatorPath, "r") as f:
+        generatorState = json.load(f)
+      model.networkDataGen = NetworkDataGenerator()
+      model.networkDataGen.categoryToId.update(generatorState["categoryToId"])
+      model.networkDataGen.sequenceCount = generatorState["sequenceCount"]
+
+    model._network = None
+    model._learningRegions = None
+    model._snapshot = None
+    model._snapshotPath = os.path.join(modelDir, "snapshot.pkl")
+    model._phase = None
+    model.loadTimes = {"model": time.time() - start}
+
+    if verbosity > 0:
+      print "Model loaded from \'{0}\' in {1:.3f} seconds.".format(
+        modelDir, model.loadTimes["model"])
+    return model
+
+
+  def _loadNetwork(self):
+    """
+    Deserialize the saved network, and give its sensor region a new encoder
+    and data source, which aren't part of the serialized network.
+    """
+    start = time.time()
+    self._network = Network(os.path.join(self.modelDir, "network.nta"))
+
+    sensor = self.sensorRegion.getSelf()
+    sensor.encoder = CioEncoder(**self.encoderConfig)
+    if self.tokenTable:
+      # The table's encoder only encodes tokens that aren't in it yet.
+      with open(os.path.join(self.modelDir, "token_table.pkl"), "rb") as f:
+        table = pkl.load(f)
+      table.encoder = sensor.encoder
+      sensor.encoder = table
+    sensor.dataSource = self._openRecordStream(self.networkDataPath)
+    self._network.initialize()
+
+    self.loadTimes["network"] = time.time() - start
+    if self.verbosity > 0:
+      print "Network loaded in {0:.3f} seconds.".format(
+        self.loadTimes["network"])
+
+
   def trainModel(self, iterations=1):
     """
-    Run the network with all regions learning.
+    Run the network with all regions learning, or the regions of the current
+    training phase (see setPhase()).
     Note self.sampleReference doesn't get populated b/c in a network model
     there's a 1-to-1 mapping of training samples.
     """
-    for region in self.learningRegions:
-      region.setParameter("learningMode", True)
-
+    if self._phase is None or not self._phase.startswith("train"):
+      self.setPhase("train")
     self.network.run(iterations)
 
 
+  def getTrainingPhases(self):
+    """
+    Return the names of the staged training phases, one for each learning
+    region in the order of REGION_CONFIGS, e.g. ["train-sp", "train-tm",
+    "train-classifier"]. In each phase, that region begins learning, and the
+    regions before it keep learning.
+    """
+    learningNames = set(region.name for region in self.learningRegions)
+    phases = []
+    for configName in REGION_CONFIGS:
+      config = self.networkConfig.get(configName) or {}
+      if (config.get("regionEnabled", True) and
+          config.get("regionName") in learningNames):
+        phases.append("train-" + configName[:-len("RegionConfig")].lower())
+
+    return phases
+
+
+  def _getPhaseLearners(self, phase):
+    """Return the names of the regions that learn in the phase."""
+    if phase == "infer":
+      return set()
+    if phase == "train":
+      return set(region.name for region in self.learningRegions)
+
+    phases = self.getTrainingPhases()
+    if phase not in phases:
+      raise ValueError("Phase must be \'train\', \'infer\', or one of "
+                       "{}.".format(phases))
+
+    learners = set()
+    for configName in REGION_CONFIGS:
+      config = self.networkConfig.get(configName) or {}
+      learners.add(config.get("regionName"))
+      if phase == "train-" + configName[:-len("RegionConfig")].lower():
+        return learners
+
+
+  def setPhase(self, phase):
+    """
+    Configure the regions for a phase, unless they already are: "train" for
+    all of the learning regions to learn, "infer" for none to learn and the
+    classifier to infer, or one of getTrainingPhases() for staged learning.
+
+    @param phase      (str)           Name of the phase.
+    """
+    if phase == self._phase:
+      return
+
+    learners = self._getPhaseLearners(phase)
+    for region in self.learningRegions:
+      region.setParameter("learningMode", region.name in learners)
+    self.classifierRegion.setParameter("inferenceMode", phase == "infer")
+    self._phase = phase
+
+
   def testModel(self, numLabels=3):
     """
     Test the classifier region on the input sample. Call this method for each
@@ -189,15 +519,47 @@ class ClassificationModelHTM(ClassificationModel):
     @return           (numpy array)   numLabels most-frequent classifications
                                       for the data samples; int or empty.
     """
-    for region in self.learningRegions:
-      region.setParameter("learningMode", False)
-    self.classifierRegion.setParameter("inferenceMode", True)
-
+    self.setPhase("infer")
     self.network.run(1)
 
     return self._getClassifierInference()
 
 
+  def testSequence(self, numTokens, collectAll=True):
+    """
+    Test the classifier region on the next sequence of the input data, with
+    the regions set to infer once for the whole sequence.
+
+    The network API only exposes the outputs of the last iteration of a run,
+    so collecting the output of every token still runs the network one token
+    at a time; only the last token's output comes from a single run.
+
+    @param numTokens  (int)           Number of tokens in the sequence.
+    @param collectAll (bool)          Return the classifier output of every
+                                      token, running the network once per
+                                      token; otherwise the network runs the
+                                      sequence in one call, and only the last
+                                      token's output is returned.
+    @return           (numpy array)   Classifier outputs ("categoriesOut") for
+                                      the categories; rows are tokens.
+    """
+    self.setPhase("infer")
+    numCategories = self.classifierRegion.getParameter("categoryCount")
+
+    if not collectAll:
+      self.network.run(numTokens)
+      return numpy.array(self.classifierRegion.getOutputData(
+        "categoriesOut")[:numCategories], ndmin=2)
+
+    outputs = numpy.zeros((numTokens, numCategories))
+    for i in xrange(numTokens):
+      self.network.run(1)
+      outputs[i] = self.classifierRegion.getOutputData(
+        "categoriesOut")[:numCategories]
+
+    return outputs
+
+
   def _getClassifierInference(self):
     """Return output categories from the classifier region."""
     relevantCats = self.classifierRegion.getParameter("categoryCount")
@@ -214,6 +576,20 @@ class ClassificationModelHTM(ClassificationModel):
       return self.classifierRegion.getOutputData("categoriesOut")[:relevantCats]
 
 
+  def resetSequenceStates(self):
+    """
+    Clear the temporal state of the network, i.e. the sensor's queue of
+    records and the sequence state of each region that has one, such as the
+    temporal memory and union pooler regions, without changing what the
+    network has learned.
+    """
+    self.sensorRegion.getSelf().queue.clear()
+
+    for region in self.network.regions.values():
+      if hasattr(region.getSelf(), "resetSequenceStates"):
+        region.executeCommand(["resetSequenceStates"])
+
+
   def queryModel(self, query, preprocess=False):
     """
     Run the query through the network, getting the classifer region's inferences
@@ -221,26 +597,19 @@ class ClassificationModelHTM(ClassificationModel):
     @return       (list)          Two-tuples of sequence ID and distance, sorted
                                   closest to farthest from the query.
     """
-    for region in self.learningRegions:
-      region.setParameter("learningMode", False)
-    self.classifierRegion.setParameter("inferenceMode", True)
+    # Each query is a new sequence.
+    self.resetSequenceStates()
 
-    # Put query text in LanguageSensor data format.
+    # Put query text in LanguageSensor data format; the sensor reads its queue
+    # first in, first out.
     queryDicts = self.networkDataGen.generateSequence(query, preprocess)
-
-    sampleDistances = None
     sensor = self.sensorRegion.getSelf()
-    for qD in queryDicts:
-      # Sum together the inferred distances for each word of the query sequence.
-      sensor.queue.appendleft(qD)
-      self.network.run(1)
-      inferenceValues = self.classifierRegion.getOutputData("categoriesOut")
-      if sampleDistances is None:
-        sampleDistances = inferenceValues
-      else:
-        sampleDistances += inferenceValues
+    sensor.queue.extendleft(queryDicts)
+
+    # Sum together the inferred distances for each word of the query sequence.
+    sampleDistances = self.testSequence(len(queryDicts)).sum(axis=0)
 
-    catCount = self.classifierRegion.getParameter("categoryCount")
+    catCount = sampleDistances.size
     # The use of numpy.lexsort() here is to first sort by labelFreq, then sort
     # by random values; this breaks ties in a random manner.
     randomValues = numpy.random.random(catCount)
@@ -24,7 +24,7 @@ import numpy
 import os
 
 from fluent.models.classification_model import ClassificationModel
-from nupic.algorithms.KNNClassifier import KNNClassifier
+from fluent.models.overlap_knn import OverlapKNNClassifier
 
 try:
   import simplejson as json
@@ -51,10 +51,13 @@ class ClassificationModelKeywords(ClassificationModel):
     super(ClassificationModelKeywords, self).__init__(
       n, w, verbosity=verbosity, numLabels=numLabels, modelDir=modelDir)
 
-    self.classifier = KNNClassifier(exact=True,
-                                    distanceMethod="rawOverlap",
-                                    k=numLabels,
-                                    verbosity=verbosity-1)
+    self.classifier = OverlapKNNClassifier(k=numLabels,
+                                           n=self.n,
+                                           exact=True,
+                                           verbosity=verbosity-1)
+    # Prototype ID of each token occurrence trained on, aligned with
+    # sampleReference.
+    self._occurrencePrototypes = []
 
 
   def encodeSample(self, sample):
@@ -96,18 +99,37 @@ class ClassificationModelKeywords(ClassificationModel):
 
 
   def trainModel(self, i):
-    # TODO: add batch training, where i is a list
     """
-    Train the classifier on the sample and labels for record i. The list
-    sampleReference is populated to correlate classifier prototypes to sample
-    IDs. This model is unique in that a single sample contains multiple encoded
+    Train the classifier on the samples and labels for record i, or for each of
+    the records if i is a list of indices; the prototypes are added in bulk.
+    Each distinct token is stored as one prototype, shared by all of its
+    occurrences, that counts the labels of the samples it occurred in. The list
+    sampleReference is populated to correlate token occurrences to sample IDs.
+    This model is unique in that a single sample contains multiple encoded
     patterns.
     """
-    for token in self.patterns[i]["pattern"]:
-      if token["bitmap"].any():
-        for label in self.patterns[i]["labels"]:
-          self.classifier.learn(token["bitmap"], label, isSparse=self.n)
-          self.sampleReference.append(self.patterns[i]["ID"])
+    tokens = []
+    bitmaps = []
+    labels = []
+    for index in numpy.atleast_1d(i):
+      recordLabels = self.patterns[index]["labels"]
+      if not len(recordLabels):
+        continue
+      for token in self.patterns[index]["pattern"]:
+        if token["bitmap"].any():
+          tokens.append(token["text"])
+          bitmaps.append(token["bitmap"])
+          labels.append(recordLabels)
+          self.sampleReference.append(self.patterns[index]["ID"])
+
+    self._occurrencePrototypes.extend(
+      self.classifier.learnShared(tokens, bitmaps, labels).tolist())
+
+
+  def resetModel(self):
+    """Reset the model by clearing the classifier."""
+    super(ClassificationModelKeywords, self).resetModel()
+    self._occurrencePrototypes = []
 
 
   def testModel(self, i, numLabels=3):
@@ -121,38 +143,58 @@ class ClassificationModelKeywords(ClassificationModel):
     @return           (numpy array)   numLabels most-frequent classifications
                                       for the data samples; int or empty.
     """
-    totalInferenceResult = None
-    for pattern in self.patterns[i]["pattern"]:
-      if not pattern:
-        continue
-
-      (_, inferenceResult, _, _) = self.classifier.infer(
-        self.sparsifyPattern(pattern["bitmap"], self.n))
+    bitmaps = [pattern["bitmap"] for pattern in self.patterns[i]["pattern"]
+               if pattern]
+    if not bitmaps:
+      return self.getWinningLabels(None, numLabels)
 
-      if totalInferenceResult is None:
-        totalInferenceResult = inferenceResult
-      else:
-        totalInferenceResult += inferenceResult
+    # Score all of the tokens at once, and sum their inference results.
+    totalInferenceResult = self.classifier.inferBatch(bitmaps).sum(axis=0)
 
     return self.getWinningLabels(totalInferenceResult, numLabels)
 
 
+  def testModelBatch(self, indices, numLabels=3):
+    """
+    Test the model on each of the records, scoring the tokens of all the
+    records against the prototypes at once and summing the inference results
+    of each record's tokens.
+
+    @param indices    (list)          Indices of the records to test.
+    @param numLabels  (int)           Number of classification predictions.
+    @return           (list)          Numpy arrays of the numLabels
+                                      most-frequent classifications for each
+                                      record; int or empty.
+    """
+    bitmaps = []
+    rows = []
+    for row, i in enumerate(indices):
+      for pattern in self.patterns[i]["pattern"]:
+        if pattern:
+          bitmaps.append(pattern["bitmap"])
+          rows.append(row)
+
+    tokenResults = self.classifier.inferBatch(bitmaps)
+    inferenceResults = numpy.zeros((len(indices), tokenResults.shape[1]))
+    numpy.add.at(inferenceResults, rows, tokenResults)
+
+    return self.getWinningLabelsBatch(inferenceResults, numLabels)
+
+
   def infer(self, patterns):
     """
     Get the classifier output for a single input pattern; assumes classifier
     has an infer() method (as specified in NuPIC kNN implementation). For this
-    model we sum the distances across the patterns. and normalize
-    before returning.
+    model we average the distances across the patterns, which are all scored
+    against the prototypes at once.
     @return       (numpy.array)       Each entry is the distance from the
-        input pattern to that prototype (pattern in the classifier). All
-        distances are between 0.0 and 1.0
+        input pattern to the prototype of that token occurrence (aligned with
+        sampleReference). All distances are between 0.0 and 1.0
     """
-    # TODO: implement getNumPatterns() method in classifier.
-    distances = numpy.zeros((self.classifier._numPatterns))
-    for i, p in enumerate(patterns):
-      (_, _, dist, _) = self.classifier.infer(
-        self.sparsifyPattern(p["bitmap"], self.n))
+    if not patterns:
+      return numpy.zeros(len(self._occurrencePrototypes))
 
-      distances = numpy.array([sum(x) for x in zip(dist, distances)])
+    distances = self.classifier.getDistancesBatch(
+      [p["bitmap"] for p in patterns])
 
-    return distances / (i+1)
+    return distances.mean(axis=0)[self._occurrencePrototypes]
@@ -19,40 +19,119 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
-import math
 import numpy
+import zlib
 
 from collections import Counter, defaultdict
 from fluent.models.classification_model import ClassificationModel
+from fluent.utils.overlap_index import raggedIndices
 
 
 
 class ClassificationModelTraditional(ClassificationModel):
   """
   Class to run the survey response classification task with TFIDF
+
+  The tfidf weights are held as a sparse class x term matrix over a term-id
+  vocabulary, stored by term (the classes and weights of each term are
+  contiguous), with precomputed class norms, so the cosine similarities of
+  many samples to all of the classes are one sparse product.
+
+  With hashBits, the vocabulary is replaced by the hashing trick: tokens are
+  hashed into 2^hashBits buckets, each with a random sign, so the tf and df
+  tables are fixed-size arrays however many distinct tokens (typos, names,
+  etc.) the samples have. The tfidf matrix then only stores the buckets with
+  nonzero weights, in sorted order, in place of term IDs.
   """
 
-  def __init__(self, verbosity=1, numLabels=3):
+  hashBits = None
+
+  def __init__(self, verbosity=1, numLabels=3, hashBits=None):
+    """
+    @param hashBits   (int)     If given, hash the tokens into 2^hashBits
+                                signed buckets instead of keeping a vocabulary;
+                                at most 20, as each class keeps a float32 tf
+                                table of all the buckets.
+    """
     super(ClassificationModelTraditional, self).__init__(verbosity)
 
-    # class -> {term -> count}
-    self.tf = defaultdict(Counter)
+    if hashBits is not None and not 1 <= hashBits <= 20:
+      raise ValueError("hashBits must be between 1 and 20.")
+    self.hashBits = hashBits
+
     # class -> number of terms total
     self.counts = Counter()
-    # term -> document count
-    self.df = Counter()
     # number of documents total
     self.num_docs = 0
-    # term -> log(num_docs / df)
-    self.idf = defaultdict(float)
-    # class -> {term -> tf * idf}
-    self.tfidf = defaultdict(lambda : defaultdict(float))
-    # class -> norm of tfidf
-    self.norms = defaultdict(float)
+    self._clearCounts()
+    # whether the tfidf matrix is out of date with the counts
+    self._isStale = False
+    self._clearMatrix()
 
     self.numLabels = numLabels
 
 
+  def _clearCounts(self):
+    if self.hashBits is None:
+      # class -> {term -> count}
+      self.tf = defaultdict(Counter)
+      # term -> document count
+      self.df = Counter()
+      # term -> term ID, in order of first occurrence
+      self.vocabulary = {}
+    else:
+      # class -> signed count of each bucket
+      self.tf = {}
+      # document count of each bucket
+      self.df = numpy.zeros(2**self.hashBits, dtype=numpy.float32)
+
+
+  def _clearMatrix(self):
+    numBuckets = 0 if self.hashBits is None else 2**self.hashBits
+    # log(num_docs / df) of each term ID (bucket)
+    self._idf = numpy.zeros(numBuckets, dtype=numpy.float32)
+    # labels of the matrix rows, in sorted order, and the norm of each row
+    self._classes = []
+    self._classNorms = numpy.zeros(0)
+    # nonzero tf * idf weights of the matrix, grouped by term ID: the entries
+    # of term t are [_termStarts[t], _termStarts[t+1])
+    self._termStarts = numpy.zeros(1, dtype=numpy.int64)
+    self._termClasses = numpy.zeros(0, dtype=numpy.int64)
+    self._termWeights = numpy.zeros(0)
+    # with hashBits, the bucket of each term ID of the matrix
+    self._termBuckets = numpy.zeros(0, dtype=numpy.int64)
+
+
+  def __getstate__(self):
+    # Don't pickle the tfidf matrix; it is recomputed from the counts.
+    state = self.__dict__.copy()
+    for name in ("_idf", "_classes", "_classNorms", "_termStarts",
+                 "_termClasses", "_termWeights", "_termBuckets"):
+      state.pop(name, None)
+    state["_isStale"] = True
+    return state
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._clearMatrix()
+
+
+  def _hashTokens(self, tokens):
+    """
+    Return the bucket and sign of each token, from its CRC-32: the low
+    hashBits bits are the bucket, and the high bit the sign.
+    """
+    hashes = numpy.array(
+      [zlib.crc32(token.encode("utf-8") if isinstance(token, unicode)
+                  else token) & 0xffffffff for token in tokens],
+      dtype=numpy.int64)
+    buckets = hashes & (2**self.hashBits - 1)
+    signs = 1.0 - 2 * (hashes >> 31)
+
+    return buckets, signs
+
+
   def encodePattern(self, sample):
     """
     Encode an SDR of the input string into an empty array
@@ -74,18 +153,18 @@ class ClassificationModelTraditional(ClassificationModel):
 
   def resetModel(self):
     """Reset the model by clearing the classifier."""
-    self.tf.clear()
     self.counts.clear()
-    self.df.clear()
     self.num_docs = 0
-    self.idf.clear()
-    self.tfidf.clear()
-    self.norms.clear()
+    self._clearCounts()
+    self._clearMatrix()
+    self._isStale = False
 
 
   def trainModel(self, samples, labels):
     """
-    Train the classifier on the input sample and label.
+    Train the classifier on the input sample and label. Only the tf and df
+    counts are updated; the tfidf matrix is computed by finalizeTraining(),
+    which runs before the next test.
 
     @param samples     (dictionary)      Dictionary, containing text, sparsity,
     and bitmap
@@ -97,9 +176,25 @@ class ClassificationModelTraditional(ClassificationModel):
       self.num_docs += 1
 
       text = sample["text"]
+      if self.hashBits is not None:
+        buckets, signs = self._hashTokens(text)
+        # Only want a bucket to count once in a document
+        self.df[numpy.unique(buckets)] += 1
+
+        for label in sample_labels:
+          if label not in self.tf:
+            self.tf[label] = numpy.zeros(2**self.hashBits,
+                                         dtype=numpy.float32)
+          numpy.add.at(self.tf[label], buckets, signs)
+
+          self.counts[label] += len(text)
+        continue
+
       for token in set(text):
         # Only want a token to count once in a document
         self.df[token] += 1
+        if token not in self.vocabulary:
+          self.vocabulary[token] = len(self.vocabulary)
 
       for label in sample_labels:
         for token in text:
@@ -107,27 +202,86 @@ class ClassificationModelTraditional(ClassificationModel):
 
         self.counts[label] += len(text)
 
-    # Dependent on number of documents so need to reset every time
-    # Best to use batch training
-    # Convert to idf
-    self.idf.clear()
-    for token, count in self.df.iteritems():
-      self.idf[token] = math.log(self.num_docs / float(count))
+    self._isStale = True
+
 
-    # Convert to tfidf
-    self.tfidf.clear()
-    for name, tf in self.tf.iteritems():
-      total = self.counts[name]
-      for token, count in tf.iteritems():
-        tf = count / float(total)
-        self.tfidf[name][token] = tf * self.idf[token]
+  def finalizeTraining(self):
+    """
+    Compute idf and the tfidf matrix and its class norms from the counts, if
+    training has changed them since they were last computed.
+    """
+    if not getattr(self, "_isStale", False):
+      return
+
+    self._classes = sorted(self.tf)
+    if self.hashBits is not None:
+      self._finalizeHashed()
+      self._isStale = False
+      return
+
+    # Dependent on number of documents so need to recompute after training
+    df = numpy.zeros(len(self.vocabulary))
+    for token, count in self.df.iteritems():
+      df[self.vocabulary[token]] = count
+    self._idf = numpy.log(self.num_docs / df)
+
+    # Convert to tfidf, as (class, term, weight) entries
+    rows = []
+    terms = []
+    tfs = []
+    for row, label in enumerate(self._classes):
+      total = float(self.counts[label])
+      rows.extend([row] * len(self.tf[label]))
+      for token, count in self.tf[label].iteritems():
+        terms.append(self.vocabulary[token])
+        tfs.append(count / total)
+    rows = numpy.array(rows, dtype=numpy.int64)
+    terms = numpy.array(terms, dtype=numpy.int64)
+    weights = numpy.array(tfs) * self._idf[terms]
+
+    order = numpy.argsort(terms, kind="mergesort")
+    self._termClasses = rows[order]
+    self._termWeights = weights[order]
+    self._termStarts = numpy.concatenate(([0], numpy.cumsum(
+      numpy.bincount(terms, minlength=len(self.vocabulary)))))
 
     # Update norm
-    for name, tfidf in self.tfidf.iteritems():
-      norm = 0.0
-      for token, count in tfidf.iteritems():
-        norm += count ** 2
-      self.norms[name] = math.sqrt(norm)
+    self._classNorms = numpy.sqrt(numpy.bincount(
+      rows, weights=weights ** 2, minlength=len(self._classes)))
+
+    self._isStale = False
+
+
+  def _finalizeHashed(self):
+    # Empty buckets get idf 0
+    self._idf = (numpy.log(max(self.num_docs, 1) / numpy.maximum(self.df, 1)) *
+                 (self.df > 0)).astype(numpy.float32)
+
+    # Only the buckets with nonzero weights are stored, as (class, bucket,
+    # weight) entries.
+    rows = []
+    buckets = []
+    weights = []
+    for row, label in enumerate(self._classes):
+      nonzero = numpy.flatnonzero(self.tf[label] * self._idf)
+      rows.append(numpy.full(nonzero.size, row, dtype=numpy.int64))
+      buckets.append(nonzero)
+      weights.append(self.tf[label][nonzero] / float(max(self.counts[label], 1))
+                     * self._idf[nonzero])
+    rows = numpy.concatenate(rows + [numpy.zeros(0, dtype=numpy.int64)])
+    buckets = numpy.concatenate(buckets + [numpy.zeros(0, dtype=numpy.int64)])
+    weights = numpy.concatenate(weights + [numpy.zeros(0)]).astype(float)
+
+    # The term IDs of the matrix are the indices of the sorted buckets.
+    self._termBuckets, terms = numpy.unique(buckets, return_inverse=True)
+    order = numpy.argsort(terms, kind="mergesort")
+    self._termClasses = rows[order]
+    self._termWeights = weights[order]
+    self._termStarts = numpy.concatenate(([0], numpy.cumsum(
+      numpy.bincount(terms, minlength=len(self._termBuckets)))))
+
+    self._classNorms = numpy.sqrt(numpy.bincount(
+      rows, weights=weights ** 2, minlength=len(self._classes)))
 
 
   def testModel(self, sample):
@@ -140,42 +294,96 @@ class ClassificationModelTraditional(ClassificationModel):
     @return           (list)            The label with the highest cosine
                                         similarity
     """
+    return self.testSamples([sample])[0]
 
-    text = sample["text"]
-
-    tf = {}
-    for token in text:
-      tf[token] = tf.get(token, 0.0) + 1
-
-    # Don't update self.idf because this is not training
-    tfidf = {}
-    for token, count in tf.iteritems():
-      if token in self.idf:
-        tfidf[token] = count / len(text) * self.idf[token]
-
-    # Update norm
-    norm = 0.0
-    for token, count in tfidf.iteritems():
-      norm += count ** 2
-    norm = math.sqrt(norm)
-
-    if norm == 0:
-      return []
-
-    # Cosine similarity
-    matches = []
-    for label, tf in self.tf.iteritems():
-      distance = 0.0
-      for token, c in tfidf.iteritems():
-        if token in tf:
-          distance += tfidf[token] * self.tfidf[label][token]
 
-      # Normalize
-      distance /= (norm * self.norms[label])
-
-      matches.append((label, distance))
-
-    matches = sorted(matches, key=lambda x:x[1], reverse=True)
+  def testSamples(self, samples):
+    """
+    Test the classifier on each of the input samples, computing the cosine
+    similarities of all the samples' tfidf vectors to all of the classes with
+    one sparse product.
 
-    # Only return the labels, not the distances
-    return zip(*matches[:self.numLabels])[0]
+    @param samples    (list)            Dictionaries, containing text, sparsity,
+                                        and bitmap
+    @return           (list)            For each sample, the numLabels labels
+                                        with the highest cosine similarity,
+                                        most similar first (ties to the lower
+                                        label); empty if no term of the sample
+                                        was trained on.
+    """
+    self.finalizeTraining()
+    numClasses = len(self._classes)
+
+    # Sparse doc x term matrix of the known terms' (signed) counts
+    docs = []
+    terms = []
+    signs = []
+    lengths = numpy.zeros(len(samples))
+    for doc, sample in enumerate(samples):
+      text = sample["text"]
+      lengths[doc] = len(text)
+      if self.hashBits is not None:
+        buckets, bucketSigns = self._hashTokens(text)
+        docs.extend([doc] * len(text))
+        terms.extend(buckets)
+        signs.extend(bucketSigns)
+        continue
+      for token in text:
+        termId = self.vocabulary.get(token)
+        if termId is not None:
+          docs.append(doc)
+          terms.append(termId)
+          signs.append(1.0)
+
+    numTerms = max(len(self._idf), 1)
+    keys, entries = numpy.unique(
+      numpy.array(docs, dtype=numpy.int64) * numTerms +
+      numpy.array(terms, dtype=numpy.int64), return_inverse=True)
+    counts = numpy.bincount(entries, weights=signs, minlength=len(keys))
+    docs = keys // numTerms
+    terms = keys % numTerms
+
+    # Don't update idf because this is not training
+    values = counts / lengths[docs] * self._idf[terms]
+    norms = numpy.sqrt(numpy.bincount(docs, weights=values ** 2,
+                                      minlength=len(samples)))
+
+    if self.hashBits is not None:
+      # Map the buckets to the matrix's term IDs, dropping those it lacks.
+      buckets = terms
+      terms = numpy.searchsorted(self._termBuckets, buckets)
+      isKnown = terms < len(self._termBuckets)
+      isKnown[isKnown] = self._termBuckets[terms[isKnown]] == buckets[isKnown]
+      docs = docs[isKnown]
+      terms = terms[isKnown]
+      values = values[isKnown]
+    similarities = self._sparseProduct(docs, terms, values, len(samples))
+
+    # Normalize
+    denominators = norms[:, None] * self._classNorms[None, :]
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+      similarities = numpy.where(denominators > 0,
+                                 similarities / denominators, 0.0)
+
+    order = numpy.argsort(-similarities, axis=1, kind="mergesort")
+    return [tuple(self._classes[j] for j in order[doc, :self.numLabels])
+            if norms[doc] > 0 else []
+            for doc in xrange(len(samples))]
+
+
+  def _sparseProduct(self, docs, terms, values, numDocs):
+    """
+    Return the doc x class dot products of the sparse doc x term entries with
+    the class x term matrix, gathering the entries of each of the docs' terms.
+    """
+    numClasses = len(self._classes)
+    starts = self._termStarts[terms]
+    entryCounts = self._termStarts[terms+1] - starts
+    entries = raggedIndices(starts, entryCounts)
+    products = numpy.repeat(values, entryCounts) * self._termWeights[entries]
+    cells = (numpy.repeat(docs, entryCounts) * numClasses +
+             self._termClasses[entries])
+
+    return numpy.bincount(
+      cells, weights=products, minlength=max(numDocs * numClasses, 1)
+      )[:numDocs * numClasses].reshape(numDocs, numClasses)
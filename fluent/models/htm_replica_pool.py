@@ -0,0 +1,111 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+This file contains a pool of inference replicas of a trained HTM model, for
+serving queries concurrently: queryModel() changes the state of the network,
+so one model can only serve one query at a time.
+"""
+
+import multiprocessing
+
+from fluent.models.classify_htm import ClassificationModelHTM
+
+
+
+# The replica of this worker process.
+_replica = None
+
+
+
+def _loadReplica(modelDir):
+  """Load the worker process's replica of the saved model."""
+  global _replica
+  _replica = ClassificationModelHTM.load(modelDir, verbosity=0)
+  _replica.setPhase("infer")
+
+
+
+def _queryReplica(args):
+  query, preprocess = args
+  return _replica.queryModel(query, preprocess)
+
+
+
+class HTMReplicaPool(object):
+  """
+  Pool of worker processes, each with a replica of a saved HTM model that only
+  infers. Queries are dispatched to free workers, and each query starts a new
+  sequence (see ClassificationModelHTM.queryModel()), so the results don't
+  depend on which replica served the previous queries. Processes rather than
+  threads, so queries run in parallel across cores.
+  """
+
+  def __init__(self, modelDir, numReplicas=None):
+    """
+    @param modelDir     (str)     Directory of the model, saved by
+                                  ClassificationModelHTM.saveModel().
+    @param numReplicas  (int)     Number of replicas (worker processes); by
+                                  default the number of cores.
+    """
+    self.modelDir = modelDir
+    self.numReplicas = numReplicas or multiprocessing.cpu_count()
+    self._pool = multiprocessing.Pool(self.numReplicas,
+                                      initializer=_loadReplica,
+                                      initargs=(modelDir,))
+
+
+  @classmethod
+  def fromModel(cls, model, numReplicas=None):
+    """
+    Return a pool of replicas of the trained model, saving it to its modelDir.
+
+    @param model        (ClassificationModelHTM)
+    @param numReplicas  (int)     See __init__().
+    """
+    model.saveModel()
+    return cls(model.modelDir, numReplicas)
+
+
+  def queryModel(self, query, preprocess=False):
+    """
+    Return the result of queryModel() on a free replica; see
+    ClassificationModelHTM.queryModel().
+    """
+    return self._pool.apply(_queryReplica, ((query, preprocess),))
+
+
+  def queryModelBatch(self, queries, preprocess=False):
+    """
+    Return the results of queryModel() for each of the queries, which are
+    spread over the replicas.
+
+    @param queries      (list)    Query strings.
+    @return             (list)    Results, in the order of the queries.
+    """
+    return self._pool.map(_queryReplica,
+                          [(query, preprocess) for query in queries],
+                          chunksize=1)
+
+
+  def close(self):
+    """Stop the worker processes."""
+    self._pool.close()
+    self._pool.join()
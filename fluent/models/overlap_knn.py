@@ -0,0 +1,607 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import numpy
+
+from collections import defaultdict
+
+from fluent.utils.bitmap_store import BitmapStore
+from fluent.utils.minhash_index import MinHashLSHIndex
+from fluent.utils.overlap_index import (flattenBitmaps, OverlapIndex,
+                                        raggedIndices)
+
+
+
+# Number of (bitmap, prototype) overlaps scored at once by inferBatch().
+_CHUNK_SIZE = 2**24
+
+
+
+class OverlapKNNClassifier(object):
+  """
+  k-nearest neighbors classifier for sparse bitmaps, using the "rawOverlap"
+  distance of the NuPIC KNNClassifier: the fraction of the input's ON bits not
+  shared with the prototype. Prototypes are stored in an OverlapIndex, so
+  inference only touches the posting lists of the input's ON bits.
+
+  In approximate mode the prototypes are indexed by a MinHashLSHIndex instead,
+  and inference only considers the prototypes it retrieves, re-ranked by their
+  exact overlap. Their bitmaps are stored once, by prototype ID, in a store
+  that the LSH index references.
+
+  A prototype can have several categories, e.g. a sample with multiple labels
+  is stored once rather than once per label. Its categories fill consecutive
+  slots of the k nearest neighbors, so the votes are the same as if a copy of
+  the prototype were stored for each category.
+
+  Shared prototypes (learnShared()) store each key, e.g. a token, once with
+  the number of times it was learned with each category, and vote with those
+  counts; memory and inference then scale with the number of distinct keys.
+
+  With a prototype budget, condense() bounds the number of prototypes of each
+  label (set) by merging the prototypes over budget into their nearest
+  representative, so memory and inference time stop growing with training.
+  """
+
+  def __init__(self, k=1, n=16384, exact=False, approximate=False,
+               lshBands=32, lshRows=2, maxPrototypesPerLabel=None,
+               condenseMethod="union", verbosity=0):
+    """
+    @param k          (int)     Number of nearest neighbors that vote.
+    @param n          (int)     Number of bits in the input bitmaps.
+    @param exact      (bool)    Only prototypes containing all of the input's
+                                ON bits (i.e. distance 0) vote.
+    @param approximate (bool)   Search with MinHash LSH instead of the full
+                                overlap index.
+    @param lshBands   (int)     Number of LSH bands; more bands raise recall.
+    @param lshRows    (int)     MinHash values per band; more rows retrieve
+                                fewer, more similar, candidates.
+    @param maxPrototypesPerLabel (int)  Budget of prototypes for each label
+                                (set) kept by condense(); None keeps all.
+    @param condenseMethod (str) How condense() merges prototypes: "union"
+                                keeps the most frequent bits of the merged
+                                prototypes (weighted by the number of samples
+                                in each), "medoid" keeps the merged prototype
+                                that best matches those frequencies.
+    """
+    if condenseMethod not in ("union", "medoid"):
+      raise ValueError("Invalid condense method: {}".format(condenseMethod))
+    if exact and maxPrototypesPerLabel:
+      # A merged prototype no longer contains the inputs of its members.
+      raise ValueError("Exact matching does not support a prototype budget.")
+
+    self.k = k
+    self.n = n
+    self.exact = exact
+    self.approximate = approximate
+    self.maxPrototypesPerLabel = maxPrototypesPerLabel
+    self.condenseMethod = condenseMethod
+    self.verbosity = verbosity
+
+    self.index = OverlapIndex(n)
+    # The prototypes' bitmaps by ID, to condense them, and in approximate mode
+    # to re-rank the LSH candidates.
+    self._bitmaps = (BitmapStore(n) if approximate or maxPrototypesPerLabel
+                     else None)
+    self.lshIndex = (MinHashLSHIndex(n, lshBands, lshRows,
+                                     bitmaps=self._bitmaps)
+                     if approximate else None)
+    self._clearPrototypes()
+
+
+  def clear(self):
+    """Remove all prototypes."""
+    self.index.clear()
+    if self.lshIndex is not None:
+      self.lshIndex.clear()
+    if self._bitmaps is not None:
+      self._bitmaps.clear()
+    self._clearPrototypes()
+
+
+  def _clearPrototypes(self):
+    self._clearCategories()
+    # To condense, keep the number of samples merged into each prototype.
+    self._weights = []
+    # For shared prototypes, the prototype ID of each key, and the number of
+    # times each prototype (rows) was learned with each category (columns).
+    self._sharedIds = {}
+    self._labelCounts = None
+
+
+  def _clearCategories(self):
+    # The categories of all prototypes, concatenated in the order learned, and
+    # the number of categories of each prototype.
+    self._categoryList = []
+    self._categoryCounts = []
+    self._categoryArrays = None
+
+
+  def getNumPatterns(self):
+    if self.lshIndex is not None:
+      return len(self.lshIndex)
+    return len(self.index)
+
+
+  def _addPrototypes(self, bits, lengths):
+    """
+    Add prototypes, given as from flattenBitmaps(), to the index of the search
+    mode and to the bitmap store.
+    """
+    if self.lshIndex is not None:
+      self.lshIndex.addFlattened(bits, lengths)
+    else:
+      self.index.addFlattened(bits, lengths)
+    if self._bitmaps is not None:
+      self._bitmaps.extend(bits, lengths)
+
+
+  def learn(self, bitmap, category):
+    """
+    Store the bitmap as a prototype of the category.
+
+    @param bitmap     (numpy.array)   Indices of the ON bits.
+    @param category   (int or list)   Label(s) of the prototype; a label that
+                                      is repeated gets that many votes.
+    """
+    self.learnBatch([bitmap], [category])
+
+
+  def learnBatch(self, bitmaps, categories):
+    """
+    Store the bitmaps as prototypes of the corresponding categories, in bulk.
+
+    @param bitmaps    (list)          Numpy arrays of the indices of the ON bits.
+    @param categories (list)          Label(s) of each prototype.
+    """
+    if len(bitmaps) != len(categories):
+      raise ValueError("There must be one category per bitmap.")
+    if self._labelCounts is not None:
+      raise ValueError("Cannot mix shared and unshared prototypes.")
+    categories = [numpy.atleast_1d(category) for category in categories]
+    counts = [category.size for category in categories]
+    if not all(counts):
+      raise ValueError("Each prototype must have at least one category.")
+
+    self._addPrototypes(*flattenBitmaps(bitmaps, self.n))
+    if self.maxPrototypesPerLabel:
+      self._weights.extend([1] * len(bitmaps))
+    for category in categories:
+      self._categoryList.extend(category.tolist())
+    self._categoryCounts.extend(counts)
+    self._categoryArrays = None
+
+
+  def learnShared(self, keys, bitmaps, categories):
+    """
+    Learn prototypes shared by all occurrences of a key: the first occurrence
+    of a key stores its bitmap as a prototype, and each occurrence adds one to
+    the count of each of its categories on the key's prototype. A prototype
+    among the k nearest votes for each category with that count.
+
+    @param keys       (list)          Hashable key of each occurrence.
+    @param bitmaps    (list)          Numpy arrays of the indices of the ON
+                                      bits; only used for new keys.
+    @param categories (list)          Label(s) of each occurrence; negative
+                                      labels (e.g. the stand-in label of
+                                      unlabeled samples) are not counted.
+    @return           (numpy.array)   Prototype ID of each occurrence.
+    """
+    if not len(keys) == len(bitmaps) == len(categories):
+      raise ValueError("There must be one bitmap and category per key.")
+    if self.maxPrototypesPerLabel:
+      raise ValueError("Shared prototypes do not support a prototype budget.")
+    if self.getNumPatterns() and self._labelCounts is None:
+      raise ValueError("Cannot mix shared and unshared prototypes.")
+
+    protoIds = numpy.zeros(len(keys), dtype=numpy.int64)
+    newBitmaps = []
+    for i, key in enumerate(keys):
+      protoId = self._sharedIds.get(key)
+      if protoId is None:
+        protoId = self.getNumPatterns() + len(newBitmaps)
+        self._sharedIds[key] = protoId
+        newBitmaps.append(bitmaps[i])
+      protoIds[i] = protoId
+
+    categories = [numpy.atleast_1d(category) for category in categories]
+    labels = numpy.concatenate(categories or [[]]).astype(numpy.int64)
+    owners = numpy.repeat(protoIds, [category.size for category in categories])
+    # Negative labels don't vote, as in _getVotes().
+    isCounted = labels >= 0
+    labels = labels[isCounted]
+    owners = owners[isCounted]
+
+    self._addPrototypes(*flattenBitmaps(newBitmaps, self.n))
+
+    numLabels = labels.max()+1 if labels.size else 0
+    self._labelCounts = self._reserveCounts(self._labelCounts,
+                                            self.getNumPatterns(), numLabels)
+    numpy.add.at(self._labelCounts, (owners, labels), 1)
+
+    return protoIds
+
+
+  @staticmethod
+  def _reserveCounts(counts, numRows, numColumns):
+    """
+    Return the count matrix with room for the rows and columns, reallocated
+    with doubled row capacity if it is short.
+    """
+    if counts is None:
+      counts = numpy.zeros((0, 0), dtype=numpy.int64)
+    if numRows <= counts.shape[0] and numColumns <= counts.shape[1]:
+      return counts
+    grown = numpy.zeros((max(numRows, 2 * counts.shape[0]),
+                         max(numColumns, counts.shape[1])), dtype=numpy.int64)
+    grown[:counts.shape[0], :counts.shape[1]] = counts
+    return grown
+
+
+  def condense(self):
+    """
+    Merge the prototypes of each label (set) down to maxPrototypesPerLabel. The
+    earliest prototypes of a label are its representatives, and each later
+    prototype is merged into the representative it overlaps most, with ties to
+    the lower ID, so the result only depends on the training order. A merged
+    representative keeps its ID, and the prototypes merged into it are removed.
+
+    @return           (numpy.array)   IDs (before condensing) of the remaining
+        prototypes, in order; or None if there was nothing to condense.
+    """
+    if not self.maxPrototypesPerLabel:
+      return None
+
+    categories, starts, counts = self._getCategoryArrays()
+    groups = defaultdict(list)
+    for protoId in xrange(self.getNumPatterns()):
+      groups[tuple(categories[starts[protoId]:starts[protoId]+counts[protoId]])
+            ].append(protoId)
+
+    budget = self.maxPrototypesPerLabel
+    merged = {}
+    isRemoved = numpy.zeros(self.getNumPatterns(), dtype=bool)
+    for members in groups.itervalues():
+      if len(members) > budget:
+        merged.update(self._mergeGroup(numpy.array(members[:budget]),
+                                       numpy.array(members[budget:])))
+        isRemoved[members[budget:]] = True
+
+    if not isRemoved.any():
+      return None
+
+    kept = numpy.flatnonzero(~isRemoved)
+    self._rebuild(kept, merged)
+
+    return kept
+
+
+  def _mergeGroup(self, representatives, members):
+    """
+    Merge the members of a label (set) into their nearest representatives.
+
+    @return   (dict)    Updated bitmap of each representative that was merged
+                        into, keyed by prototype ID.
+    """
+    repIndex = OverlapIndex(self.n)
+    repIndex.addFlattened(*self._gatherBitmaps(representatives))
+
+    # The first maximum is the representative with the lower ID.
+    nearest = numpy.zeros(members.size, dtype=numpy.int64)
+    chunkSize = max(1, _CHUNK_SIZE / representatives.size)
+    for first in xrange(0, members.size, chunkSize):
+      chunk = members[first:first+chunkSize]
+      nearest[first:first+chunk.size] = repIndex.overlapsFlattened(
+        *self._gatherBitmaps(chunk)).argmax(axis=1)
+
+    weights = numpy.array(self._weights, dtype=numpy.int64)
+    targets = numpy.unique(nearest)
+    # Each cluster is a representative followed by its members, in ID order.
+    clusterIds = numpy.concatenate((representatives[targets], members))
+    clusters = numpy.concatenate((numpy.arange(targets.size),
+                                  numpy.searchsorted(targets, nearest)))
+    order = numpy.argsort(clusters, kind="mergesort")
+    clusterIds = clusterIds[order]
+    clusters = clusters[order]
+    isRepresentative = numpy.concatenate(
+      (numpy.ones(targets.size, dtype=bool),
+       numpy.zeros(members.size, dtype=bool)))[order]
+
+    # Count each cluster's bits, weighted by the samples in each prototype.
+    bits, lengths = self._gatherBitmaps(clusterIds)
+    owners = numpy.repeat(numpy.arange(clusterIds.size), lengths)
+    keys = clusters[owners] * self.n + bits
+    uniqueKeys, inverse = numpy.unique(keys, return_inverse=True)
+    bitCounts = numpy.bincount(inverse, weights=weights[clusterIds][owners])
+
+    if self.condenseMethod == "union":
+      # Keep as many bits as the representative has, the most frequent first,
+      # then the representative's own bits, then the lower bits.
+      isRepresentativeBit = numpy.zeros(uniqueKeys.size, dtype=bool)
+      isRepresentativeBit[inverse[isRepresentative[owners]]] = True
+      keyClusters = uniqueKeys // self.n
+      rank = numpy.lexsort((uniqueKeys, ~isRepresentativeBit, -bitCounts,
+                            keyClusters))
+      clusterStarts = numpy.searchsorted(keyClusters[rank],
+                                         numpy.arange(targets.size))
+      slots = numpy.arange(rank.size) - clusterStarts[keyClusters[rank]]
+      isKept = slots < lengths[isRepresentative][keyClusters[rank]]
+      keptKeys = numpy.sort(uniqueKeys[rank[isKept]])
+      keptClusters, keptBits = keptKeys // self.n, keptKeys % self.n
+      bitmaps = numpy.split(keptBits, numpy.searchsorted(
+        keptClusters, numpy.arange(1, targets.size)))
+    else:
+      # Keep the prototype whose bits are the most frequent in the cluster,
+      # preferring the representative, then the lower ID.
+      scores = numpy.bincount(owners, weights=bitCounts[inverse],
+                              minlength=clusterIds.size)
+      rank = numpy.lexsort((clusterIds, ~isRepresentative, -scores, clusters))
+      isFirst = numpy.concatenate(([True],
+                                   clusters[rank][1:] != clusters[rank][:-1]))
+      bitmaps = [self._bitmaps[protoId] for protoId in clusterIds[rank][isFirst]]
+
+    clusterWeights = numpy.bincount(clusters, weights=weights[clusterIds])
+    for protoId, weight in zip(representatives[targets], clusterWeights):
+      self._weights[protoId] = int(weight)
+
+    return dict(zip(representatives[targets].tolist(), bitmaps))
+
+
+  def _gatherBitmaps(self, ids):
+    """Return the bitmaps of the prototypes, flattened and widened."""
+    bits, lengths = self._bitmaps.gather(ids)
+    return bits.astype(numpy.int64), lengths
+
+
+  def _rebuild(self, kept, merged):
+    """
+    Rebuild the indices from the kept prototypes, replacing the bitmaps of the
+    merged ones.
+    """
+    bitmaps = [merged[protoId] if protoId in merged else self._bitmaps[protoId]
+               for protoId in kept.tolist()]
+    bits, lengths = flattenBitmaps(bitmaps, self.n)
+    categories, starts, counts = self._getCategoryArrays()
+    keptCategories = categories[raggedIndices(starts[kept], counts[kept])]
+    weights = numpy.array(self._weights)[kept].tolist()
+
+    self.index.clear()
+    if self.lshIndex is not None:
+      self.lshIndex.clear()
+    self._bitmaps.clear()
+    self._addPrototypes(bits, lengths)
+    self._weights = weights
+    self._categoryList = keptCategories.tolist()
+    self._categoryCounts = counts[kept].tolist()
+    self._categoryArrays = None
+
+
+  def _getCategoryArrays(self):
+    """
+    Return the concatenated categories of the prototypes, the start of each
+    prototype's categories, and their counts, as arrays.
+    """
+    if self._categoryArrays is None:
+      counts = numpy.array(self._categoryCounts, dtype=numpy.int64)
+      self._categoryArrays = (numpy.array(self._categoryList, dtype=numpy.int64),
+                              numpy.cumsum(counts) - counts,
+                              counts)
+
+    return self._categoryArrays
+
+
+  def _getVotes(self, neighbors, isVoting, k):
+    """
+    Return the categories voted by the nearest prototypes: each row of
+    neighbors is a bitmap's prototypes, nearest first, and the first k of
+    their categories vote.
+
+    @return rows    (numpy.array)   Row of each vote.
+    @return votes   (numpy.array)   Category of each vote.
+    """
+    categories, starts, counts = self._getCategoryArrays()
+    counts = numpy.where(isVoting, counts[neighbors], 0)
+    votes = categories[raggedIndices(starts[neighbors].ravel(), counts.ravel())]
+
+    rowCounts = counts.sum(axis=1)
+    rows = numpy.repeat(numpy.arange(len(neighbors)), rowCounts)
+    slots = raggedIndices(numpy.zeros(len(neighbors), dtype=numpy.int64),
+                          rowCounts)
+    isCounted = (slots < k) & (votes >= 0)
+
+    return rows[isCounted], votes[isCounted]
+
+
+  def _getNumCategories(self):
+    """Return the number of category columns in the inference results."""
+    if self._labelCounts is not None:
+      return self._labelCounts.shape[1]
+    categories, _, _ = self._getCategoryArrays()
+    return categories.max()+1
+
+
+  def _tallyVotes(self, neighbors, isVoting):
+    """
+    Return the number of votes for each category (columns) from the nearest
+    prototypes in each row of neighbors, as in _getVotes(); shared prototypes
+    vote with their category counts. The tallies are exact counts, so equal
+    votes stay equal, and the winners break the tie by label (see infer() and
+    ClassificationModel.getWinningLabels()).
+    """
+    if self._labelCounts is not None:
+      counts = self._labelCounts[neighbors] * isVoting[:, :, None]
+      return counts.sum(axis=1).astype(float)
+
+    tally = numpy.zeros((len(neighbors), self._getNumCategories()))
+    rows, votes = self._getVotes(neighbors, isVoting, self.k)
+    numpy.add.at(tally, (rows, votes), 1.0)
+
+    return tally
+
+
+  def getDistances(self, bitmap):
+    """
+    @return         (numpy.array)   Each entry is the distance from the input
+        bitmap to that prototype. All distances are between 0.0 and 1.0; in
+        approximate mode the prototypes not retrieved by LSH are at 1.0.
+    """
+    bitmap = numpy.unique(bitmap)
+    if not bitmap.size:
+      return numpy.zeros(self.getNumPatterns())
+
+    if self.approximate:
+      overlaps = numpy.zeros(self.getNumPatterns())
+      candidates = self.lshIndex.candidates(bitmap)
+      overlaps[candidates] = self.lshIndex.overlaps(bitmap, candidates)
+    else:
+      overlaps = self.index.overlaps(bitmap)
+
+    return (bitmap.size - overlaps) / float(bitmap.size)
+
+
+  def getDistancesBatch(self, bitmaps):
+    """
+    Return the distances of each of the bitmaps to every prototype, as in
+    getDistances(), scoring all of the bitmaps at once.
+
+    @param bitmaps  (list)          Numpy arrays of the indices of the ON bits.
+    @return         (numpy.array)   Distances; rows are the bitmaps, columns
+                                    are prototype IDs.
+    """
+    if self.approximate:
+      return numpy.array([self.getDistances(bitmap) for bitmap in bitmaps]
+                         ).reshape(len(bitmaps), self.getNumPatterns())
+
+    bits, lengths = flattenBitmaps(bitmaps, self.n)
+    overlaps = self.index.overlapsFlattened(bits, lengths)
+    # Empty bitmaps are at distance 0, as in getDistances().
+    sizes = numpy.maximum(lengths, 1).astype(float)[:, None]
+
+    return (lengths[:, None] - overlaps) / sizes
+
+
+  def infer(self, bitmap):
+    """
+    Find the categories of the k nearest prototypes to the input bitmap.
+
+    @return winner          (int)           Category with the most votes, or
+        None if no prototype voted.
+    @return inferenceResult (numpy.array)   Fraction of the voting prototypes
+        in each category.
+    """
+    if not self.getNumPatterns():
+      return None, numpy.zeros(1)
+
+    if self.approximate:
+      neighbors, overlaps = self.lshIndex.topK(bitmap, self.k)
+      if self.exact:
+        # The retrieved prototypes containing the bitmap rank first.
+        neighbors = neighbors[overlaps == numpy.unique(bitmap).size]
+    elif self.exact:
+      neighbors = self.index.containing(bitmap)[:self.k]
+    else:
+      neighbors, _ = self.index.topK(bitmap, self.k)
+
+    inferenceResult = self._tallyVotes(
+      neighbors[None, :], numpy.ones((1, neighbors.size), dtype=bool))[0]
+
+    if not inferenceResult.any():
+      return None, inferenceResult
+
+    if self.verbosity >= 1:
+      print "OverlapKNNClassifier infer:"
+      print "  nearest prototypes:", neighbors
+      print "  votes of each category:", inferenceResult
+
+    winner = inferenceResult.argmax()
+    inferenceResult /= inferenceResult.sum()
+
+    return winner, inferenceResult
+
+
+  def inferBatch(self, bitmaps):
+    """
+    Find the categories of the k nearest prototypes to each of the bitmaps. The
+    overlaps are scored as one (bitmaps x prototypes) matrix, in chunks of rows
+    to bound memory, and the neighbors of every row are selected at once.
+
+    @param bitmaps          (list)          Numpy arrays of the indices of the
+        ON bits.
+    @return inferenceResults (numpy.array)  Fraction of the voting prototypes
+        in each category (columns), for each bitmap (rows). Rows without votes
+        are all zeros.
+    """
+    if not self.getNumPatterns():
+      return numpy.zeros((len(bitmaps), 1))
+
+    numProtos = self.getNumPatterns()
+    k = min(self.k, numProtos)
+    inferenceResults = numpy.zeros((len(bitmaps), self._getNumCategories()))
+
+    chunkSize = max(1, _CHUNK_SIZE / numProtos)
+    for first in xrange(0, len(bitmaps), chunkSize):
+      chunk = bitmaps[first:first+chunkSize]
+      if self.approximate:
+        # LSH may retrieve fewer than k candidates for a bitmap.
+        neighbors = numpy.zeros((len(chunk), k), dtype=numpy.int64)
+        isVoting = numpy.zeros((len(chunk), k), dtype=bool)
+        for row, bitmap in enumerate(chunk):
+          ids, overlaps = self.lshIndex.topK(bitmap, k)
+          if self.exact:
+            ids = ids[overlaps == numpy.unique(bitmap).size]
+          neighbors[row, :ids.size] = ids
+          isVoting[row, :ids.size] = True
+      else:
+        neighbors, isVoting = self._nearestBatch(chunk, k)
+
+      inferenceResults[first:first+len(chunk)] = self._tallyVotes(neighbors,
+                                                                  isVoting)
+
+    totals = inferenceResults.sum(axis=1)
+    inferenceResults[totals > 0] /= totals[totals > 0, None]
+
+    return inferenceResults
+
+
+  def _nearestBatch(self, bitmaps, k):
+    """
+    Return the k nearest prototypes to each bitmap, as (len(bitmaps), k) arrays
+    of prototype IDs and of whether the neighbor votes; ties are broken in
+    favor of the lower ID, as in infer().
+    """
+    overlaps = self.index.overlapsBatch(bitmaps)
+    numProtos = overlaps.shape[1]
+
+    # Rank by one integer key per prototype: the overlap, then the lower ID.
+    reverseIds = numpy.arange(numProtos-1, -1, -1)
+    if self.exact:
+      sizes = numpy.array([numpy.unique(bitmap).size for bitmap in bitmaps])
+      isContaining = overlaps == sizes[:, None]
+      keys = numpy.where(isContaining, reverseIds, -1)
+    else:
+      keys = overlaps * numProtos + reverseIds
+
+    neighbors = numpy.argpartition(-keys, k-1, axis=1)[:, :k]
+    rows = numpy.arange(len(bitmaps))[:, None]
+    order = numpy.argsort(-keys[rows, neighbors], axis=1)
+    neighbors = neighbors[rows, order]
+
+    return neighbors, keys[rows, neighbors] >= 0
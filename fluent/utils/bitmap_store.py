@@ -0,0 +1,159 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+This file contains the storage policy for the positions of the ON bits of
+bitmaps (SDRs): positions are stored with the smallest unsigned dtype that
+holds them (uint16 for the n=16384 Cortical.io fingerprints), and sets of
+bitmaps are stored in ragged, offset-indexed buffers. Code that does arithmetic
+on positions widens them first.
+"""
+
+import numpy
+
+from fluent.utils.overlap_index import raggedIndices
+
+
+
+def positionDtype(n):
+  """Return the smallest unsigned integer dtype for positions in [0, n)."""
+  if n <= 2**16:
+    return numpy.uint16
+  if n <= 2**32:
+    return numpy.uint32
+  return numpy.uint64
+
+
+
+def compactBitmap(bitmap, n):
+  """
+  Return the bitmap as a numpy array with the compact dtype for n bits.
+
+  @param bitmap   (list)          Indices of the ON bits.
+  @param n        (int)           Number of bits in the bitmap.
+  @return         (numpy.array)   The same indices, with dtype positionDtype(n).
+  """
+  bitmap = numpy.asarray(bitmap)
+  if bitmap.size and (bitmap.min() < 0 or bitmap.max() >= n):
+    raise ValueError("Bitmap positions must be in the range [0, n).")
+
+  return bitmap.astype(positionDtype(n))
+
+
+
+class BitmapStore(object):
+  """
+  Append-only store of bitmaps in one flat buffer of compact positions, where
+  the positions of bitmap i are positions[offsets[i]:offsets[i+1]]. The buffer
+  grows geometrically, so appends are amortized O(w).
+  """
+
+  def __init__(self, n):
+    """
+    @param n      (int)     Number of bits in the bitmaps.
+    """
+    self.n = n
+    self.clear()
+
+
+  def clear(self):
+    """Remove all bitmaps from the store."""
+    self._positions = numpy.zeros(0, dtype=positionDtype(self.n))
+    self._offsets = numpy.zeros(1, dtype=numpy.int64)
+    self._numBitmaps = 0
+
+
+  def __len__(self):
+    return self._numBitmaps
+
+
+  def __getitem__(self, i):
+    """Return the positions of bitmap i, as a read-only view."""
+    if not -self._numBitmaps <= i < self._numBitmaps:
+      raise IndexError("Bitmap index out of range.")
+    i %= self._numBitmaps
+    view = self._positions[self._offsets[i]:self._offsets[i+1]]
+    view.flags.writeable = False
+    return view
+
+
+  def __getstate__(self):
+    # Don't pickle the unused capacity of the buffers.
+    state = self.__dict__.copy()
+    state["_positions"] = self._positions[:self._offsets[self._numBitmaps]]
+    state["_offsets"] = self._offsets[:self._numBitmaps+1]
+    return state
+
+
+  def extend(self, bits, lengths):
+    """
+    Append bitmaps given as one flat array of positions.
+
+    @param bits     (numpy.array)   Concatenated positions of the bitmaps; as
+                                    from overlap_index.flattenBitmaps().
+    @param lengths  (numpy.array)   Number of positions in each bitmap.
+    """
+    numBits = self._offsets[self._numBitmaps]
+    self._positions = self._reserve(self._positions, numBits + len(bits))
+    self._positions[numBits:numBits + len(bits)] = bits
+
+    self._offsets = self._reserve(self._offsets,
+                                  self._numBitmaps + len(lengths) + 1)
+    self._offsets[self._numBitmaps+1:self._numBitmaps + len(lengths) + 1] = (
+      numBits + numpy.cumsum(lengths))
+    self._numBitmaps += len(lengths)
+
+
+  def append(self, bitmap):
+    """
+    Append a bitmap.
+
+    @param bitmap   (numpy.array)   Indices of the ON bits.
+    @return         (int)           Index of the bitmap in the store.
+    """
+    self.extend(compactBitmap(bitmap, self.n), [len(bitmap)])
+    return self._numBitmaps - 1
+
+
+  def gather(self, ids):
+    """
+    Return the positions of the bitmaps, concatenated, and the number of
+    positions in each.
+
+    @param ids      (numpy.array)   Indices of the bitmaps.
+    @return bits    (numpy.array)   Concatenated positions, in the compact
+                                    dtype.
+    @return lengths (numpy.array)   Number of positions in each bitmap.
+    """
+    ids = numpy.asarray(ids, dtype=numpy.int64)
+    starts = self._offsets[ids]
+    lengths = self._offsets[ids+1] - starts
+
+    return self._positions[raggedIndices(starts, lengths)], lengths
+
+
+  @staticmethod
+  def _reserve(array, size):
+    """Return the array, reallocated with doubled capacity if it is short."""
+    if size <= array.size:
+      return array
+    grown = numpy.zeros(max(size, 2 * array.size), dtype=array.dtype)
+    grown[:array.size] = array
+    return grown
@@ -0,0 +1,100 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+This file contains a local alternative to Cortical.io's createClassification()
+endpoint, building category bitmaps (SDRs) from the encoded bitmaps of the
+category's positive and negative examples.
+"""
+
+import numpy
+
+from fluent.utils.bitmap_store import compactBitmap
+
+
+
+class CategoryBuilder(object):
+  """
+  Builds a bitmap for each category from the frequency of the ON bits of its
+  examples: each positive example adds one to the score of its bits, each
+  negative example subtracts negativeWeight, and the category is the w bits
+  with the highest positive scores (ties to the lower bit). Adding an example
+  only touches its own bits.
+  """
+
+  def __init__(self, n, w, negativeWeight=1.0):
+    """
+    @param n              (int)     Number of bits in the bitmaps.
+    @param w              (int)     Maximum number of ON bits in a category.
+    @param negativeWeight (float)   Score subtracted for each negative example
+                                    of a bit, relative to a positive example.
+    """
+    self.n = n
+    self.w = w
+    self.negativeWeight = negativeWeight
+    self.clear()
+
+
+  def clear(self):
+    """Remove all categories."""
+    self._scores = {}
+
+
+  def __contains__(self, label):
+    return label in self._scores
+
+
+  def addPositive(self, label, bitmap):
+    """
+    Add a positive example of the category.
+
+    @param label      (int)           Category label.
+    @param bitmap     (numpy.array)   Indices of the example's ON bits.
+    """
+    self._getScores(label)[numpy.unique(bitmap)] += 1.0
+
+
+  def addNegative(self, label, bitmap):
+    """
+    Add a negative example of the category; see addPositive().
+    """
+    self._getScores(label)[numpy.unique(bitmap)] -= self.negativeWeight
+
+
+  def _getScores(self, label):
+    if label not in self._scores:
+      self._scores[label] = numpy.zeros(self.n, dtype=numpy.float32)
+    return self._scores[label]
+
+
+  def getCategory(self, label):
+    """
+    Return the bitmap of the category, sparsified to at most w bits. It is
+    empty if none of the category's bits has a positive score.
+
+    @param label      (int)           Category label.
+    @return           (numpy.array)   Sorted indices of the category's ON bits,
+                                      in the compact dtype for n bits.
+    """
+    scores = self._scores[label]
+    top = numpy.argsort(-scores, kind="mergesort")[:self.w]
+    top = top[scores[top] > 0]
+
+    return compactBitmap(numpy.sort(top), self.n)
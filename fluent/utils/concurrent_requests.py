@@ -0,0 +1,54 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+This file contains a helper for issuing API requests (e.g. to Cortical.io)
+concurrently; the requests are I/O bound, so threads suffice.
+"""
+
+from multiprocessing.pool import ThreadPool
+
+
+
+# Maximum number of concurrent requests.
+MAX_CONCURRENT_REQUESTS = 8
+
+
+
+def mapConcurrently(function, items, maxWorkers=MAX_CONCURRENT_REQUESTS):
+  """
+  Return [function(item) for item in items], calling function from a pool of
+  threads.
+
+  @param function   (callable)    Function of one item, e.g. an API request.
+  @param items      (list)        Inputs of the function.
+  @param maxWorkers (int)         Maximum number of concurrent calls.
+  @return           (list)        Results, in the order of the items.
+  """
+  items = list(items)
+  if len(items) <= 1:
+    return [function(item) for item in items]
+
+  pool = ThreadPool(min(len(items), maxWorkers))
+  try:
+    return pool.map(function, items)
+  finally:
+    pool.close()
+    pool.join()
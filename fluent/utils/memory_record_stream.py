@@ -0,0 +1,166 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+This file contains an in-memory record source for the network API, a drop-in
+for the FileRecordStream that the LanguageSensor reads network data from, so
+the data doesn't have to be written to and parsed from a CSV file.
+"""
+
+from collections import OrderedDict
+
+import numpy
+
+
+
+class MemoryRecordStream(object):
+  """
+  Record stream over network data held in columns: one token per record, with
+  the record's categories, sequence ID, reset flag, and sample ID. Records are
+  returned as dicts with the NetworkDataGenerator field names, and the
+  categories parsed to lists of ints, as FileRecordStream returns them.
+  """
+
+  def __init__(self, tokens, categories, sequenceIds, resets, ids=None):
+    """
+    @param tokens       (list)          Token string of each record.
+    @param categories   (list)          Category IDs of each record; lists of
+                                        ints, or strings of space separated
+                                        ints as in NetworkDataGenerator records.
+    @param sequenceIds  (numpy.array)   Sequence ID of each record.
+    @param resets       (numpy.array)   1 for the first record of a sequence,
+                                        else 0.
+    @param ids          (list)          Sample ID of each record.
+    """
+    if not (len(tokens) == len(categories) == len(sequenceIds) ==
+            len(resets)):
+      raise ValueError("All of the columns must have the same length.")
+
+    self.tokens = list(tokens)
+    self.categories = [self._parseCategories(c) for c in categories]
+    self.sequenceIds = numpy.asarray(sequenceIds, dtype=numpy.int64)
+    self.resets = numpy.asarray(resets, dtype=numpy.int8)
+    self.ids = list(ids) if ids is not None else [""] * len(self.tokens)
+    self._position = 0
+
+
+  @classmethod
+  def fromRecords(cls, records):
+    """
+    Return a stream of NetworkDataGenerator records.
+
+    @param records      (list)          Sequences (lists) of record dicts, as in
+                                        NetworkDataGenerator.records.
+    """
+    flat = [record for sequence in records for record in sequence]
+    return cls([r["_token"] for r in flat],
+               [r["_category"] for r in flat],
+               [r["_sequenceId"] for r in flat],
+               [r["_reset"] for r in flat],
+               [r["ID"] for r in flat])
+
+
+  @staticmethod
+  def _parseCategories(categories):
+    if isinstance(categories, basestring):
+      return [int(c) for c in categories.split()]
+    if isinstance(categories, (int, long, numpy.integer)):
+      return [int(categories)]
+    return list(categories)
+
+
+  def __len__(self):
+    return len(self.tokens)
+
+
+  def getFieldNames(self):
+    return ["_token", "_category", "_sequenceId", "_reset", "ID"]
+
+
+  def getNextRecordIdx(self):
+    return self._position
+
+
+  def getNextRecord(self):
+    """Return the next record as a list of field values, or None at the end."""
+    if self._position >= len(self.tokens):
+      return None
+    i = self._position
+    self._position += 1
+
+    return [self.tokens[i], self.categories[i], int(self.sequenceIds[i]),
+            int(self.resets[i]), self.ids[i]]
+
+
+  def getNextRecordDict(self):
+    """Return the next record as a dict of field values, or None at the end."""
+    values = self.getNextRecord()
+    if values is None:
+      return None
+
+    return dict(zip(self.getFieldNames(), values))
+
+
+  def rewind(self):
+    self._position = 0
+
+
+  def close(self):
+    pass
+
+
+  def _sequenceStarts(self):
+    """Return the index of the first record of each sequence."""
+    starts = numpy.flatnonzero(self.resets)
+    if len(self.tokens) and (not starts.size or starts[0] != 0):
+      starts = numpy.concatenate(([0], starts))
+    return starts
+
+
+  def getNumberOfTokens(self):
+    """
+    Returns the number of tokens of each sequence, as in
+    NetworkDataGenerator.getNumberOfTokens().
+    """
+    return numpy.diff(numpy.append(self._sequenceStarts(),
+                                   len(self.tokens))).tolist()
+
+
+  def getClassifications(self):
+    """
+    Returns the categories of each sequence, as in
+    NetworkDataGenerator.getClassifications(), e.g. ["0 1", "1", "1 2 3"].
+    """
+    return [" ".join(str(c) for c in self.categories[i])
+            for i in self._sequenceStarts()]
+
+
+  def getSamples(self):
+    """
+    Returns the samples joined at reset points, as in
+    NetworkDataGenerator.getSamples().
+    """
+    starts = self._sequenceStarts()
+    samples = OrderedDict()
+    for start, end in zip(starts, numpy.append(starts[1:], len(self.tokens))):
+      samples[self.ids[start]] = ([" ".join(self.tokens[start:end])],
+                                  self.categories[start])
+
+    return samples
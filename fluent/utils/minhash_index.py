@@ -0,0 +1,295 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+This file contains a MinHash locality-sensitive hashing index for approximate
+nearest neighbor search over sparse bitmaps (SDRs).
+"""
+
+import numpy
+
+from fluent.utils.bitmap_store import BitmapStore
+from fluent.utils.overlap_index import flattenBitmaps
+
+
+
+# Number of hash values computed at once when hashing a batch of bitmaps.
+_CHUNK_SIZE = 2**24
+
+
+
+class MinHashLSHIndex(object):
+  """
+  Approximate overlap search with MinHash signatures and banded LSH tables.
+
+  Each prototype's ON bits are summarized by bands*rows MinHash values; two
+  bitmaps share a MinHash value with probability equal to their Jaccard
+  similarity s. The signature is cut into bands of rows values, and prototypes
+  that match the query on all rows of at least one band are candidates, which
+  happens with probability 1 - (1 - s^rows)^bands. More bands raise recall and
+  more rows cut the number of false candidates. Candidates are re-ranked by
+  their exact overlap with the query.
+
+  Each band's table is a sorted array of band keys, so lookups are binary
+  searches. Added prototypes are buffered, and on the next query their keys
+  are sorted and merged into the tables.
+
+  The exact overlaps are computed from the prototypes' bitmaps, which the
+  index stores itself unless it is given the store of a caller that already
+  keeps them by prototype ID.
+  """
+
+  def __init__(self, n, bands=32, rows=2, seed=42, bitmaps=None):
+    """
+    @param n        (int)     Number of bits in the SDRs stored in the index.
+    @param bands    (int)     Number of LSH bands.
+    @param rows     (int)     Number of MinHash values per band.
+    @param seed     (int)     Seed for the hash functions.
+    @param bitmaps  (BitmapStore)   Store of the prototypes' bitmaps, by
+                              ID, to reference instead of storing them again.
+                              The caller adds each prototype to the store as
+                              well as to the index, and clears both.
+    """
+    self.n = n
+    self.bands = bands
+    self.rows = rows
+    self.seed = seed
+    self._isSharedStore = bitmaps is not None
+    self._bitmaps = bitmaps if bitmaps is not None else BitmapStore(n)
+
+    self._initHashes()
+    self.clear()
+
+
+  def _initHashes(self):
+    """Generate the hash functions from the seed."""
+    rng = numpy.random.RandomState(self.seed)
+    # Each hash function is a random permutation of the n bit positions.
+    self._permutations = numpy.array(
+      [rng.permutation(self.n) for _ in xrange(self.bands*self.rows)],
+      dtype=numpy.int32)
+    # Odd 64-bit multipliers to combine a band's rows into one key.
+    self._multipliers = (
+      (rng.randint(1, 2**31, self.rows).astype(numpy.uint64)
+       << numpy.uint64(32)) |
+      rng.randint(1, 2**31, self.rows).astype(numpy.uint64) |
+      numpy.uint64(1))
+
+
+  def __getstate__(self):
+    # The hash functions are regenerated from the seed rather than pickled.
+    state = self.__dict__.copy()
+    del state["_permutations"]
+    del state["_multipliers"]
+    return state
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._initHashes()
+
+
+  def clear(self):
+    """Remove all prototypes from the index."""
+    # The band keys of each band's table, in sorted order, and the prototype
+    # ID of each key.
+    self._sortedKeys = numpy.zeros((self.bands, 0), dtype=numpy.uint64)
+    self._order = numpy.zeros((self.bands, 0), dtype=numpy.int64)
+    if not self._isSharedStore:
+      self._bitmaps.clear()
+    self._pendingKeys = []
+    self._pendingBits = []
+    self._pendingLengths = []
+    self._numPending = 0
+
+
+  def __len__(self):
+    return self._order.shape[1] + self._numPending
+
+
+  def _bandKeys(self, bits, lengths):
+    """
+    Return the LSH key of each band for flattened bitmaps, as a (bands,
+    numBitmaps) array.
+    """
+    numHashes = self.bands * self.rows
+    signatures = numpy.full((numHashes, lengths.size), self.n,
+                            dtype=numpy.int32)
+    starts = numpy.cumsum(lengths) - lengths
+
+    # Take the minimum of each hash over each bitmap's bits, in chunks of about
+    # _CHUNK_SIZE hash values to bound the memory of the gather.
+    chunkBitmaps = max(1, int(_CHUNK_SIZE / numHashes /
+                              max(lengths.mean() if lengths.size else 1, 1)))
+    for first in xrange(0, lengths.size, chunkBitmaps):
+      nonEmpty = numpy.flatnonzero(lengths[first:first+chunkBitmaps]) + first
+      if not nonEmpty.size:
+        continue
+      chunkStart = starts[nonEmpty[0]]
+      chunkEnd = starts[nonEmpty[-1]] + lengths[nonEmpty[-1]]
+      signatures[:, nonEmpty] = numpy.minimum.reduceat(
+        self._permutations[:, bits[chunkStart:chunkEnd]],
+        starts[nonEmpty] - chunkStart, axis=1)
+
+    signatures = signatures.reshape(self.bands, self.rows, lengths.size)
+    return (signatures.astype(numpy.uint64) *
+            self._multipliers[:, None]).sum(axis=1)
+
+
+  def add(self, bitmap):
+    """
+    Add a prototype to the index.
+
+    @param bitmap   (numpy.array)   Indices of the ON bits.
+    @return         (int)           ID of the new prototype.
+    """
+    return self.addBatch([bitmap])[0]
+
+
+  def addBatch(self, bitmaps):
+    """
+    Add prototypes to the index in bulk.
+
+    @param bitmaps  (list)          Numpy arrays of the indices of the ON bits.
+    @return         (numpy.array)   IDs of the new prototypes.
+    """
+    return self.addFlattened(*flattenBitmaps(bitmaps, self.n))
+
+
+  def addFlattened(self, bits, lengths):
+    """
+    Add prototypes to the index in bulk, given as from flattenBitmaps().
+
+    @param bits     (numpy.array)   The unique ON bits of each bitmap, in order.
+    @param lengths  (numpy.array)   Number of unique ON bits in each bitmap.
+    @return         (numpy.array)   IDs of the new prototypes.
+    """
+    ids = numpy.arange(len(self), len(self) + lengths.size)
+    self._pendingKeys.append(self._bandKeys(bits, lengths))
+    if not self._isSharedStore:
+      self._pendingBits.append(bits)
+      self._pendingLengths.append(lengths)
+    self._numPending += lengths.size
+
+    return ids
+
+
+  def _commit(self):
+    """Add the buffered prototypes to the band tables."""
+    if not self._numPending:
+      return
+
+    # Sort only the new keys, then merge them into each band's table.
+    newKeys = numpy.hstack(self._pendingKeys)
+    newOrder = numpy.argsort(newKeys, axis=1, kind="mergesort")
+    newSortedKeys = newKeys[numpy.arange(self.bands)[:, None], newOrder]
+    numOld = self._order.shape[1]
+    numNew = newKeys.shape[1]
+
+    sortedKeys = numpy.empty((self.bands, numOld + numNew), dtype=numpy.uint64)
+    order = numpy.empty((self.bands, numOld + numNew), dtype=numpy.int64)
+    for b in xrange(self.bands):
+      # The new IDs are greater than the old ones, so they go after equal keys.
+      positions = numpy.arange(numNew) + numpy.searchsorted(
+        self._sortedKeys[b], newSortedKeys[b], side="right")
+      isOld = numpy.ones(numOld + numNew, dtype=bool)
+      isOld[positions] = False
+      sortedKeys[b, positions] = newSortedKeys[b]
+      sortedKeys[b, isOld] = self._sortedKeys[b]
+      order[b, positions] = newOrder[b] + numOld
+      order[b, isOld] = self._order[b]
+    self._sortedKeys = sortedKeys
+    self._order = order
+
+    if not self._isSharedStore:
+      self._bitmaps.extend(numpy.concatenate(self._pendingBits),
+                           numpy.concatenate(self._pendingLengths))
+
+    self._pendingKeys = []
+    self._pendingBits = []
+    self._pendingLengths = []
+    self._numPending = 0
+
+
+  def candidates(self, bitmap):
+    """
+    Return the IDs of the prototypes that share at least one band with the
+    bitmap.
+
+    @param bitmap   (numpy.array)   Indices of the ON bits.
+    @return         (numpy.array)   Prototype IDs, in ascending order.
+    """
+    self._commit()
+    bits, lengths = flattenBitmaps([bitmap], self.n)
+    keys = self._bandKeys(bits, lengths)[:, 0]
+
+    matches = []
+    for b in xrange(self.bands):
+      left = numpy.searchsorted(self._sortedKeys[b], keys[b], side="left")
+      right = numpy.searchsorted(self._sortedKeys[b], keys[b], side="right")
+      if right > left:
+        matches.append(self._order[b, left:right])
+
+    if not matches:
+      return numpy.zeros(0, dtype=numpy.int64)
+
+    return numpy.unique(numpy.concatenate(matches))
+
+
+  def overlaps(self, bitmap, ids):
+    """
+    Return the exact overlap of the bitmap with each of the given prototypes.
+
+    @param bitmap   (numpy.array)   Indices of the ON bits.
+    @param ids      (numpy.array)   Prototype IDs.
+    @return         (numpy.array)   Number of shared ON bits, per ID.
+    """
+    self._commit()
+    ids = numpy.asarray(ids, dtype=numpy.int64)
+    if not ids.size:
+      return numpy.zeros(0, dtype=numpy.int64)
+
+    isOn = numpy.zeros(self.n, dtype=bool)
+    isOn[bitmap] = True
+
+    # Gather the candidates' ragged positions into one flat array.
+    positions, lengths = self._bitmaps.gather(ids)
+    owners = numpy.repeat(numpy.arange(ids.size), lengths)
+
+    return numpy.bincount(owners[isOn[positions]],
+                          minlength=ids.size)
+
+
+  def topK(self, bitmap, k):
+    """
+    Return (up to) k of the retrieved candidates with the largest overlap with
+    the bitmap. Ties are broken in favor of the lower prototype ID.
+
+    @param bitmap   (numpy.array)   Indices of the ON bits.
+    @param k        (int)           Number of prototypes to return.
+    @return ids     (numpy.array)   Prototype IDs, sorted by overlap (largest
+                                    first).
+    @return overlap (numpy.array)   The overlap for each of the returned IDs.
+    """
+    ids = self.candidates(bitmap)
+    overlaps = self.overlaps(bitmap, ids)
+    order = numpy.lexsort((ids, -overlaps))[:k]
+
+    return ids[order], overlaps[order]
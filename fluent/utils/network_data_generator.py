@@ -34,6 +34,7 @@ import string
 from collections import defaultdict, OrderedDict
 
 from fluent.utils.csv_helper import readCSV
+from fluent.utils.memory_record_stream import MemoryRecordStream
 from fluent.utils.text_preprocess import TextPreprocess
 
 try:
@@ -73,7 +74,8 @@ class NetworkDataGenerator(object):
     self.sequenceCount = 0
 
 
-  def setupData(self, dataPath, numLabels=0, ordered=False, stripCats=False, **kwargs):
+  def setupData(self, dataPath, numLabels=0, ordered=False, stripCats=False,
+                inMemory=False, **kwargs):
     """
     Main method of this class. Use for setting up a network data file.
     
@@ -82,11 +84,11 @@ class NetworkDataGenerator(object):
     @param textPreprocess  (bool)   True will preprocess text while tokenizing.
     @param ordered         (bool)   Keep data samples (sequences) in order,
                                     otherwise randomize.
-    
-    
+    @param inMemory        (bool)   Return the data as a MemoryRecordStream
+                                    instead of saving it to files.
     
     @return dataFileName   (str)    Network data file name; same directory as
-                                    input data file.
+                                    input data file. Or the MemoryRecordStream.
     """
     self.split(dataPath, numLabels, **kwargs)
   
@@ -99,6 +101,9 @@ class NetworkDataGenerator(object):
     
     if stripCats:
       self._stripCategories()
+
+    if inMemory:
+      return self.getRecordStream()
   
     self.saveData(dataFileName, classificationFileName)
     
@@ -173,6 +178,14 @@ class NetworkDataGenerator(object):
     random.shuffle(self.records)
 
 
+  def getRecordStream(self):
+    """
+    Return the records as a MemoryRecordStream, which the network can read in
+    place of a file saved by saveData().
+    """
+    return MemoryRecordStream.fromRecords(self.records)
+
+
   def saveData(self, dataOutputFile, categoriesOutputFile):
     """
     Save the processed data and the associated category mapping.
@@ -354,6 +367,28 @@ class NetworkDataGenerator(object):
       raise e
 
 
+  @staticmethod
+  def getTokens(networkDataFile):
+    """
+    Returns the token of each record.
+    @param networkDataFile  (str)     Path to file in the FileRecordStream
+                                      format
+    @return                 (list)    list of token strings
+    """
+    try:
+      with open(networkDataFile) as f:
+        reader = csv.reader(f)
+        tokenIdx = next(reader).index("_token")
+        next(reader, None)
+        next(reader, None)
+
+        return [line[tokenIdx] for line in reader]
+
+    except IOError as e:
+      print "Could not open the file {}.".format(networkDataFile)
+      raise e
+
+
   @staticmethod
   def getResetsIndices(networkDataFile):
     """Returns the indices at which the data sequences reset."""
@@ -0,0 +1,358 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+This file contains an inverted index for computing the overlap between sparse
+bitmaps (SDRs) and a set of stored prototype bitmaps.
+"""
+
+import numpy
+
+
+
+def flattenBitmaps(bitmaps, n):
+  """
+  Concatenate bitmaps into one array of ON bits, deduplicating and sorting the
+  bits of each bitmap, without a Python-level pass over the bits.
+
+  @param bitmaps  (list)          Numpy arrays of the indices of the ON bits.
+  @param n        (int)           Number of bits in the bitmaps.
+  @return bits    (numpy.array)   The unique ON bits of each bitmap, in order.
+  @return lengths (numpy.array)   Number of unique ON bits in each bitmap.
+  """
+  lengths = numpy.array([len(bitmap) for bitmap in bitmaps], dtype=numpy.int64)
+  if not lengths.sum():
+    return numpy.zeros(0, dtype=numpy.int64), lengths
+
+  bits = numpy.concatenate(bitmaps).astype(numpy.int64)
+  if bits.min() < 0 or bits.max() >= n:
+    raise ValueError("Bitmap positions must be in the range [0, n).")
+
+  # Bitmaps are usually sorted and unique already, which is cheap to check.
+  isIncreasing = numpy.diff(bits) > 0
+  boundaries = numpy.cumsum(lengths)[:-1]
+  isIncreasing[boundaries[(boundaries > 0) & (boundaries < bits.size)] - 1] = True
+  if isIncreasing.all():
+    return bits, lengths
+
+  owners = numpy.repeat(numpy.arange(lengths.size), lengths)
+  keys = numpy.unique(owners * n + bits)
+  owners, bits = keys // n, keys % n
+
+  return bits, numpy.bincount(owners, minlength=lengths.size)
+
+
+
+def raggedIndices(starts, lengths):
+  """
+  Return the indices of the concatenated slices [start, start+length) of a
+  flat array, e.g. to gather ragged rows without a Python-level loop.
+  """
+  ends = numpy.cumsum(lengths)
+  return (numpy.arange(ends[-1] if ends.size else 0) +
+          numpy.repeat(starts - (ends - lengths), lengths))
+
+
+
+class OverlapIndex(object):
+  """
+  Inverted index mapping each bit of an n-bit SDR to the sorted array of
+  prototype IDs that have that bit ON. The overlap of a query with every
+  prototype is then accumulated over only the query's posting lists, rather
+  than scanning the full prototype set.
+
+  The posting lists are kept in a single compressed-column layout: the IDs for
+  bit b are postingIds[postingStarts[b]:postingStarts[b+1]], in ascending order.
+  Added prototypes are buffered and merged into the posting lists on the next
+  query, so add() is O(w) and the merge is one vectorized pass.
+  """
+
+  def __init__(self, n):
+    """
+    @param n      (int)     Number of bits in the SDRs stored in the index.
+    """
+    self.n = n
+    self.clear()
+
+
+  def clear(self):
+    """Remove all prototypes from the index."""
+    self._postingIds = numpy.zeros(0, dtype=numpy.int32)
+    self._postingStarts = numpy.zeros(self.n+1, dtype=numpy.int64)
+    self._numIndexed = 0
+    self._pendingBits = []
+    self._pendingLengths = []
+    self._numPending = 0
+
+
+  def __len__(self):
+    return self._numIndexed + self._numPending
+
+
+  def add(self, bitmap):
+    """
+    Add a prototype to the index.
+
+    @param bitmap   (numpy.array)   Indices of the ON bits.
+    @return         (int)           ID of the new prototype.
+    """
+    return self.addBatch([bitmap])[0]
+
+
+  def addBatch(self, bitmaps):
+    """
+    Add prototypes to the index in bulk.
+
+    @param bitmaps  (list)          Numpy arrays of the indices of the ON bits.
+    @return         (numpy.array)   IDs of the new prototypes.
+    """
+    return self.addFlattened(*flattenBitmaps(bitmaps, self.n))
+
+
+  def addFlattened(self, bits, lengths):
+    """
+    Add prototypes to the index in bulk, given as from flattenBitmaps().
+
+    @param bits     (numpy.array)   The unique ON bits of each bitmap, in order.
+    @param lengths  (numpy.array)   Number of unique ON bits in each bitmap.
+    @return         (numpy.array)   IDs of the new prototypes.
+    """
+    ids = numpy.arange(len(self), len(self) + lengths.size)
+    self._pendingBits.append(bits)
+    self._pendingLengths.append(lengths)
+    self._numPending += lengths.size
+
+    return ids
+
+
+  def _commit(self):
+    """Merge the buffered prototypes into the posting lists."""
+    if not self._numPending:
+      return
+
+    numPending = self._numPending
+    newBits = numpy.concatenate(self._pendingBits)
+    newIds = numpy.repeat(numpy.arange(numPending),
+                          numpy.concatenate(self._pendingLengths))
+
+    # Sorting by (bit, ID) keys keeps the IDs ascending within each posting
+    # list; sorting the keys is cheaper than a stable argsort of the bits.
+    keys = newBits * numPending + newIds
+    keys.sort()
+    newBits = keys // numPending
+    newIds = (keys % numPending + self._numIndexed).astype(numpy.int32)
+    newStarts = numpy.zeros(self.n+1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(newBits, minlength=self.n), out=newStarts[1:])
+
+    # Every new ID is greater than the existing ones, so each merged posting
+    # list is the old list followed by the new entries for that bit.
+    oldBits = numpy.repeat(numpy.arange(self.n), numpy.diff(self._postingStarts))
+    merged = numpy.empty(self._postingIds.size + newIds.size,
+                         dtype=numpy.int32)
+    merged[numpy.arange(self._postingIds.size) + newStarts[oldBits]] = (
+      self._postingIds)
+    merged[numpy.arange(newIds.size) + self._postingStarts[newBits+1]] = newIds
+
+    self._postingIds = merged
+    self._postingStarts += newStarts
+    self._numIndexed = len(self)
+    self._pendingBits = []
+    self._pendingLengths = []
+    self._numPending = 0
+
+
+  def _getPostings(self, bitmap):
+    """Return the non-empty posting lists for the unique bits of the bitmap."""
+    self._commit()
+    postings = []
+    for bit in numpy.unique(bitmap):
+      start, end = self._postingStarts[bit], self._postingStarts[bit+1]
+      if end > start:
+        postings.append(self._postingIds[start:end])
+
+    return postings
+
+
+  def overlaps(self, bitmap):
+    """
+    Return the overlap of the bitmap with every prototype.
+
+    @param bitmap   (numpy.array)   Indices of the ON bits.
+    @return         (numpy.array)   Number of shared ON bits, indexed by
+                                    prototype ID.
+    """
+    if not len(self):
+      return numpy.zeros(0, dtype=numpy.int64)
+
+    return numpy.bincount(self._concatenate(self._getPostings(bitmap)),
+                          minlength=len(self))
+
+
+  def overlapsBatch(self, bitmaps):
+    """
+    Return the overlap of each of the bitmaps with every prototype.
+
+    @param bitmaps  (list)          Numpy arrays of the indices of the ON bits.
+    @return         (numpy.array)   Number of shared ON bits; rows are the
+                                    bitmaps, columns are prototype IDs.
+    """
+    return self.overlapsFlattened(*flattenBitmaps(bitmaps, self.n))
+
+
+  def overlapsFlattened(self, bits, lengths):
+    """
+    Return the overlap of each of the bitmaps, given as from flattenBitmaps(),
+    with every prototype; see overlapsBatch().
+    """
+    self._commit()
+    numProtos = len(self)
+    if not numProtos or not lengths.size:
+      return numpy.zeros((lengths.size, numProtos), dtype=numpy.int64)
+
+    # Gather all of the bitmaps' posting lists at once, and count the hits of
+    # each (bitmap, prototype) pair.
+    starts = self._postingStarts[bits]
+    counts = self._postingStarts[bits+1] - starts
+    ids = self._postingIds[raggedIndices(starts, counts)]
+    rows = numpy.repeat(numpy.repeat(numpy.arange(lengths.size), lengths),
+                        counts)
+
+    overlaps = numpy.bincount(rows * numProtos + ids,
+                              minlength=lengths.size * numProtos)
+
+    return overlaps.reshape(lengths.size, numProtos)
+
+
+  def containing(self, bitmap):
+    """
+    Return the IDs of the prototypes that have all the ON bits of the bitmap,
+    i.e. where the overlap equals the bitmap size.
+
+    @param bitmap   (numpy.array)   Indices of the ON bits.
+    @return         (numpy.array)   Prototype IDs, in ascending order.
+    """
+    if not len(bitmap):
+      return numpy.arange(len(self))
+
+    self._commit()
+    postings = sorted([self._postingIds[self._postingStarts[bit]:
+                                        self._postingStarts[bit+1]]
+                       for bit in numpy.unique(bitmap)], key=len)
+
+    # Intersect starting from the shortest posting list.
+    candidates = postings[0]
+    for posting in postings[1:]:
+      if not candidates.size:
+        break
+      candidates = candidates[self._inSorted(posting, candidates)]
+
+    return candidates
+
+
+  def topK(self, bitmap, k):
+    """
+    Return the k prototypes with the largest overlap with the bitmap, using
+    max-score early termination: posting lists are processed shortest first,
+    and once the k-th best overlap exceeds the number of lists left, no unseen
+    prototype can make the top k. The remaining (longest) lists are then only
+    probed for the surviving candidates.
+
+    Ties are broken in favor of the lower prototype ID. If fewer than k
+    prototypes overlap the bitmap, the result is padded with the lowest IDs of
+    the non-overlapping prototypes.
+
+    @param bitmap   (numpy.array)   Indices of the ON bits.
+    @param k        (int)           Number of prototypes to return.
+    @return ids     (numpy.array)   Prototype IDs, sorted by overlap (largest
+                                    first).
+    @return overlap (numpy.array)   The overlap for each of the returned IDs.
+    """
+    numProtos = len(self)
+    k = min(k, numProtos)
+    if k <= 0:
+      return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+
+    postings = sorted(self._getPostings(bitmap), key=len)
+    numPostings = len(postings)
+
+    # The k-th best overlap after j lists is at most j, so the bound is checked
+    # once, after just over half of the lists.
+    j = min(numPostings/2 + 1, numPostings)
+    scores = numpy.bincount(self._concatenate(postings[:j]),
+                            minlength=numProtos)
+    remaining = numPostings - j
+    leaders = scores[scores > remaining] if remaining else scores[:0]
+
+    if leaders.size >= k:
+      # Unseen prototypes can't make the top k since k prototypes already have
+      # more overlap than the number of lists left. So the remaining (longest)
+      # lists only need to be counted for prototypes that can still reach the
+      # k-th best overlap.
+      threshold = numpy.partition(leaders, leaders.size-k)[leaders.size-k]
+      isCandidate = scores >= threshold - remaining
+      candidates = numpy.flatnonzero(isCandidate)
+      if candidates.size * 8 < len(postings[j]):
+        # Few candidates: binary search for them in each sorted posting list.
+        candidateScores = scores[candidates]
+        for posting in postings[j:]:
+          candidateScores += self._inSorted(posting, candidates)
+      else:
+        hits = numpy.concatenate(postings[j:])
+        scores += numpy.bincount(hits[isCandidate[hits]], minlength=numProtos)
+        candidateScores = scores[candidates]
+    else:
+      scores += numpy.bincount(self._concatenate(postings[j:]),
+                               minlength=numProtos)
+      candidates = numpy.arange(numProtos)
+      candidateScores = scores
+
+    if k < candidates.size:
+      top = numpy.argpartition(-candidateScores, k-1)[:k]
+      # Include all candidates tied with the k-th score so the ID tie-break is
+      # deterministic.
+      kthScore = candidateScores[top].min()
+      top = numpy.flatnonzero(candidateScores >= kthScore)
+      candidates = candidates[top]
+      candidateScores = candidateScores[top]
+
+    order = numpy.lexsort((candidates, -candidateScores))[:k]
+
+    return candidates[order], candidateScores[order]
+
+
+  @staticmethod
+  def _concatenate(postings):
+    """Concatenate posting lists, which may be an empty list."""
+    if not postings:
+      return numpy.zeros(0, dtype=numpy.int32)
+
+    return numpy.concatenate(postings)
+
+
+  @staticmethod
+  def _inSorted(sortedArray, values):
+    """Return a boolean mask of which values are present in the sorted array."""
+    if not sortedArray.size:
+      return numpy.zeros(values.size, dtype=bool)
+
+    loc = numpy.searchsorted(sortedArray, values)
+    loc[loc == sortedArray.size] = 0
+
+    return sortedArray[loc] == values
@@ -97,12 +97,9 @@ class ClassificationModelsTest(unittest.TestCase):
     expectedClasses, resultClasses = self.getExpectedClassifications(
       runner, os.path.join(DATA_DIR, "responses_expected_classes_keywords.csv"))
 
-    for i, (e, r) in enumerate(zip(expectedClasses, resultClasses)):
-      if i in (7, 9, 12):
-        # Ties amongst winning labels are handled randomly, which affects the
-        # third classification in these test samples.
-        e = e[:2]
-        r = r[:2]
+    # Ties amongst winning labels go to the lower label, so every
+    # classification is deterministic.
+    for e, r in zip(expectedClasses, resultClasses):
       self.assertEqual(sorted(e), sorted(r),
       "Keywords model predicted classes other than what we expect.")
 
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""Tests for resetting ClassificationModelHTM, with a real network."""
+
+import json
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from fluent.models.classify_htm import ClassificationModelHTM
+from fluent.utils.network_data_generator import NetworkDataGenerator
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.path.pardir, os.path.pardir, "data",
+                           "network_configs", "sp_tm_knn.json")
+
+# The first sequences are for training, and the rest for testing.
+NUM_TRAINING_SEQUENCES = 5
+
+
+
+class ClassificationModelHTMResetTest(unittest.TestCase):
+  """Test that a reset HTM model works as a newly built one."""
+
+  def setUp(self):
+    self.modelDir = tempfile.mkdtemp()
+    self.dataPath = os.path.join(DATA_DIR, "responses_network.csv")
+    with open(CONFIG_PATH, "rb") as f:
+      self.networkConfig = json.load(f)
+    self.numTokens = NetworkDataGenerator.getNumberOfTokens(self.dataPath)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.modelDir)
+
+
+  def _createModel(self):
+    return ClassificationModelHTM(self.networkConfig,
+                                  self.dataPath,
+                                  verbosity=0,
+                                  modelDir=self.modelDir,
+                                  prepData=False)
+
+
+  def _trainAndTest(self, model):
+    """Return the classifier outputs of each test sequence, once trained."""
+    model.trainModel(
+      iterations=sum(self.numTokens[:NUM_TRAINING_SEQUENCES]))
+    return [model.testSequence(numTokens)
+            for numTokens in self.numTokens[NUM_TRAINING_SEQUENCES:]]
+
+
+  def testResetMatchesNewNetwork(self):
+    """
+    Once trained and reset, the model's network classifies as a newly built
+    network trained the same way does.
+    """
+    model = self._createModel()
+    firstOutputs = self._trainAndTest(model)
+    model.resetModel()
+    resetOutputs = self._trainAndTest(model)
+    newOutputs = self._trainAndTest(self._createModel())
+
+    self.assertEqual(len(resetOutputs), len(newOutputs))
+    for reset, new, first in zip(resetOutputs, newOutputs, firstOutputs):
+      numpy.testing.assert_array_equal(reset, new)
+      numpy.testing.assert_array_equal(reset, first)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
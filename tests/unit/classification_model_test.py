@@ -25,9 +25,14 @@ import unittest
 
 from collections import OrderedDict
 from fluent.models.classification_model import ClassificationModel
+from fluent.models.classify_context import ClassificationModelContext
 from fluent.models.classify_endpoint import ClassificationModelEndpoint
 from fluent.models.classify_fingerprint import ClassificationModelFingerprint
+from fluent.models.classify_keyword_endpoint import (
+  ClassificationModelKeywordsEndpoint)
 from fluent.models.classify_keywords import ClassificationModelKeywords
+from fluent.models.classify_traditional import ClassificationModelTraditional
+from fluent.models.overlap_knn import OverlapKNNClassifier
 
 
 
@@ -65,6 +70,33 @@ class ClassificationModelTest(unittest.TestCase):
                     "Output should be labels 2 and 0.")
 
 
+  def testWinningLabelsBatch(self):
+    """Winning labels of each row match those of getWinningLabels()."""
+    model = ClassificationModel()
+    labelFreqs = numpy.array([[3, 1, 4, 0, 1, 0],
+                              [0, 0, 0, 0, 0, 0],
+                              [0, 2, 0, 5, 0, 0]])
+
+    topLabels = model.getWinningLabelsBatch(labelFreqs, numLabels=2)
+    self.assertSequenceEqual([labels.tolist() for labels in topLabels],
+                             [[2, 0], [], [3, 1]])
+
+
+  def testWinningLabelsTies(self):
+    """Tied labels are ordered by label, in single and batch results."""
+    model = ClassificationModel()
+    labelFreqs = numpy.array([[1, 2, 0, 2, 1],
+                              [1, 1, 1, 1, 1]])
+
+    for _ in xrange(5):
+      self.assertSequenceEqual(
+        model.getWinningLabels(labelFreqs[0], numLabels=3).tolist(), [1, 3, 0])
+      self.assertSequenceEqual(
+        [labels.tolist() for labels in
+         model.getWinningLabelsBatch(labelFreqs, numLabels=3)],
+        [[1, 3, 0], [0, 1, 2]])
+
+
   def testNoWinningLabels(self):
     """Inferring 0/4 classes should return 0 winning labels."""
     model = ClassificationModel()
@@ -144,6 +176,270 @@ class ClassificationModelTest(unittest.TestCase):
                     "Outputs for samples 2 and 4 should be identical.")
 
 
+  def testBatchTestingKeywords(self):
+    """Testing a list of indices matches testing one index at a time."""
+    samples = {0: (["Pickachu", "Eevee"], numpy.array([0, 2, 2])),
+               1: (["Eevee"], numpy.array([2])),
+               2: (["Charmander", "Abra"], numpy.array([0, 1, 1])),
+               3: (["Abra"], numpy.array([1])),
+               4: (["Squirtle"], numpy.array([1, 0, 1]))}
+
+    model = ClassificationModelKeywords()
+    model.encodeSamples(samples)
+    model.trainModel(range(len(samples)))
+
+    output = model.testModelBatch(range(len(samples)))
+    for i in xrange(len(samples)):
+      self.assertSequenceEqual(output[i].tolist(), model.testModel(i).tolist())
+
+
+  def testQueryTopK(self):
+    """queryModel() with topK returns the closest samples of the full query."""
+    model = ClassificationModelKeywords()
+
+    samples = {0: (["pickachu", "eevee"], numpy.array([0, 2, 2])),
+               1: (["eevee"], numpy.array([2])),
+               2: (["charmander", "abra"], numpy.array([0, 1, 1])),
+               3: (["abra"], numpy.array([1])),
+               4: (["squirtle"], numpy.array([1, 0, 1]))}
+
+    model.encodeSamples(samples)
+    model.trainModel(range(len(samples)))
+
+    sortedDistances = model.queryModel("Eevee", False)
+    self.assertEqual(len(sortedDistances), len(samples))
+    # Both samples with the query token are at distance 0, ordered by ID.
+    self.assertSequenceEqual([(0, 0.0), (1, 0.0)], sortedDistances[:2])
+    self.assertSequenceEqual(model.queryModel("Eevee", False, topK=3),
+                             sortedDistances[:3])
+
+
+  def testBatchTrainingKeywords(self):
+    """Training on a list of indices matches training one index at a time."""
+    samples = {0: (["Pickachu", "Eevee"], numpy.array([0, 2, 2])),
+               1: (["Eevee"], numpy.array([2])),
+               2: (["Charmander", "Abra"], numpy.array([0, 1, 1])),
+               3: (["Abra"], numpy.array([1])),
+               4: (["Squirtle"], numpy.array([1, 0, 1]))}
+
+    model = ClassificationModelKeywords()
+    model.encodeSamples(samples)
+    for i in xrange(len(samples)):
+      model.trainModel(i)
+
+    batchModel = ClassificationModelKeywords()
+    batchModel.encodeSamples(samples)
+    batchModel.trainModel(range(len(samples)))
+
+    self.assertSequenceEqual(model.sampleReference, batchModel.sampleReference)
+    for i in xrange(len(samples)):
+      self.assertSequenceEqual(model.testModel(i).tolist(),
+                               batchModel.testModel(i).tolist())
+
+
+  def testKeywordsInfer(self):
+    """Keywords infer() averages the distances of the sample's tokens."""
+    samples = {0: (["Pickachu", "Eevee"], numpy.array([0])),
+               1: (["Charmander", "Abra"], numpy.array([1])),
+               2: (["Eevee", "Squirtle"], numpy.array([2]))}
+
+    model = ClassificationModelKeywords()
+    model.encodeSamples(samples)
+    model.trainModel([0, 1])
+
+    patterns = model.patterns[2]["pattern"]
+    expected = numpy.mean([model.classifier.getDistances(p["bitmap"])
+                           for p in patterns], axis=0)
+    self.assertTrue(numpy.allclose(model.infer(patterns), expected))
+    self.assertSequenceEqual(model.testModel(2).tolist(), [0])
+
+
+  def testSharedPrototypes(self):
+    """Shared prototypes vote with the counts of their categories."""
+    classifier = OverlapKNNClassifier(k=1, n=20, exact=True)
+    protoIds = classifier.learnShared(["a", "b", "a", "a"],
+                                      [[0, 1], [5, 6], [0, 1], [0, 1]],
+                                      [[0], [1], [1, 2], [2]])
+
+    self.assertSequenceEqual(protoIds.tolist(), [0, 1, 0, 0])
+    self.assertEqual(classifier.getNumPatterns(), 2)
+    winner, inferenceResult = classifier.infer(numpy.array([0, 1]))
+    self.assertEqual(winner, 2)
+    self.assertTrue(numpy.allclose(inferenceResult, [0.25, 0.25, 0.5]))
+
+    with self.assertRaises(ValueError):
+      classifier.learnBatch([[3, 4]], [0])
+
+
+  def testApproximateKNN(self):
+    """Approximate search stores each prototype once and finds near matches."""
+    rng = numpy.random.RandomState(42)
+    bitmaps = [numpy.sort(rng.choice(1024, 40, replace=False))
+               for _ in xrange(100)]
+    categories = [i % 5 for i in xrange(100)]
+
+    classifier = OverlapKNNClassifier(k=1, n=1024, approximate=True)
+    classifier.learnBatch(bitmaps[:50], categories[:50])
+    classifier.infer(bitmaps[0])
+    classifier.learnBatch(bitmaps[50:], categories[50:])
+
+    self.assertEqual(classifier.getNumPatterns(), 100)
+    self.assertEqual(len(classifier.index), 0)
+    self.assertIs(classifier.lshIndex._bitmaps, classifier._bitmaps)
+    for i in (3, 60, 99):
+      winner, _ = classifier.infer(bitmaps[i])
+      self.assertEqual(winner, categories[i])
+      self.assertEqual(classifier.getDistances(bitmaps[i])[i], 0.0)
+    self.assertTrue(numpy.allclose(
+      classifier.inferBatch(bitmaps[:10]).argmax(axis=1), categories[:10]))
+
+    # Only the retrieved prototypes containing the input vote.
+    exactClassifier = OverlapKNNClassifier(k=1, n=1024, exact=True,
+                                           approximate=True)
+    exactClassifier.learnBatch(bitmaps, categories)
+    self.assertEqual(exactClassifier.infer(bitmaps[7])[0], categories[7])
+    self.assertIsNone(exactClassifier.infer(
+      numpy.union1d(bitmaps[7], bitmaps[8]))[0])
+
+    classifier.clear()
+    self.assertEqual(classifier.getNumPatterns(), 0)
+    self.assertEqual(len(classifier._bitmaps), 0)
+
+
+  def testSharedTokenPrototypesKeywords(self):
+    """Keywords stores one prototype per distinct token."""
+    samples = {0: (["manager", "parking"], numpy.array([0])),
+               1: (["parking"], numpy.array([1])),
+               2: (["parking", "manager"], numpy.array([1]))}
+
+    model = ClassificationModelKeywords()
+    model.encodeSamples(samples)
+    model.trainModel(range(len(samples)))
+
+    self.assertEqual(model.classifier.getNumPatterns(), 2)
+    self.assertSequenceEqual(model.sampleReference, [0, 0, 1, 2, 2])
+    self.assertSequenceEqual(model.testModel(1).tolist(), [1, 0])
+    self.assertSequenceEqual(model.queryModel("parking", False),
+                             [(0, 0.0), (1, 0.0), (2, 0.0)])
+
+
+  def testUnlabeledSamplesKeywords(self):
+    """Keywords trains on samples with the stand-in label of no labels."""
+    samples = {0: (["manager", "parking"], numpy.array([])),
+               1: (["parking"], numpy.array([]))}
+
+    model = ClassificationModelKeywords(numLabels=0)
+    model.encodeSamples(samples)
+    model.trainModel(range(len(samples)))
+
+    self.assertEqual(model.classifier.getNumPatterns(), 2)
+    self.assertSequenceEqual(model.sampleReference, [0, 0, 1])
+    self.assertSequenceEqual(model.testModel(1).tolist(), [])
+    self.assertSequenceEqual(model.testModelBatch([0, 1])[0].tolist(), [])
+    self.assertSequenceEqual(model.queryModel("parking", False),
+                             [(0, 0.0), (1, 0.0)])
+
+    # The stand-in label doesn't vote among labeled samples.
+    model = ClassificationModelKeywords()
+    model.encodeSamples(samples)
+    model.patterns[0]["labels"] = numpy.array([-1])
+    model.patterns[1]["labels"] = numpy.array([1])
+    model.trainModel(range(len(samples)))
+    self.assertSequenceEqual(model.testModel(0).tolist(), [1])
+
+
+  def testCondensePrototypes(self):
+    """Each label's prototypes are merged into its earliest prototypes."""
+    bitmaps = [[0, 1, 2, 3], [10, 11, 12, 13], [0, 1, 4, 5], [0, 1, 4, 6]]
+    categories = [[0], [1], [0], [0]]
+
+    expected = {"union": [0, 1, 2, 4], "medoid": [0, 1, 4, 5]}
+    for method, expectedBitmap in expected.iteritems():
+      classifier = OverlapKNNClassifier(k=1, n=20, maxPrototypesPerLabel=1,
+                                        condenseMethod=method)
+      classifier.learnBatch(bitmaps, categories)
+
+      self.assertSequenceEqual(classifier.condense().tolist(), [0, 1])
+      self.assertEqual(classifier.getNumPatterns(), 2)
+      self.assertSequenceEqual(classifier._bitmaps[0].tolist(), expectedBitmap)
+      self.assertSequenceEqual(classifier._weights, [3, 1])
+      self.assertEqual(classifier.infer(numpy.array([10, 11]))[0], 1)
+
+    # Nothing to condense when every label is within the budget.
+    classifier = OverlapKNNClassifier(k=1, n=20, maxPrototypesPerLabel=3)
+    classifier.learnBatch(bitmaps, categories)
+    self.assertIsNone(classifier.condense())
+    self.assertEqual(classifier.getNumPatterns(), 4)
+
+    with self.assertRaises(ValueError):
+      OverlapKNNClassifier(exact=True, maxPrototypesPerLabel=1)
+
+
+  def testCondensedTrainingFingerprint(self):
+    """Training with a prototype budget keeps sampleReference aligned."""
+    samples = {0: (["Pickachu"], numpy.array([0])),
+               1: (["Eevee"], numpy.array([0])),
+               2: (["Charmander"], numpy.array([1])),
+               3: (["Abra"], numpy.array([1, 0]))}
+
+    model = ClassificationModelFingerprint(verbosity=0, maxPrototypesPerLabel=1)
+    model.encodeSamples(samples)
+    model.trainModel(range(len(samples)))
+
+    self.assertEqual(model.classifier.getNumPatterns(), 3)
+    self.assertSequenceEqual(model.sampleReference, [0, 2, 3])
+
+
+  def testDeferredCategoriesEndpoint(self):
+    """Endpoint categories are created once per label, when needed."""
+    samples = {0: (["Pickachu"], numpy.array([0])),
+               1: (["Eevee"], numpy.array([0, 1])),
+               2: (["Charmander"], numpy.array([1]))}
+
+    model = ClassificationModelEndpoint(verbosity=0)
+    model.encodeSamples(samples)
+    for i in xrange(len(samples)):
+      model.trainModel(i)
+
+    self.assertEqual(model.categoryBitmaps, {})
+    model.testModel(0)
+    self.assertSequenceEqual(sorted(model.categoryBitmaps.keys()), [0, 1])
+
+    bitmaps = dict(model.categoryBitmaps)
+    model.finalizeTraining()
+    for label, bitmap in bitmaps.iteritems():
+      self.assertIs(model.categoryBitmaps[label], bitmap)
+
+
+  def testLocalCategoriesEndpoint(self):
+    """The local backend builds categories from the samples' bitmaps."""
+    samples = {0: (["Pickachu"], numpy.array([0])),
+               1: (["Eevee"], numpy.array([0])),
+               2: (["Charmander"], numpy.array([1]))}
+
+    model = ClassificationModelEndpoint(verbosity=0, categoryBackend="local")
+    model.encodeSamples(samples)
+    model.trainModel(range(len(samples)))
+
+    self.assertSequenceEqual(model.testModel(2, numLabels=1).tolist(), [1])
+    # A category of one sample is (the lower w bits of) its bitmap.
+    w = model.categoryBuilder.w
+    bitmap = model.patterns[2]["pattern"]["bitmap"]
+    self.assertSequenceEqual(model.categoryBitmaps[1].tolist(),
+                             numpy.sort(bitmap)[:w].tolist())
+
+    self.assertEqual(w, model.encoder.w)
+
+    # A category without positive bits isn't scored.
+    model.categoryBuilder.negativeWeight = 2.0
+    model.trainModel(2, negatives=[model.patterns[2]["pattern"]])
+    self.assertSequenceEqual(model.testModel(2, numLabels=2).tolist(), [0])
+    self.assertEqual(model.categoryBitmaps[1].size, 0)
+
+    with self.assertRaises(ValueError):
+      ClassificationModelEndpoint(categoryBackend="remote")
+
+
   def testCompareCategories(self):
     model = ClassificationModelEndpoint()
 
@@ -188,6 +484,137 @@ class ClassificationModelTest(unittest.TestCase):
         "Unexpected category comparison values for Euclidean metric.")
 
 
+  def testCategoryDistancesEndpoint(self):
+    """Category distances of all pairs match compare()."""
+    samples = {0: (["Pickachu"], numpy.array([0])),
+               1: (["Eevee"], numpy.array([1])),
+               2: (["Charmander"], numpy.array([2]))}
+
+    model = ClassificationModelEndpoint(verbosity=0, categoryBackend="local")
+    model.encodeSamples(samples)
+    model.trainModel(range(len(samples)))
+
+    for metric in ("overlappingAll", "cosineSimilarity", "euclideanDistance"):
+      categories, distances = model.getCategoryDistanceMatrix(metric)
+      self.assertSequenceEqual(categories.tolist(), [0, 1, 2])
+      self.assertEqual(distances.shape, (3, 3))
+      for row, cat in enumerate(categories):
+        for col, compareCat in enumerate(categories):
+          expected = model.compareEncoder.compare(
+            model.categoryBitmaps[cat], model.categoryBitmaps[compareCat])
+          self.assertAlmostEqual(distances[row, col], expected[metric])
+
+    ranking = model.rankCategories(*model.getCategoryDistanceMatrix())
+    for cat in categories:
+      self.assertEqual(ranking[cat].keys()[0], cat)
+
+    # The nested dicts of all the measures match compare().
+    catDistances = model.getCategoryDistances(sort=False)
+    for cat, compareCat in [(0, 0), (0, 2), (2, 1)]:
+      expected = model.compareEncoder.compare(
+        model.categoryBitmaps[cat], model.categoryBitmaps[compareCat])
+      for metric, value in catDistances[cat][compareCat].iteritems():
+        self.assertAlmostEqual(value, expected[metric])
+    self.assertSequenceEqual(
+      model.getCategoryDistances()[1].keys(), ranking[1].keys())
+    self.assertSequenceEqual(
+      model.getWinningLabels(catDistances[1], 2, "overlappingAll").tolist(),
+      ranking[1].keys()[:2])
+
+
+  def testContextModel(self):
+    """The context model classifies its training samples locally."""
+    self.modelDir = "ClassificationModel"
+    model = ClassificationModelContext(verbosity=0)
+    samples = [model.encodePattern(text.split()) for text in
+               ["the kitchen smells", "more snacks please", "fix the wifi"]]
+    model.trainModel(samples, [[0], [1], [2]])
+
+    self.assertSequenceEqual([model.testModel(sample) for sample in samples],
+                             [[0], [1], [2]])
+    # Contexts are cached on disk, so a new encoder doesn't fetch them again.
+    bitmap = samples[0]["bitmap"]
+    contexts = model.encoder.getContext(bitmap)
+    keywords = model.encoder.extractKeywords("fix the wifi")
+    newModel = ClassificationModelContext(verbosity=0)
+    newModel.encoder.client = None
+    self.assertEqual(newModel.encoder.getContext(bitmap.astype(int)), contexts)
+    self.assertEqual(newModel.encoder.extractKeywords("fix the wifi"), keywords)
+
+
+  def testKeywordsEndpointModel(self):
+    """The keywords endpoint model classifies its training samples locally."""
+    self.modelDir = "ClassificationModel"
+    model = ClassificationModelKeywordsEndpoint(verbosity=0)
+    samples = [model.encodePattern(text.split()) for text in
+               ["the kitchen smells", "more snacks please", "fix the wifi"]]
+    model.trainModel(samples, [[0], [1], [2]])
+
+    self.assertSequenceEqual([model.testModel(sample) for sample in samples],
+                             [[0], [1], [2]])
+
+
+  def testTraditionalModel(self):
+    """The traditional model computes tfidf once, after training."""
+    self.modelDir = "ClassificationModel"
+    model = ClassificationModelTraditional(verbosity=0, numLabels=1)
+    samples = [model.encodePattern(text.split()) for text in
+               ["the kitchen smells", "more snacks please", "fix the wifi"]]
+    for sample, labels in zip(samples, [[0], [1], [2]]):
+      model.trainModel([sample], [labels])
+
+    self.assertEqual(len(model._idf), 0)
+    self.assertSequenceEqual([model.testModel(sample) for sample in samples],
+                             [(0,), (1,), (2,)])
+    self.assertAlmostEqual(model._idf[model.vocabulary["the"]],
+                           numpy.log(3 / 2.0))
+
+
+  def testTraditionalModelBatch(self):
+    """Batch tfidf scoring ranks the classes like scoring one by one."""
+    self.modelDir = "ClassificationModel"
+    model = ClassificationModelTraditional(verbosity=0, numLabels=2)
+    samples = [model.encodePattern(text.split()) for text in
+               ["the kitchen smells", "more snacks please", "fix the wifi",
+                "the snacks in the kitchen"]]
+    model.trainModel(samples, [[0], [1], [2], [0, 1]])
+
+    queries = [model.encodePattern(text.split()) for text in
+               ["kitchen snacks", "the wifi", "unknown words", ""]]
+    results = model.testSamples(queries)
+    self.assertSequenceEqual(results,
+                             [model.testModel(query) for query in queries])
+    self.assertSequenceEqual(results[0], (0, 1))
+    self.assertEqual(results[1][0], 2)
+    self.assertSequenceEqual(results[2], [])
+    self.assertSequenceEqual(results[3], [])
+
+
+  def testTraditionalModelHashing(self):
+    """Hashed tfidf keeps fixed-size tables and ranks like the vocabulary."""
+    self.modelDir = "ClassificationModel"
+    texts = ["the kitchen smells", "more snacks please", "fix the wifi",
+             "the snacks in the kitchen"]
+    queries = ["kitchen snacks", "the wifi", "smells please", ""]
+    results = []
+    for hashBits in (None, 16):
+      model = ClassificationModelTraditional(verbosity=0, numLabels=2,
+                                             hashBits=hashBits)
+      model.trainModel([model.encodePattern(text.split()) for text in texts],
+                       [[0], [1], [2], [0, 1]])
+      results.append(model.testSamples(
+        [model.encodePattern(text.split()) for text in queries]))
+
+    self.assertEqual(model.df.shape, (2**16,))
+    self.assertEqual(model.tf[0].shape, (2**16,))
+    # The tfidf matrix only stores the buckets of the trained tokens.
+    self.assertLessEqual(model._termBuckets.size, 9)
+    self.assertSequenceEqual(results[0], results[1])
+
+    with self.assertRaises(ValueError):
+      ClassificationModelTraditional(hashBits=24)
+
+
   def testModelSaveAndLoad(self):
     # Keywords model uses the base class implementations of save/load methods.
     self.modelDir = "poke_model"
@@ -230,7 +657,7 @@ class ClassificationModelTest(unittest.TestCase):
     for i in xrange(len(samples)):
       model.trainModel(i)
 
-    self.assertSequenceEqual([0, 0, 0, 1, 2, 2, 2, 3, 4, 4, 4],
+    self.assertSequenceEqual([0, 1, 2, 3, 4],
         model.sampleReference, "List of indices for samples trained on does "
         "not match the expected.")
 
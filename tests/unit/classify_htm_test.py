@@ -0,0 +1,590 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""Tests for classify_htm module, with a small fake network."""
+
+import copy
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+import unittest
+
+from collections import deque, OrderedDict
+from fluent.encoders.language_encoder import LanguageEncoder
+from fluent.encoders.token_table_encoder import TokenTableEncoder
+from fluent.experiments.htm_runner import HTMRunner, Partition
+from fluent.models import classify_htm
+from fluent.models.classify_htm import ClassificationModelHTM
+from fluent.models.htm_replica_pool import HTMReplicaPool
+from fluent.utils.memory_record_stream import MemoryRecordStream
+from fluent.utils.network_data_generator import NetworkDataGenerator
+
+
+
+NETWORK_CONFIG = {
+  "sensorRegionConfig": {"regionName": "sensor"},
+  "spRegionConfig": {"regionName": "SP"},
+  "tmRegionConfig": {"regionName": "TM"},
+  "upRegionConfig": {"regionName": "UP"},
+  "classifierRegionConfig": {"regionName": "classifier"}
+}
+
+NUM_CATEGORIES = 3
+
+# Tokens and category of each sequence of the data.
+SEQUENCES = [(["the", "kitchen", "smells"], 0),
+             (["fix", "the", "wifi"], 1),
+             (["more", "snacks"], 2)]
+
+NUM_TOKENS = sum(len(tokens) for tokens, _ in SEQUENCES)
+
+
+
+class FakeCioEncoder(LanguageEncoder):
+  """Stands in for the CioEncoder; encodes a token as its characters' bits."""
+
+  def __init__(self, **kwargs):
+    super(FakeCioEncoder, self).__init__(n=100, w=5)
+
+
+  def encodeIntoArray(self, token, output):
+    return {"fingerprint": {"positions": sorted(set(ord(c) % 100
+                                                    for c in token))}}
+
+
+  def getWidth(self):
+    return self.n
+
+
+
+class FakeSensor(object):
+  """Reads the queue first in, first out, and then the data source."""
+
+  def __init__(self, dataSource, encoder):
+    self.dataSource = dataSource
+    self.encoder = encoder
+    self.queue = deque()
+
+
+  def getNextRecord(self):
+    if self.queue:
+      return self.queue.pop()
+    return self.dataSource.getNextRecordDict()
+
+
+  def __getstate__(self):
+    # As in the network API, the encoder and data source aren't serialized.
+    return dict(self.__dict__, dataSource=None, encoder=None)
+
+
+
+class RestorableMixin(object):
+  """Gets and sets its state, as the network API's learning regions do."""
+
+  def __getstate__(self):
+    return dict(self.__dict__)
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+
+
+
+class FakePooler(RestorableMixin):
+  """Learns the tokens it's shown."""
+
+  def __init__(self):
+    self.learned = []
+
+
+  def compute(self, record, learn, infer):
+    if learn:
+      self.learned.append(record["_token"])
+
+
+
+class FakeSequenceMemory(FakePooler):
+  """Also holds the tokens of the current sequence."""
+
+  def __init__(self):
+    super(FakeSequenceMemory, self).__init__()
+    self.sequence = []
+
+
+  def compute(self, record, learn, infer):
+    super(FakeSequenceMemory, self).compute(record, learn, infer)
+    self.sequence.append(record["_token"])
+
+
+  def resetSequenceStates(self):
+    self.sequence = []
+
+
+
+class FakeClassifier(object):
+  """
+  Counts the categories of each token, and infers them. It has no
+  __getstate__ or __setstate__, so its state can't be restored in place.
+  """
+
+  def __init__(self):
+    self.tokenCounts = {}
+    self.categoriesOut = [0.0] * NUM_CATEGORIES
+
+
+  def compute(self, record, learn, infer):
+    counts = self.tokenCounts.setdefault(record["_token"],
+                                         [0.0] * NUM_CATEGORIES)
+    if learn:
+      for category in record["_category"]:
+        if category >= 0:
+          counts[category] += 1
+    self.categoriesOut = list(counts) if infer else [0.0] * NUM_CATEGORIES
+
+
+
+class FakeKNNClassifier(RestorableMixin, FakeClassifier):
+  """A classifier whose state can be restored in place."""
+
+
+
+class FakeRegion(object):
+  """A region of the network API, wrapping its Python implementation."""
+
+  def __init__(self, name, impl, regionType="py.FakeRegion", parameters=None):
+    self.name = name
+    self.type = regionType
+    self.parameters = dict(parameters or {})
+    self._impl = impl
+
+
+  def getSelf(self):
+    return self._impl
+
+
+  def getParameter(self, name):
+    if name not in self.parameters:
+      raise Exception("Unknown parameter: {}".format(name))
+    return self.parameters[name]
+
+
+  def setParameter(self, name, value):
+    self.getParameter(name)
+    self.parameters[name] = value
+
+
+  def executeCommand(self, args):
+    return getattr(self._impl, args[0])(*args[1:])
+
+
+  def getOutputData(self, name):
+    return getattr(self._impl, name)
+
+
+  def compute(self, record):
+    self._impl.compute(record, self.parameters.get("learningMode", False),
+                       self.parameters.get("inferenceMode", False))
+
+
+
+class FakeNetwork(object):
+  """
+  Runs each record from the sensor through the other regions, in order. The
+  number of records of each run() call is in runs.
+  """
+
+  def __init__(self, path=None):
+    self.regions = OrderedDict()
+    self.runs = []
+    self.initialized = False
+    if path is not None:
+      with open(path, "rb") as f:
+        self.regions = pickle.load(f)
+
+
+  def addRegion(self, region):
+    self.regions[region.name] = region
+
+
+  def initialize(self):
+    self.initialized = True
+
+
+  def run(self, iterations):
+    self.runs.append(iterations)
+    regions = self.regions.values()
+    for _ in xrange(iterations):
+      record = regions[0].getSelf().getNextRecord()
+      for region in regions[1:]:
+        region.compute(record)
+
+
+  def save(self, path):
+    with open(path, "wb") as f:
+      pickle.dump(self.regions, f, pickle.HIGHEST_PROTOCOL)
+
+
+
+def configureFakeNetwork(recordStream, networkConfig, encoder,
+                         classifierClass=FakeKNNClassifier):
+  """Stands in for configureNetwork(), with fake regions of the config."""
+  def regionName(configName):
+    return networkConfig[configName]["regionName"]
+
+  network = FakeNetwork()
+  network.addRegion(FakeRegion(regionName("sensorRegionConfig"),
+                               FakeSensor(recordStream, encoder),
+                               regionType="py.LanguageSensor"))
+  network.addRegion(FakeRegion(regionName("spRegionConfig"), FakePooler(),
+                               parameters={"learningMode": True}))
+  network.addRegion(FakeRegion(regionName("tmRegionConfig"),
+                               FakeSequenceMemory(),
+                               parameters={"learningMode": True}))
+  network.addRegion(FakeRegion(regionName("upRegionConfig"),
+                               FakeSequenceMemory(),
+                               parameters={"learningMode": True}))
+  network.addRegion(FakeRegion(regionName("classifierRegionConfig"),
+                               classifierClass(),
+                               regionType="py.KNNClassifierRegion",
+                               parameters={"learningMode": True,
+                                           "inferenceMode": False,
+                                           "categoryCount": NUM_CATEGORIES}))
+  return network
+
+
+
+class ClosingRecordStream(MemoryRecordStream):
+  """Records whether the stream was closed."""
+
+  closed = False
+
+
+  def close(self):
+    self.closed = True
+
+
+
+def createRecordStream(streamClass=MemoryRecordStream):
+  """Return a stream of the records of SEQUENCES."""
+  tokens, categories, sequenceIds, resets = [], [], [], []
+  for sequenceId, (sequence, category) in enumerate(SEQUENCES):
+    tokens.extend(sequence)
+    categories.extend([[category]] * len(sequence))
+    sequenceIds.extend([sequenceId] * len(sequence))
+    resets.extend([1] + [0] * (len(sequence) - 1))
+
+  return streamClass(tokens, categories, sequenceIds, resets)
+
+
+
+def getRegionStates(model):
+  """Return a copy of the state of each of the model's learning regions."""
+  return {region.name: copy.deepcopy(region.getSelf().__dict__)
+          for region in model.learningRegions}
+
+
+
+class FakeNetworkTestCase(unittest.TestCase):
+  """Base for tests of HTM models, with fakes in place of the network API."""
+
+  def setUp(self):
+    self.modelDir = tempfile.mkdtemp()
+    self._patched = {"configureNetwork": classify_htm.configureNetwork,
+                     "Network": classify_htm.Network,
+                     "CioEncoder": classify_htm.CioEncoder}
+    classify_htm.configureNetwork = configureFakeNetwork
+    classify_htm.Network = FakeNetwork
+    classify_htm.CioEncoder = FakeCioEncoder
+
+
+  def tearDown(self):
+    for name, value in self._patched.iteritems():
+      setattr(classify_htm, name, value)
+    shutil.rmtree(self.modelDir)
+
+
+  def _createModel(self, dataSource=None, tokenTable=False,
+                   networkConfig=NETWORK_CONFIG):
+    return ClassificationModelHTM(networkConfig,
+                                  dataSource or createRecordStream(),
+                                  verbosity=0,
+                                  modelDir=self.modelDir,
+                                  prepData=False,
+                                  tokenTable=tokenTable)
+
+
+
+class ClassificationModelHTMTest(FakeNetworkTestCase):
+  """Test the HTM model with a fake network."""
+
+  def testResetRestoresSnapshot(self):
+    """A reset model matches a new one, without rebuilding the network."""
+    model = self._createModel()
+    network = model.network
+    pristine = getRegionStates(model)
+
+    model.trainModel(iterations=NUM_TOKENS)
+    self.assertNotEqual(getRegionStates(model), pristine)
+
+    model.resetModel()
+    self.assertIs(model.network, network)
+    self.assertEqual(getRegionStates(model), pristine)
+    sensor = model.sensorRegion.getSelf()
+    self.assertEqual(sensor.dataSource.getNextRecordIdx(), 0)
+
+    # Trained again, it learns as a new model does.
+    newModel = self._createModel()
+    for m in (model, newModel):
+      m.trainModel(iterations=NUM_TOKENS)
+    self.assertEqual(getRegionStates(model), getRegionStates(newModel))
+
+
+  def testResetWithNewData(self):
+    """Resetting with new data closes the old data source."""
+    oldData = createRecordStream(ClosingRecordStream)
+    model = self._createModel(oldData)
+    model.trainModel(iterations=3)
+
+    model.resetModel(oldData)
+    self.assertFalse(oldData.closed)
+
+    newData = createRecordStream(ClosingRecordStream)
+    model.resetModel(newData)
+    self.assertTrue(oldData.closed)
+    self.assertFalse(newData.closed)
+    self.assertIs(model.sensorRegion.getSelf().dataSource, newData)
+    self.assertIs(model.networkDataPath, newData)
+
+
+  def testResetRebuildsUnrestorableNetwork(self):
+    """
+    If a region's state can't be restored in place, a reset model has a new
+    network, which matches a new model's.
+    """
+    classify_htm.configureNetwork = (
+      lambda *args: configureFakeNetwork(*args,
+                                         classifierClass=FakeClassifier))
+    oldData = createRecordStream(ClosingRecordStream)
+    model = self._createModel(oldData)
+    self.assertIsNone(model._snapshot["classifier"])
+    network = model.network
+    pristine = getRegionStates(model)
+    model.trainModel(iterations=NUM_TOKENS)
+
+    model.resetModel()
+    self.assertIsNot(model.network, network)
+    self.assertTrue(model.network.initialized)
+    self.assertEqual(getRegionStates(model), pristine)
+    self.assertFalse(oldData.closed)
+
+    newData = createRecordStream(ClosingRecordStream)
+    model.resetModel(newData)
+    self.assertTrue(oldData.closed)
+    self.assertIs(model.sensorRegion.getSelf().dataSource, newData)
+
+    # Trained again, it learns as a new model does.
+    newModel = self._createModel()
+    for m in (model, newModel):
+      m.trainModel(iterations=NUM_TOKENS)
+    self.assertEqual(getRegionStates(model), getRegionStates(newModel))
+
+
+  def testSaveAndLazyLoad(self):
+    """A loaded model deserializes its network and snapshot on first use."""
+    model = self._createModel(tokenTable=True)
+    pristine = getRegionStates(model)
+    model.trainModel(iterations=NUM_TOKENS)
+    model.saveModel()
+    for name in ("network.nta", "snapshot.pkl", "model.json",
+                 "token_table.pkl"):
+      self.assertTrue(os.path.exists(os.path.join(self.modelDir, name)))
+
+    loaded = ClassificationModelHTM.load(self.modelDir, verbosity=0)
+    self.assertIsNone(loaded._network)
+    self.assertIsNone(loaded._snapshot)
+    self.assertSequenceEqual(loaded.loadTimes.keys(), ["model"])
+
+    self.assertEqual(getRegionStates(loaded), getRegionStates(model))
+    self.assertIn("network", loaded.loadTimes)
+    self.assertIsNone(loaded._snapshot)
+    sensor = loaded.sensorRegion.getSelf()
+    self.assertIsInstance(sensor.encoder, TokenTableEncoder)
+    self.assertIsInstance(sensor.encoder.encoder, FakeCioEncoder)
+    # The network data was in memory, so it wasn't saved.
+    self.assertEqual(len(sensor.dataSource), 0)
+
+    loaded.resetModel(createRecordStream())
+    self.assertIn("snapshot", loaded.loadTimes)
+    self.assertEqual(getRegionStates(loaded), pristine)
+
+    # Trained again, it learns as the saved model did.
+    loaded.trainModel(iterations=NUM_TOKENS)
+    self.assertEqual(getRegionStates(loaded), getRegionStates(model))
+
+
+  def testTestSequence(self):
+    """The outputs of a sequence are those of each token, or the last one."""
+    model = self._createModel()
+    model.trainModel(iterations=NUM_TOKENS)
+    network = model.network
+    dataSource = model.sensorRegion.getSelf().dataSource
+
+    dataSource.rewind()
+    outputs = model.testSequence(3)
+    # "the" is in the sequences of categories 0 and 1.
+    self.assertSequenceEqual(outputs.tolist(),
+                             [[1, 1, 0], [1, 0, 0], [1, 0, 0]])
+    self.assertSequenceEqual(network.runs[-3:], [1, 1, 1])
+
+    dataSource.rewind()
+    lastOutputs = model.testSequence(3, collectAll=False)
+    self.assertSequenceEqual(lastOutputs.tolist(), outputs[-1:].tolist())
+    self.assertEqual(network.runs[-1], 3)
+
+    # Testing doesn't learn.
+    self.assertEqual(len(model.network.regions["SP"].getSelf().learned),
+                     NUM_TOKENS)
+
+
+  def testResetSequenceStates(self):
+    """Each region with sequence state is reset, keeping what it learned."""
+    model = self._createModel()
+    model.trainModel(iterations=4)
+    sensor = model.sensorRegion.getSelf()
+    sensor.queue.append({"_token": "wifi", "_category": [-1]})
+
+    model.resetSequenceStates()
+    self.assertEqual(len(sensor.queue), 0)
+    for name in ("TM", "UP"):
+      region = model.network.regions[name].getSelf()
+      self.assertSequenceEqual(region.sequence, [])
+      self.assertEqual(len(region.learned), 4)
+
+
+  def testSetPhase(self):
+    """Each phase sets the expected regions to learn."""
+    model = self._createModel()
+    self.assertSequenceEqual(
+      model.getTrainingPhases(),
+      ["train-sp", "train-tm", "train-up", "train-classifier"])
+
+    phaseLearners = {"train": set(["SP", "TM", "UP", "classifier"]),
+                     "train-sp": set(["SP"]),
+                     "train-tm": set(["SP", "TM"]),
+                     "train-up": set(["SP", "TM", "UP"]),
+                     "train-classifier": set(["SP", "TM", "UP", "classifier"]),
+                     "infer": set()}
+    for phase, learners in phaseLearners.iteritems():
+      model.setPhase(phase)
+      self.assertEqual(set(region.name for region in model.learningRegions
+                           if region.getParameter("learningMode")),
+                       learners, phase)
+      self.assertEqual(model.classifierRegion.getParameter("inferenceMode"),
+                       phase == "infer")
+
+    with self.assertRaises(ValueError):
+      model.setPhase("train-lsa")
+
+    # Training keeps the staged phase.
+    model.setPhase("train-tm")
+    model.trainModel(iterations=2)
+    regions = model.network.regions
+    self.assertEqual(len(regions["TM"].getSelf().learned), 2)
+    self.assertEqual(len(regions["UP"].getSelf().learned), 0)
+
+
+
+class HTMRunnerTest(FakeNetworkTestCase):
+  """Test the staged training of the HTM runner, with a fake network."""
+
+  def _createRunner(self, model):
+    runner = HTMRunner.__new__(HTMRunner)
+    runner.model = model
+    runner.verbosity = 0
+    runner.stagedLearning = True
+    runner.partitions = [([len(tokens) for tokens, _ in SEQUENCES], [])]
+    return runner
+
+
+  def testPartitionLearning(self):
+    """The training sequences are spread evenly over the phases."""
+    model = self._createModel()
+    runner = self._createRunner(model)
+    self.assertSequenceEqual(runner.partitionLearning(0),
+                             [Partition("train-sp", 0),
+                              Partition("train-tm", 0),
+                              Partition("train-up", 1),
+                              Partition("train-classifier", 2)])
+
+    runner._training(0)
+    regions = model.network.regions
+    self.assertEqual(len(regions["SP"].getSelf().learned), NUM_TOKENS)
+    self.assertEqual(len(regions["TM"].getSelf().learned), NUM_TOKENS)
+    self.assertEqual(len(regions["UP"].getSelf().learned),
+                     len(SEQUENCES[1][0]) + len(SEQUENCES[2][0]))
+
+
+  def testPartitionLearningWithoutPhases(self):
+    """Without training phases, all of the regions train on every sequence."""
+    networkConfig = {name: dict(config, regionEnabled=False)
+                     for name, config in NETWORK_CONFIG.iteritems()}
+    model = self._createModel(networkConfig=networkConfig)
+    runner = self._createRunner(model)
+    self.assertSequenceEqual(runner.partitionLearning(0),
+                             [Partition("train", 0)])
+
+    runner._training(0)
+    for name in ("SP", "TM", "UP"):
+      self.assertEqual(len(model.network.regions[name].getSelf().learned),
+                       NUM_TOKENS)
+
+
+
+
+class HTMReplicaPoolTest(FakeNetworkTestCase):
+  """Test the pool of HTM replicas, with a fake network."""
+
+  def testQueriesMatchModel(self):
+    """Each replica answers queries as the trained model does."""
+    model = self._createModel()
+    model.networkDataGen = NetworkDataGenerator()
+    model.trainModel(iterations=NUM_TOKENS)
+
+    pool = HTMReplicaPool.fromModel(model, numReplicas=2)
+    try:
+      queries = ["fix the wifi", "kitchen smells", "fix the wifi", "snacks"]
+      results = pool.queryModelBatch(queries)
+      results.append(pool.queryModel("kitchen smells"))
+    finally:
+      pool.close()
+
+    # Ties are broken randomly, so compare the distances.
+    for query, result in zip(queries + ["kitchen smells"], results):
+      expected = model.queryModel(query)
+      self.assertSequenceEqual(sorted(d for _, d in result),
+                               sorted(d for _, d in expected), query)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
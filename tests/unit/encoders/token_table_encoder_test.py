@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""Tests for token_table_encoder module."""
+
+import cPickle as pickle
+import numpy
+import unittest
+
+from fluent.encoders.language_encoder import LanguageEncoder
+from fluent.encoders.token_table_encoder import TokenTableEncoder
+
+
+
+class CountingEncoder(LanguageEncoder):
+  """Encodes a token as the bits of its characters, counting the calls."""
+
+  def __init__(self):
+    super(CountingEncoder, self).__init__(n=100, w=5)
+    self.calls = 0
+
+
+  def encodeIntoArray(self, token, output):
+    self.calls += 1
+    return {"fingerprint": {"positions": sorted(set(ord(c) % 100
+                                                    for c in token))}}
+
+
+  def getWidth(self):
+    return self.n
+
+
+
+class TokenTableEncoderTest(unittest.TestCase):
+
+
+  def testEncodesEachTokenOnce(self):
+    counting = CountingEncoder()
+    encoder = TokenTableEncoder(counting, ["ab", "cd", "ab"])
+    self.assertEqual(counting.calls, 2)
+
+    output = numpy.ones(100)
+    for _ in xrange(3):
+      encoding = encoder.encodeIntoArray("ab", output)
+    self.assertEqual(counting.calls, 2)
+    self.assertSequenceEqual(numpy.flatnonzero(output).tolist(), [97, 98])
+    self.assertSequenceEqual(encoding["fingerprint"]["positions"].tolist(),
+                             [97, 98])
+
+    encoder.encodeIntoArray("ef", output)
+    self.assertEqual(counting.calls, 3)
+    self.assertSequenceEqual(numpy.flatnonzero(output).tolist(), [1, 2])
+
+
+  def testEncodeById(self):
+    encoder = TokenTableEncoder(CountingEncoder(), ["ab", "cd"])
+    tokenId = encoder.getTokenId("cd")
+    self.assertEqual(encoder.encode(tokenId)["text"], "cd")
+    self.assertSequenceEqual(
+      encoder.encode(tokenId)["fingerprint"]["positions"].tolist(), [0, 99])
+
+
+  def testPickleDropsEncoder(self):
+    encoder = TokenTableEncoder(CountingEncoder(), ["ab"])
+    loaded = pickle.loads(pickle.dumps(encoder, pickle.HIGHEST_PROTOCOL))
+    self.assertIsNone(loaded.encoder)
+    self.assertSequenceEqual(
+      loaded.encode("ab")["fingerprint"]["positions"].tolist(), [97, 98])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""Tests for bitmap_store module."""
+
+import cPickle as pickle
+import numpy
+import unittest
+
+from fluent.utils.bitmap_store import BitmapStore, compactBitmap, positionDtype
+
+
+
+class BitmapStoreTest(unittest.TestCase):
+
+
+  def testPositionDtype(self):
+    self.assertEqual(positionDtype(100), numpy.uint16)
+    self.assertEqual(positionDtype(16384), numpy.uint16)
+    self.assertEqual(positionDtype(2**16), numpy.uint16)
+    self.assertEqual(positionDtype(2**16 + 1), numpy.uint32)
+
+
+  def testCompactBitmap(self):
+    bitmap = compactBitmap([0, 5, 16383], 16384)
+    self.assertEqual(bitmap.dtype, numpy.uint16)
+    self.assertSequenceEqual(bitmap.tolist(), [0, 5, 16383])
+
+    with self.assertRaises(ValueError):
+      compactBitmap([3, 16384], 16384)
+
+
+  def testAppendAndGather(self):
+    store = BitmapStore(16384)
+    bitmaps = [[1, 2, 3], [], [16383], range(0, 16384, 50)]
+    for i, bitmap in enumerate(bitmaps):
+      self.assertEqual(store.append(bitmap), i)
+
+    self.assertEqual(len(store), len(bitmaps))
+    for i, bitmap in enumerate(bitmaps):
+      self.assertSequenceEqual(store[i].tolist(), bitmap)
+    self.assertSequenceEqual(store[-1].tolist(), bitmaps[-1])
+
+    positions, lengths = store.gather([3, 0, 1])
+    self.assertEqual(positions.dtype, numpy.uint16)
+    self.assertSequenceEqual(positions.tolist(), bitmaps[3] + bitmaps[0])
+    self.assertSequenceEqual(lengths.tolist(), [len(bitmaps[3]), 3, 0])
+
+
+  def testPickleDropsCapacity(self):
+    store = BitmapStore(16384)
+    for _ in xrange(5):
+      store.append(range(100))
+
+    loaded = pickle.loads(pickle.dumps(store, pickle.HIGHEST_PROTOCOL))
+    self.assertEqual(loaded._positions.size, 500)
+    self.assertSequenceEqual(loaded[4].tolist(), range(100))
+
+    loaded.append([7])
+    self.assertSequenceEqual(loaded[5].tolist(), [7])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
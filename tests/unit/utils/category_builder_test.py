@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""Tests for category_builder module."""
+
+import numpy
+import unittest
+
+from fluent.utils.category_builder import CategoryBuilder
+
+
+
+class CategoryBuilderTest(unittest.TestCase):
+
+
+  def testMostFrequentBits(self):
+    builder = CategoryBuilder(100, 3)
+    builder.addPositive(0, [1, 2, 3, 4])
+    builder.addPositive(0, [3, 4, 5])
+    builder.addPositive(0, [4, 5, 6])
+
+    # Bit 4 is in every positive, 3 and 5 in two; ties go to the lower bit.
+    category = builder.getCategory(0)
+    self.assertEqual(category.dtype, numpy.uint16)
+    self.assertSequenceEqual(category.tolist(), [3, 4, 5])
+
+
+  def testNegativesSuppressBits(self):
+    builder = CategoryBuilder(100, 3)
+    builder.addPositive(0, [1, 2, 3])
+    builder.addPositive(0, [1, 2, 3])
+    builder.addNegative(0, [2, 50])
+
+    self.assertSequenceEqual(builder.getCategory(0).tolist(), [1, 2, 3])
+
+    builder.addNegative(0, [2])
+    self.assertSequenceEqual(builder.getCategory(0).tolist(), [1, 3])
+
+
+  def testNoPositiveBits(self):
+    builder = CategoryBuilder(100, 3)
+    builder.addPositive(0, [1, 2])
+    builder.addNegative(0, [1, 2])
+
+    category = builder.getCategory(0)
+    self.assertEqual(category.dtype, numpy.uint16)
+    self.assertEqual(category.size, 0)
+
+
+  def testCategoriesAreIndependent(self):
+    builder = CategoryBuilder(100, 2)
+    builder.addPositive(0, [1, 2])
+    builder.addPositive(1, [7, 8])
+
+    self.assertIn(1, builder)
+    self.assertSequenceEqual(builder.getCategory(0).tolist(), [1, 2])
+    self.assertSequenceEqual(builder.getCategory(1).tolist(), [7, 8])
+
+    builder.clear()
+    self.assertNotIn(0, builder)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
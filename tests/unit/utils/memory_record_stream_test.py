@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""Tests for memory_record_stream module."""
+
+import unittest
+
+from fluent.utils.memory_record_stream import MemoryRecordStream
+from fluent.utils.network_data_generator import NetworkDataGenerator
+
+
+
+class MemoryRecordStreamTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.records = [
+      NetworkDataGenerator._formatSequence(["get", "rid", "of"], "0 1", 0, "1"),
+      NetworkDataGenerator._formatSequence(["i", "care"], "2", 1, "2")]
+
+
+  def testRecordDicts(self):
+    stream = MemoryRecordStream.fromRecords(self.records)
+    self.assertEqual(len(stream), 5)
+
+    records = []
+    record = stream.getNextRecordDict()
+    while record is not None:
+      records.append(record)
+      record = stream.getNextRecordDict()
+
+    self.assertEqual([r["_token"] for r in records],
+                     ["get", "rid", "of", "i", "care"])
+    self.assertEqual([r["_reset"] for r in records], [1, 0, 0, 1, 0])
+    self.assertDictEqual(records[3], {"_token": "i",
+                                      "_category": [2],
+                                      "_sequenceId": 1,
+                                      "_reset": 1,
+                                      "ID": "2"})
+
+    stream.rewind()
+    self.assertEqual(stream.getNextRecordDict()["_category"], [0, 1])
+
+
+  def testColumns(self):
+    stream = MemoryRecordStream(["a", "b", "c"], [[3], [3], 4], [0, 0, 1],
+                                [1, 0, 1])
+    self.assertEqual(stream.getNextRecord(), ["a", [3], 0, 1, ""])
+
+    with self.assertRaises(ValueError):
+      MemoryRecordStream(["a"], [], [0], [1])
+
+
+  def testSequenceSummaries(self):
+    stream = MemoryRecordStream.fromRecords(self.records)
+    self.assertEqual(stream.getNumberOfTokens(), [3, 2])
+    self.assertEqual(stream.getClassifications(), ["0 1", "2"])
+
+    samples = stream.getSamples()
+    self.assertEqual(samples.keys(), ["1", "2"])
+    self.assertEqual(samples["1"], (["get rid of"], [0, 1]))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""Tests for minhash_index module."""
+
+import cPickle as pickle
+import numpy
+import unittest
+
+from fluent.utils.bitmap_store import BitmapStore
+from fluent.utils.minhash_index import MinHashLSHIndex
+
+
+
+class MinHashLSHIndexTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.rng = numpy.random.RandomState(42)
+    self.n = 1024
+    self.w = 40
+    self.protos = [numpy.sort(self.rng.choice(self.n, self.w, replace=False))
+                   for _ in xrange(200)]
+    self.index = MinHashLSHIndex(self.n, bands=16, rows=2)
+    for proto in self.protos:
+      self.index.add(proto)
+
+
+  def testIdenticalPrototypeIsCandidate(self):
+    for i, proto in enumerate(self.protos[:20]):
+      self.assertIn(i, self.index.candidates(proto))
+
+
+  def testOverlapsAreExact(self):
+    query = numpy.union1d(self.protos[3][:30], self.rng.choice(self.n, 10))
+    ids = numpy.arange(len(self.protos))
+    expected = [numpy.intersect1d(p, query).size for p in self.protos]
+
+    self.assertSequenceEqual(self.index.overlaps(query, ids).tolist(), expected)
+
+
+  def testTopK(self):
+    self.index.add(self.protos[7][:-1])
+
+    ids, overlaps = self.index.topK(self.protos[7], 2)
+    self.assertSequenceEqual(ids.tolist(), [7, 200])
+    self.assertSequenceEqual(overlaps.tolist(), [self.w, self.w-1])
+
+
+  def testAddBatchMatchesAdd(self):
+    index = MinHashLSHIndex(self.n, bands=16, rows=2)
+    index.addBatch(self.protos[:100])
+    index.addBatch(self.protos[100:] + [[]])
+
+    for proto in self.protos[:20]:
+      self.assertSequenceEqual(index.candidates(proto).tolist(),
+                               self.index.candidates(proto).tolist())
+
+
+  def testIncrementalAddMatchesBatch(self):
+    """Keys added between queries are merged into the sorted tables."""
+    index = MinHashLSHIndex(self.n, bands=16, rows=2)
+    for first in xrange(0, len(self.protos), 30):
+      index.addBatch(self.protos[first:first+30])
+      index.candidates(self.protos[0])
+    # Add duplicates, which tie with the existing keys.
+    index.addBatch(self.protos[:10])
+
+    batchIndex = MinHashLSHIndex(self.n, bands=16, rows=2)
+    batchIndex.addBatch(self.protos + self.protos[:10])
+    for proto in self.protos[:20]:
+      self.assertSequenceEqual(index.candidates(proto).tolist(),
+                               batchIndex.candidates(proto).tolist())
+    self.assertTrue((index._sortedKeys == batchIndex._sortedKeys).all())
+    self.assertTrue((index._order == batchIndex._order).all())
+
+
+  def testSharedBitmapStore(self):
+    """A store of the caller's is referenced rather than copied."""
+    bitmaps = BitmapStore(self.n)
+    index = MinHashLSHIndex(self.n, bands=16, rows=2, bitmaps=bitmaps)
+    for proto in self.protos:
+      bitmaps.append(proto)
+      index.add(proto)
+
+    self.assertIs(index._bitmaps, bitmaps)
+    self.assertEqual(len(bitmaps), len(self.protos))
+    query = numpy.union1d(self.protos[3][:30], self.rng.choice(self.n, 10))
+    ids = numpy.arange(len(self.protos))
+    self.assertSequenceEqual(index.overlaps(query, ids).tolist(),
+                             self.index.overlaps(query, ids).tolist())
+    for proto in self.protos[:20]:
+      self.assertSequenceEqual(index.topK(proto, 3)[0].tolist(),
+                               self.index.topK(proto, 3)[0].tolist())
+
+    # The caller clears its store.
+    index.clear()
+    self.assertEqual(len(bitmaps), len(self.protos))
+
+
+  def testPickle(self):
+    index = pickle.loads(pickle.dumps(self.index))
+
+    for proto in self.protos[:5]:
+      self.assertSequenceEqual(index.candidates(proto).tolist(),
+                               self.index.candidates(proto).tolist())
+
+
+  def testClear(self):
+    self.index.clear()
+
+    self.assertEqual(len(self.index), 0)
+    self.assertEqual(self.index.candidates(self.protos[0]).size, 0)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
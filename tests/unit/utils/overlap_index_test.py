@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2015, Numenta, Inc.  Unless you have purchased from
+# Numenta, Inc. a separate commercial license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""Tests for overlap_index module."""
+
+import numpy
+import unittest
+
+from fluent.utils.overlap_index import OverlapIndex
+
+
+
+class OverlapIndexTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.rng = numpy.random.RandomState(42)
+    self.n = 1024
+    self.w = 40
+    self.protos = [numpy.sort(self.rng.choice(self.n, self.w, replace=False))
+                   for _ in xrange(200)]
+
+
+  def bruteForceOverlaps(self, bitmap):
+    return numpy.array([numpy.intersect1d(p, bitmap).size
+                        for p in self.protos])
+
+
+  def testOverlapsMatchBruteForce(self):
+    index = OverlapIndex(self.n)
+    # Interleave adds and queries to exercise the posting list merges.
+    for i, proto in enumerate(self.protos):
+      self.assertEqual(i, index.add(proto))
+      if i % 50 == 0:
+        index.overlaps(proto)
+
+    for proto in self.protos[:20]:
+      query = numpy.union1d(proto[:20], self.rng.choice(self.n, 20))
+      self.assertSequenceEqual(
+        index.overlaps(query).tolist(), self.bruteForceOverlaps(query).tolist())
+
+
+  def testAddBatchMatchesAdd(self):
+    index = OverlapIndex(self.n)
+    index.add(self.protos[0])
+    # Unsorted bitmaps with repeated bits, and an empty bitmap.
+    batch = [numpy.concatenate((p[::-1], p[:5])) for p in self.protos[1:]]
+    ids = index.addBatch(batch + [[]])
+    self.assertSequenceEqual(ids.tolist(), range(1, len(self.protos) + 1))
+
+    query = numpy.union1d(self.protos[9][:20], self.rng.choice(self.n, 20))
+    self.assertSequenceEqual(index.overlaps(query).tolist(),
+                             self.bruteForceOverlaps(query).tolist() + [0])
+
+
+  def testTopKMatchesBruteForce(self):
+    index = OverlapIndex(self.n)
+    for proto in self.protos:
+      index.add(proto)
+
+    for proto in self.protos[:20]:
+      query = numpy.union1d(proto[:30], self.rng.choice(self.n, 10))
+      expected = self.bruteForceOverlaps(query)
+      expectedIds = numpy.lexsort((numpy.arange(expected.size), -expected))[:5]
+
+      ids, overlaps = index.topK(query, 5)
+      self.assertSequenceEqual(ids.tolist(), expectedIds.tolist())
+      self.assertSequenceEqual(overlaps.tolist(), expected[expectedIds].tolist())
+
+
+  def testTopKWithNearDuplicates(self):
+    """Near-duplicate prototypes let the search terminate early."""
+    index = OverlapIndex(self.n)
+    for proto in self.protos:
+      index.add(proto)
+    index.add(self.protos[7][:-1])
+    index.add(self.protos[7][1:-1])
+
+    ids, overlaps = index.topK(self.protos[7], 3)
+    self.assertSequenceEqual(ids.tolist(), [7, 200, 201])
+    self.assertSequenceEqual(overlaps.tolist(), [self.w, self.w-1, self.w-2])
+
+
+  def testTopKPadsWithNonOverlappingPrototypes(self):
+    index = OverlapIndex(10)
+    index.add([0, 1])
+    index.add([2, 3])
+    index.add([1, 4])
+
+    ids, overlaps = index.topK([4], 2)
+    self.assertSequenceEqual(ids.tolist(), [2, 0])
+    self.assertSequenceEqual(overlaps.tolist(), [1, 0])
+
+    ids, _ = index.topK([4], 10)
+    self.assertEqual(ids.size, 3)
+
+
+  def testContaining(self):
+    index = OverlapIndex(10)
+    index.add([0, 1, 2])
+    index.add([1, 2])
+    index.add([1, 2, 3])
+    index.add([4])
+
+    self.assertSequenceEqual(index.containing([1, 2]).tolist(), [0, 1, 2])
+    self.assertSequenceEqual(index.containing([0, 2]).tolist(), [0])
+    self.assertSequenceEqual(index.containing([0, 4]).tolist(), [])
+
+
+  def testAddOutOfRange(self):
+    index = OverlapIndex(10)
+    with self.assertRaises(ValueError):
+      index.add([3, 10])
+    with self.assertRaises(ValueError):
+      index.addBatch([[1, 2], [-1]])
+
+
+  def testClear(self):
+    index = OverlapIndex(self.n)
+    for proto in self.protos:
+      index.add(proto)
+    index.clear()
+
+    self.assertEqual(len(index), 0)
+    self.assertEqual(index.overlaps(self.protos[0]).size, 0)
+
+
+
+if __name__ == "__main__":
+  unittest.main()